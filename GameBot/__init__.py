@@ -7,15 +7,32 @@ except ImportError:
     pass
 
 from GameBot.bot import GameBot
+from GameBot.registry import GameRegistry
 
-from GameBot.avalon import Avalon
-from GameBot.liars_dice import LiarsDice
-from GameBot.secret_hitler import SecretHitler
-from GameBot.snarkback import Snarkback
-from GameBot.codenames import Codenames
+# Each game is only imported once someone plays it (or a saved game needs it)
+games = GameRegistry()
+games.add('av', 'Avalon', 'GameBot.avalon:Avalon')
+games.add('ld', 'Liar\'s Dice', 'GameBot.liars_dice:LiarsDice')
+games.add('sh', 'Secret Hitler', 'GameBot.secret_hitler:SecretHitler')
+games.add('sb', 'Snarkback', 'GameBot.snarkback:Snarkback')
+games.add('cn', 'Codenames', 'GameBot.codenames:Codenames')
+games.add_entry_points()
+
+
+def __getattr__(name):
+    # The game classes can still be imported from here, e.g. "from GameBot import Avalon"
+    for plugin in games.plugins.values():
+        if plugin.target.endswith(':' + name):
+            return plugin.load()
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
-games = [Avalon, LiarsDice, SecretHitler, Snarkback, Codenames]
 
 if __name__ == '__main__':
-    client = GameBot(games, debug=True)
-    client.run()
+    import os
+    shard_count = int(os.getenv('GAMEBOT_SHARDS') or 1)
+    if shard_count > 1:
+        from GameBot.shards import run_shards
+        run_shards(games, shard_count, debug=True)
+    else:
+        client = GameBot(games, debug=True)
+        client.run()
@@ -4,8 +4,6 @@
 import discord
 import recordclass
 import enum
-import random
-import asyncio
 
 from .game import Game
 
@@ -321,8 +319,8 @@ class Avalon(Game):
         # Make a public announcement
         await self.main_channel.send('The game has now been started!')
         # Set up the game
-        random.seed() # Seed the random number generator
-        random.shuffle(self.players) # Randomize the play order
+        self.random.seed() # Seed the random number generator
+        self.random.shuffle(self.players) # Randomize the play order
         if self.features['lady']:
             self.lady = self.players[-1] # Give the Lady of the Lake to the last player who will get to lead a team
             self.investigated = [self.lady]
@@ -384,7 +382,7 @@ class Avalon(Game):
     async def av_pickrandom(self, message):
         '''Pick a random person to join your team'''
         if (await self.check_running(message)):
-            await self.pick(message, random.choice([p for p in self.players if p not in self.team]).user)
+            await self.pick(message, self.random.choice([p for p in self.players if p not in self.team]).user)
 
 
 
@@ -556,8 +554,7 @@ class Avalon(Game):
                 return
             # Make a public announcement
             await self.main_channel.send('**Assassin:** %s has chosen to assassinate %s.' % (self.assassin.user.mention, player.user.mention))
-            async with self.main_channel.typing():
-                await asyncio.sleep(5) # Pause for dramatic effect
+            await self.dramatic_pause()
             if Role.MERLIN in player.role:
                 await message.channel.send('**The game is over. %s correctly identified Merlin. Evil wins!!**' % self.assassin.user.mention)
                 await self.finish_game()
@@ -660,7 +657,7 @@ Lady of the Lake - a card used to learn the alignment of another player''')
         # merged them.)
         for role in (Role.NOREBO, Role.PALM):
             if role in good:
-                index = random.randrange(len(good))
+                index = self.random.randrange(len(good))
                 to_merge = good[index]
                 if to_merge != role:
                     if isinstance(to_merge, tuple):
@@ -682,15 +679,16 @@ Lady of the Lake - a card used to learn the alignment of another player''')
                     self.features[feature] = False
         # Randomly assign them to players
         roles = [(role, True) for role in good] + [(role, False) for role in evil]
-        random.shuffle(roles)
+        self.random.shuffle(roles)
+        messages = []
         for player, (role, side) in zip(self.players, roles):
             player.role = (role if isinstance(role, tuple) else (role,))
             player.side = side
             names = [ROLE_NAMES[role.value] for role in player.role]
             names = [name for name in names if name not in ('Palm', 'Norebo')] # Palm and Norebo don't know their own identities.
             name = '/'.join(names) or ROLE_NAMES[Role.SERVANT.value] # `names` should only be empty if it's a good guy whose special role is Palm or Norebo
-            await player.user.send('Your role for this game: **%s**\nYour alignment: **%s**' % \
-                                   (name, ('Good' if side == GOOD else 'Evil')))
+            messages.append((player.user, 'Your role for this game: **%s**\nYour alignment: **%s**' % \
+                             (name, ('Good' if side == GOOD else 'Evil'))))
         # Disclose information to players as appropriate
         for player in self.players:
             # Bad guys figure out who each other are (save for Oberon)
@@ -699,22 +697,24 @@ Lady of the Lake - a card used to learn the alignment of another player''')
                 other_minions = [p.user.name for p in self.players if (p != player) and (((p.side == EVIL) and (Role.OBERON not in p.role)) \
                                  or (Role.NOREBO in p.role) or (Role.PALM in p.role))]
                 if other_minions:
-                    await player.user.send('Other Minions of Mordred: %s' % ', '.join(other_minions))
+                    messages.append((player.user, 'Other Minions of Mordred: %s' % ', '.join(other_minions)))
                 else:
-                    await player.user.send('There are no other Minions of Mordred.')
+                    messages.append((player.user, 'There are no other Minions of Mordred.'))
             # Merlin knows who the bad guys are (save for Mordred)
             # If Palm is in play Merlin will think he's bad too.
             elif Role.MERLIN in player.role:
                 minions = [p.user.name for p in self.players if ((Role.MORDRED not in p.role) and (p.side == EVIL)) or (Role.PALM in p.role)]
                 if minions:
-                    await player.user.send('The Minions of Mordred are: %s' % ', '.join(minions))
+                    messages.append((player.user, 'The Minions of Mordred are: %s' % ', '.join(minions)))
                 else:
-                    await player.user.send('There are no Minions of Mordred.')
+                    messages.append((player.user, 'There are no Minions of Mordred.'))
             # Percival knows who Morgana and Merlin are (but not which is which)
             elif Role.PERCIVAL in player.role:
                 merlins = [p.user.name for p in self.players if (Role.MERLIN in p.role) or (Role.MORGANA in p.role)]
-                random.shuffle(merlins)
-                await player.user.send('Merlin and Morgana are %s and %s (in some order)' % tuple(merlins))
+                self.random.shuffle(merlins)
+                messages.append((player.user, 'Merlin and Morgana are %s and %s (in some order)' % tuple(merlins)))
+        # Send out all the secret info at once
+        await self.broadcast(messages)
                 
 
         
@@ -758,7 +758,7 @@ Please cast your votes **privately** by DMing either "av approve" or "av reject"
             self.waiting_for_votes = False
             voting_msg = (await self.main_channel.send('Voting for the team has concluded. Results are:\n%s' % \
                                                        '\n'.join(['%s: %s' % (p.user.name, 'Approve' if p.vote == APPROVE else 'Reject') for p in self.players])))
-            await voting_msg.delete(delay=VOTE_DELAY) # Delete after a certain time
+            self.delete_later(voting_msg, VOTE_DELAY) # Delete after a certain time
             if sum([p.vote for p in self.players]) > len(self.players) // 2:
                 await self.main_channel.send('The team consisting of %s was approved!' % ', '.join([player.user.mention for player in self.team]))
                 self.reject_counter = 1
@@ -785,8 +785,7 @@ Please cast your votes **privately** by DMing either "av approve" or "av reject"
         # Determine whether the quest succeeded
         if self.waiting_for_outcomes:
             self.waiting_for_outcomes = False
-            async with self.main_channel.typing():
-                await asyncio.sleep(5) # Pause for dramatic effect
+            await self.dramatic_pause()
             n_fails = [p.outcome for p in self.team].count(FAIL)
             if n_fails == 1:
                 await self.main_channel.send('There was 1 Fail card played out of %d.' % len(self.team))
@@ -6,8 +6,17 @@ import os
 import re
 import datetime
 import asyncio
+import collections
+import traceback
 
 from GameBot.game import PING_DELAY
+from GameBot.dispatch import DispatchTable
+from GameBot.scheduler import Scheduler
+from GameBot.snapshot import Snapshots
+from GameBot.journal import Journal
+from GameBot.stats import CommandStats
+from GameBot.clock import Clocks
+from GameBot.registry import GameRegistry
 
 ONLINE_NOTIFS = False # Disable these for now because everyone keeps griping about them
 DAD_JOKES = True # Disable these if you value your sanity
@@ -18,33 +27,93 @@ DAD_JOKES = True # Disable these if you value your sanity
 class GameBot(discord.Client):
 
 
-    def __init__(self, game_classes, debug=False):
-        discord.Client.__init__(self)
-        self.games = [cls(self) for cls in game_classes]
+    def __init__(self, game_classes, debug=False, shard_id=None, shard_count=None):
+        discord.Client.__init__(self, shard_id=shard_id, shard_count=shard_count)
+        self.init_state(game_classes, debug)
+
+
+    def init_state(self, game_classes, debug):
+        # Set up everything apart from the connection to Discord
+        self.games = []
+        self.dispatch = DispatchTable() # Index used to figure out which game each message is addressed to
+        self.scheduler = Scheduler() # Shared timers for every game
+        self.snapshots = Snapshots(self) # Saves running games to disk so they survive a restart
+        self.journal = Journal(self) # Records everything that happens in each game
+        self.stats = CommandStats(self) # How long each command takes
+        self.clocks = Clocks(self.scheduler) # What games wait on, for each server
+        self.router = None # ShardRouter connecting us to the other shards, if there are any
+        self.registry = (game_classes if isinstance(game_classes, GameRegistry) else GameRegistry(game_classes))
+        self.unloaded = dict.fromkeys(self.registry.prefixes()) # Map from the prefixes of games that haven't been set up yet to the Task setting them up
         self.main_channels = {}
         self.ping_channels = {}
+        self.channel_names = {} # Map from each guild id to a dict mapping channel names to channels
         self.last_ping = {} # Keep a delay on pings so they don't flood the channel
         self.DEBUG = debug
         self.connected = False
-        self.muted = []
+        self.muted = {} # Map from (channel id, user id) to the set of games that have muted that user in that channel
+        self.muted_users = {} # Map from each game to a dict mapping the ids of the users it has muted to their keys in self.muted
+        self.deleted_messages = collections.Counter() # Number of messages deleted from muted users, keyed by (guild id, user id)
+
+
+    def add_game(self, game):
+        # Add a new game instance to the list
+        self.games.append(game)
+        self.dispatch.add(game)
+
+
+    def remove_game(self, game):
+        # Remove a game instance from the list
+        self.games.remove(game)
+        self.dispatch.remove(game)
+
+
+    async def load_game(self, prefix):
+        # Import and set up a game the first time it is needed. Returns the new instance.
+        task = self.unloaded[prefix]
+        if task is None:
+            task = self.unloaded[prefix] = asyncio.ensure_future(self.setup_game(prefix))
+        return (await task)
+
+
+    async def setup_game(self, prefix):
+        try:
+            game = self.registry.load(prefix)(self)
+            await game.setup()
+        except BaseException:
+            self.unloaded[prefix] = None # Try again the next time
+            raise
+        del self.unloaded[prefix]
+        self.add_game(game)
+        return game
 
 
     def init_channels(self):
         # Find the #game-corner and #game-talk channels
         for guild in self.guilds:
-            if guild.id not in self.main_channels:
-                channel = (discord.utils.get(self.get_all_channels(), guild=guild, name='game-corner') or \
-                           discord.utils.get(self.get_all_channels(), guild=guild, name='general') or \
-                           discord.utils.get(self.get_all_channels(), guild=guild))
-                self.main_channels[guild.id] = channel
-            if guild.id not in self.ping_channels:
-                channel = discord.utils.get(self.get_all_channels(), guild=guild, name='game-talk')
-                self.ping_channels[guild.id] = channel
-                self.last_ping[guild.id] = None
+            self.index_channels(guild)
+
+
+    def index_channels(self, guild):
+        # Rebuild the channel name index for a single guild. This is called at start-up, whenever the
+        # guild becomes available or is updated, and whenever a channel in it is created, renamed or deleted.
+        names = {}
+        for channel in guild.channels:
+            names.setdefault(channel.name, channel)
+        self.channel_names[guild.id] = names
+        self.main_channels[guild.id] = (names.get('game-corner') or names.get('general') or next(iter(guild.channels), None))
+        self.ping_channels[guild.id] = names.get('game-talk')
+        self.last_ping.setdefault(guild.id, None)
+
+
+    def forget_channels(self, guild):
+        # Drop the channel information for a guild we are no longer part of
+        for channels in (self.channel_names, self.main_channels, self.ping_channels, self.last_ping):
+            channels.pop(guild.id, None)
         
 
     async def on_ready(self):
         self.init_channels()
+        self.dispatch.index_members(self.guilds)
         if (not self.connected) or any([game.running for game in self.games]):
             for channel in self.main_channels.values():
                 if channel and ONLINE_NOTIFS:
@@ -60,64 +129,81 @@ class GameBot(discord.Client):
                                     # The only reason we ever post in #game-talk is to ping.
                                     self.last_ping[id] = message.created_at
                                     break
-                await asyncio.gather(*[game.setup() for game in self.games])
+                await self.clocks.load()
+                await self.snapshots.restore()
+                self.snapshots.start()
+                self.stats.start()
+                if self.router:
+                    self.router.start()
                 self.connected = True
 
 
+    async def on_guild_join(self, guild):
+        self.index_channels(guild)
+        self.dispatch.add_guild(guild)
+
+    async def on_guild_remove(self, guild):
+        self.forget_channels(guild)
+        self.dispatch.remove_guild(guild)
+
+    async def on_guild_available(self, guild):
+        # The guild is back after an outage, and its channels and members may have changed in the meantime
+        self.index_channels(guild)
+        self.dispatch.add_guild(guild)
+
+    async def on_guild_update(self, before, after):
+        self.index_channels(after)
+
+    async def on_guild_channel_create(self, channel):
+        self.index_channels(channel.guild)
+
+    async def on_guild_channel_delete(self, channel):
+        self.index_channels(channel.guild)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name:
+            self.index_channels(after.guild)
+
+    async def on_member_join(self, member):
+        self.dispatch.add_member(member)
+
+    async def on_member_remove(self, member):
+        self.dispatch.remove_member(member)
+
+
     async def on_message(self, message):
         # Top-level coroutine to reply to bot commands
         # This bot does not reply to itself
         if message.author == self.user:
             return
-        self.init_channels()
+        # If we are one of several shards, DMs may belong to games on another shard
+        forwarded = getattr(message, 'forwarded', False)
+        if self.router and (message.channel.type == discord.ChannelType.private):
+            if not self.router.forward(message):
+                return
+        # The first time a game is used, import it and set it up
+        if self.unloaded:
+            prefix = message.content.split(' ', 1)[0].lower()
+            if prefix in self.unloaded:
+                await self.load_game(prefix)
         # Figure out which game, if any, the message is referring to
-        content = message.content.lower()
-        matching_games = []
-        for game in self.games:
-            if content.startswith(game.prefix + ' '):
-                matching_games.append(game)
-        # First, figure out if we're in the same channel as any of these games
-        if matching_games:
-            matching_game = None
-            for game in matching_games:
-                if game.main_channel == message.channel:
-                    matching_game = game
-                    break
-            else:
-                # Next, figure out if we're a player in any of these games
-                for game in matching_games:
-                    if game.find_player(message.author):
-                        matching_game = game
-                        break
-                else:
-                    # Next, figure out if there's a game on the same server as this one
-                    for game in matching_games:
-                        if game.main_channel and (message.channel.type != discord.ChannelType.private) and (game.main_channel.guild == message.channel.guild):
-                            matching_game = game
-                            break
-                    else:
-                        # Finally, figure out if this user has a server in common with this game (if this is a DM)
-                        if message.channel.type == discord.ChannelType.private:
-                            for game in matching_games:
-                                if game.main_channel and (message.author in game.main_channel.guild.members):
-                                    matching_game = game
-                                    break
-                            else:
-                                matching_game = matching_games[0]
-                        else:
-                            matching_game = matching_games[0]
-            # Invoke the command if we can find it
-            if matching_game:
-                command = content.split(None, 2)[1]
-                if command in matching_game.cmd_lookup:
-                    await matching_game.cmd_lookup[command](message)
+        matching_game, command = self.dispatch.resolve(message)
+        # Invoke the command if we can find it
+        if command:
+            record = (await matching_game.journal_command(message, command))
+            matching_game.pending += 1
+            try:
+                await self.stats.run(matching_game, command, message)
+            finally:
+                matching_game.pending -= 1
+                matching_game.journal_end(record)
         # If we're muted, delete this message
-        for user, game in self.muted:
-            if (user == message.author) and (game.main_channel == message.channel):
-                await message.delete()
-                return # Don't do a dad joke reply if they're muted
-        # Dad joke replies
-        if DAD_JOKES:
+        if (message.channel.id, message.author.id) in self.muted:
+            self.deleted_messages[(message.guild.id, message.author.id)] += 1
+            await message.delete()
+            return # Don't do a dad joke reply if they're muted
+        # Dad joke replies (shard 0 has already done one for a forwarded DM)
+        if DAD_JOKES and not forwarded:
             roles = getattr(message.author, 'roles', []) # No roles in a DM
             if not discord.utils.get(roles, name=os.getenv('GAMEBOT_MOM_NAME')):
                 # People with the "Mom" role are immune to Dad jokes. (Naturally.)
@@ -141,6 +227,23 @@ class GameBot(discord.Client):
 
 
 
+    async def deliver(self, message):
+        # Handle a message that didn't come from Discord, exactly as if it had
+        discord.Client.dispatch(self, 'message', message)
+
+
+
+    async def close(self):
+        # Save the running games before shutting down
+        for save in (self.snapshots.save_now, self.journal.flush_now):
+            try:
+                save()
+            except Exception:
+                traceback.print_exc()
+        await discord.Client.close(self)
+
+
+
     def run(self):
         # Run the GameBot
         discord.Client.run(self, os.getenv('GAMEBOT_TOKEN'))
@@ -0,0 +1,154 @@
+# Clocks that games wait on, and an event loop that runs on virtual time
+# Matthew Kroesche
+
+import asyncio
+import json
+import os
+
+from .game import DATA_DIR
+
+
+
+QUICK_FILE = os.path.join(DATA_DIR, 'quick.json') # Ids of the servers that have quick mode turned on
+QUICK_SCALE = 0.2 # Quick mode cuts dramatic pauses down to this fraction of their usual length
+
+
+
+
+
+
+class GameClock(object):
+
+    # Everything a game waits for goes through one of these. Dramatic pauses are multiplied by
+    # `scale`; timers (deleting messages, timing out a game nobody starts) are not, since they
+    # don't hold anyone up. Running on a VirtualTimeLoop makes all of it take no time at all.
+
+    def __init__(self, scheduler, scale=1.0):
+        self.scheduler = scheduler
+        self.scale = scale
+
+
+    def time(self):
+        return asyncio.get_event_loop().time()
+
+
+    async def pause(self, delay):
+        # Pause for dramatic effect
+        await asyncio.sleep(delay * self.scale)
+
+
+    def schedule(self, delay, callback, *args, tag=None):
+        # Call `callback(*args)` after `delay` seconds. Returns a Timer handle for Scheduler.cancel().
+        return self.scheduler.schedule(delay, callback, *args, tag=tag)
+
+
+
+
+
+
+class Clocks(object):
+
+    # The clocks for every server: the normal one, and a quicker one for servers that would
+    # rather get through games faster than sit through the drama.
+
+    def __init__(self, scheduler, scale=1.0):
+        self.normal = GameClock(scheduler)
+        self.quick = GameClock(scheduler)
+        self.quick_guilds = set() # Ids of the servers with quick mode turned on
+        self.set_scale(scale)
+
+
+    def set_scale(self, scale):
+        # Change how long dramatic pauses are everywhere (1 is normal, 0 is no pauses at all)
+        self.normal.scale = scale
+        self.quick.scale = scale * QUICK_SCALE
+
+
+    def for_channel(self, channel):
+        # Return the clock for a game being played in the given channel
+        guild = getattr(channel, 'guild', None)
+        if guild and (guild.id in self.quick_guilds):
+            return self.quick
+        return self.normal
+
+
+    async def set_quick(self, guild, quick):
+        # Turn quick mode on or off for a server, and remember it for next time
+        if quick:
+            self.quick_guilds.add(guild.id)
+        else:
+            self.quick_guilds.discard(guild.id)
+        await asyncio.get_event_loop().run_in_executor(None, self.write, guild.id, quick)
+
+
+    def write(self, guild_id, quick):
+        # Update the file for a single server. The file is read again first, since other
+        # shards may have changed it. Safe to call from an executor thread.
+        guild_ids = set(self.read())
+        if quick:
+            guild_ids.add(guild_id)
+        else:
+            guild_ids.discard(guild_id)
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(QUICK_FILE + '.tmp', 'w', encoding='utf-8') as o:
+            json.dump(sorted(guild_ids), o)
+        os.replace(QUICK_FILE + '.tmp', QUICK_FILE)
+
+
+    def read(self):
+        try:
+            with open(QUICK_FILE, encoding='utf-8') as o:
+                return json.load(o)
+        except (FileNotFoundError, ValueError):
+            return []
+
+
+    async def load(self):
+        # Read back which servers have quick mode on
+        self.quick_guilds.update(await asyncio.get_event_loop().run_in_executor(None, self.read))
+
+
+
+
+
+
+##### Virtual time #####
+
+
+class VirtualSelector(object):
+
+    # Wraps an event loop's selector. Whenever the loop would block waiting for its next timer,
+    # the loop's clock is moved forward to that timer instead.
+
+    def __init__(self, loop, selector):
+        self.loop = loop
+        self.selector = selector
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # No timers at all, so we can only be waiting on another thread (or real I/O)
+            return self.selector.select(None)
+        events = self.selector.select(0)
+        if (not events) and (timeout > 0):
+            self.loop.virtual_time += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+
+    # An event loop whose clock only moves when there is nothing left to do but wait, and then
+    # jumps straight to the next timer. Sleeps, timeouts, scheduler timers and dramatic pauses
+    # all behave exactly as they do in real time, just without the waiting, so simulations and
+    # benchmarks run as fast as the CPU allows.
+
+    def __init__(self):
+        asyncio.SelectorEventLoop.__init__(self)
+        self.virtual_time = 0.0
+        self._selector = VirtualSelector(self, self._selector)
+
+    def time(self):
+        return self.virtual_time
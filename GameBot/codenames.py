@@ -5,8 +5,6 @@ import discord
 import recordclass
 import sys
 import os
-import random
-import asyncio
 
 
 from .game import Game
@@ -34,6 +32,7 @@ class Codenames(Game):
 
     name = 'Codenames'
     prefix = 'cn'
+    transient = Game.transient + ('codewords',)
 
     def create_player(self, user):
         return Player(user)
@@ -43,8 +42,8 @@ class Codenames(Game):
         if not hasattr(self, 'codewords'):
             filename = os.path.join(os.path.dirname(sys.modules[__name__].__file__), 'codewords')
             with open(filename) as o:
-                # Load the word bank
-                self.codewords = o.read().strip().splitlines()
+                # Load the word bank (once, for every game)
+                Codenames.codewords = o.read().strip().splitlines()
         
 
     async def create(self, message):
@@ -158,7 +157,7 @@ class Codenames(Game):
         '''Join a game that has not yet started'''
         spl = message.content.split()
         if not (self.find_player(message.author) and (len(spl) == 3)):
-            await self.gb_join(message) # Allow things like "cn join red" after we've already joined, to switch teams
+            await Game.gb_join(self, message) # Allow things like "cn join red" after we've already joined, to switch teams
         player = self.find_player(message.author)
         if player:
             # Override to support syntax like "cn join red" or "cn join blue"
@@ -181,9 +180,9 @@ class Codenames(Game):
     async def gb_leave(self, message):
         '''Leave a game before it begins'''
         player = self.find_player(message.author)
-        await self.gb_leave(message)
+        await Game.gb_leave(self, message)
         # Override to make sure that when someone leaves, it drops them from whatever team they're on too
-        if player and self.running and not self.find_player(message.author):
+        if player and not self.find_player(message.author):
             if player in self.red_team:
                 self.red_team.remove(player)
             elif player in self.blue_team:
@@ -195,10 +194,10 @@ class Codenames(Game):
         '''Randomly assign teams'''
         if (await self.check_not_running(message)) and (await self.check_owner(message)):
             players = self.players[:]
-            random.shuffle(players)
+            self.random.shuffle(players)
             n = len(players) // 2
             teams = [players[:n], players[n:]]
-            random.shuffle(teams)
+            self.random.shuffle(teams)
             self.red_team, self.blue_team = teams
             await self.main_channel.send('The teams have been shuffled!')
             await self.cn_info(message)
@@ -243,15 +242,15 @@ class Codenames(Game):
         # Make a public announcement
         await self.main_channel.send('The game has now been started!')
         # Set up the game
-        self.board = random.sample(self.codewords, self.board_size[0] * self.board_size[1]) # Decide which codewords to use
+        self.board = self.random.sample(self.codewords, self.board_size[0] * self.board_size[1]) # Decide which codewords to use
         order = [RED, BLUE]
-        random.shuffle(order)
+        self.random.shuffle(order)
         self.key = []
         self.key.extend( [order[0]] * (self.num_clues + 1) ) # The team that goes first has to give an extra clue
         self.key.extend( [order[1]] * self.num_clues )
         self.key.extend( [CIVILIAN] * (self.board_size[0]*self.board_size[1] - 2*self.num_clues - 2) ) # Leftover spaces for civilians
         self.key.append(ASSASSIN) # Make sure there is exactly one assassin
-        random.shuffle(self.key) # And shuffle it
+        self.random.shuffle(self.key) # And shuffle it
         # Create the key string
         self.key_string = '\n'.join([''.join([SQUARES[s] for s in self.key[i:i+self.board_size[0]]]) for i in range(0, len(self.key), self.board_size[0])])
         self.key_string += '\n(Legend: %s=Red, %s=Blue, %s=Civilian, %s=Assassin)' % tuple(SQUARES[1:])
@@ -361,8 +360,7 @@ class Codenames(Game):
                     await message.channel.send('Syntax: cn click [cell name]')
                 else:
                     self.reentrant = True
-                    async with self.main_channel.typing():
-                        await asyncio.sleep(5) # Pause for dramatic effect
+                    await self.dramatic_pause()
                     # Update internal data
                     value = self.board[index] = self.key[index]
                     if self.guesses_remaining > 0:
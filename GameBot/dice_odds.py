@@ -0,0 +1,120 @@
+# Exact odds for Liar's Dice bids
+# Matthew Kroesche
+
+import functools
+import math
+
+TAIL_CACHE_SIZE = 65536 # Number of binomial tail probabilities to remember
+TAIL_EPSILON = 1e-17 # Stop summing terms once they are this small compared to the total
+
+
+
+
+@functools.lru_cache(maxsize=TAIL_CACHE_SIZE)
+def binomial_tail(n_dice, n_sides, wild, needed):
+    # Return the probability that at least `needed` of `n_dice` unseen dice count towards a bid,
+    # where each die counts with probability 1/n_sides, or 2/n_sides if ones are wild and the
+    # bid isn't on ones. Terms are computed in log space, so large tables don't underflow, and
+    # only the shorter side of the distribution is summed.
+    if needed <= 0:
+        return 1.0
+    if needed > n_dice:
+        return 0.0
+    p = (2.0 if wild else 1.0) / n_sides
+    if p >= 1.0:
+        return 1.0
+    log_p = math.log(p)
+    log_q = math.log1p(-p)
+    log_n = math.lgamma(n_dice + 1)
+    def term(k):
+        return math.exp(log_n - math.lgamma(k + 1) - math.lgamma(n_dice - k + 1) + k * log_p + (n_dice - k) * log_q)
+    total = 0.0
+    if needed > n_dice * p:
+        # Past the mean, so the terms only get smaller from here
+        for k in range(needed, n_dice + 1):
+            t = term(k)
+            total += t
+            if t <= total * TAIL_EPSILON:
+                break
+        return min(total, 1.0)
+    # Otherwise add up the (smaller) chance of falling short, working down from just below `needed`
+    for k in range(needed - 1, -1, -1):
+        t = term(k)
+        total += t
+        if t <= total * TAIL_EPSILON:
+            break
+    return max(1.0 - total, 0.0)
+
+
+
+def poisson_binomial(chances):
+    # Return the distribution of the number of successes among independent events with the given chances
+    dist = [1.0]
+    for p in chances:
+        new = [0.0] * (len(dist) + 1)
+        for k, d in enumerate(dist):
+            new[k] += d * (1.0 - p)
+            new[k + 1] += d * p
+        dist = new
+    return dist
+
+
+
+def bid_chance(needed, free_dice, n_sides, wild, passers=()):
+    # Return the probability that at least `needed` more dice count towards a bid. `free_dice` is
+    # the number of unseen dice we know nothing about; `passers` holds, for each player who passed,
+    # the chance that their hand has one die counting towards the bid (it can't have more).
+    if not passers:
+        return binomial_tail(free_dice, n_sides, wild, needed)
+    return min(sum([d * binomial_tail(free_dice, n_sides, wild, needed - k) for k, d in enumerate(poisson_binomial(passers))]), 1.0)
+
+
+
+def hand_chance(bid, counts, others, n_sides, ones_wild, exact=False):
+    # Return the probability that a bid is true (or, with `exact`, spot on) as far as one player can tell.
+    # `counts` is how many of their dice show each value, and `others` holds (number of dice, passed)
+    # for everyone else. Anyone who has passed this round is assumed to have had a legal hand for
+    # passing: all their dice different, without any wild ones unless they only have one die.
+    num, value = bid
+    wild = (ones_wild and (value != 1))
+    needed = num - counts[value - 1] - (counts[0] if wild else 0)
+    free_dice = 0
+    passers = []
+    for n_dice, passed in others:
+        if passed:
+            no_ones = (ones_wild and (n_dice > 1))
+            faces = n_sides - (1 if no_ones else 0)
+            if n_dice <= faces:
+                if no_ones and (value == 1):
+                    passers.append(0.0)
+                elif wild and (n_dice == 1):
+                    passers.append(2.0 / faces) # Their one die counts if it shows the value or a wild one
+                else:
+                    passers.append(n_dice / faces)
+                continue
+        free_dice += n_dice
+    chance = bid_chance(needed, free_dice, n_sides, wild, passers)
+    if exact:
+        chance = max(chance - bid_chance(needed + 1, free_dice, n_sides, wild, passers), 0.0)
+    return chance
+
+
+
+def legal_pass_chance(n_dice, n_sides, ones_wild):
+    # Return the chance that a random hand of `n_dice` dice could legally pass: all different, and
+    # without any wild ones unless there is only one die
+    faces = n_sides - (1 if (ones_wild and (n_dice > 1)) else 0)
+    chance = 1.0
+    for i in range(n_dice):
+        chance *= max(faces - i, 0) / n_sides
+    return chance
+
+
+
+def format_chance(p):
+    # Format a probability as a percentage, without rounding a long shot to 0 or a near certainty to 100
+    if 0.0 < p < 0.001:
+        return '<0.1%'
+    if 0.999 < p < 1.0:
+        return '>99.9%'
+    return '%.1f%%' % (p * 100)
@@ -0,0 +1,348 @@
+# Solved strategy tables for small games of Liar's Dice
+# Matthew Kroesche
+
+import argparse
+import array
+import functools
+import itertools
+import mmap
+import multiprocessing
+import os
+import random
+import resource
+import struct
+import sys
+import time
+
+from .game import DATA_DIR
+
+
+
+# The tables cover the plain game: 6-sided dice, ones not wild, and everyone holding the same number
+# of dice. Each player only remembers their own dice and the current bid, so one table serves every
+# seat and every bidding history that leads to the same bid. Raises are limited to the next
+# MAX_RAISE bids, which keeps each row of the table short.
+
+STRATEGY_DIR = os.path.join(DATA_DIR, 'strategy') # Where the tables and the solver's checkpoints are kept
+N_SIDES = 6 # Number of sides on the dice the tables are solved for
+MAX_RAISE = 12 # Largest number of bids a raise can skip over, counting the one it lands on
+ROW = MAX_RAISE + 1 # Entries in each row of a table: challenging, then raising by 1 to MAX_RAISE bids
+PLAYERS = (2, 3, 4) # Numbers of players to solve for by default
+DICE = (1, 2, 3, 4, 5) # Numbers of dice each to solve for by default
+
+TABLE_MAGIC = b'LDST'
+CHECKPOINT_MAGIC = b'LDCK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('=4sBBBBB7xIIQ') # magic, version, players, dice, sides, max raise, (padding to keep the tables aligned), hands, rows, iterations
+PROBABILITY_SCALE = 65535 # Probabilities are stored as 16-bit fractions of this
+
+EXPLORATION = 0.6 # Chance that the solver tries a random move for the player it is learning for
+ITERATIONS = 1000000 # Default number of sampled games to solve each configuration with
+CHECKPOINT_ITERATIONS = 50000 # Default number of sampled games between checkpoints
+
+
+
+
+
+def table_path(n_players, n_dice, ext='table'):
+    return os.path.join(STRATEGY_DIR, 'ld-%dp%dd.%s' % (n_players, n_dice, ext))
+
+
+def all_hands(n_dice):
+    # Return every hand of n_dice dice, as sorted tuples of values counting from 0
+    return list(itertools.combinations_with_replacement(range(N_SIDES), n_dice))
+
+
+def bid_index(bid):
+    # Bids are numbered in order: 1 1, 1 2, ..., 1 6, 2 1, ...
+    num, value = bid
+    return (num - 1) * N_SIDES + (value - 1)
+
+
+def index_bid(index):
+    return (index // N_SIDES + 1, index % N_SIDES + 1)
+
+
+def legal_slots(bid, n_bids):
+    # Return the first and last entries of a row that can be played after `bid` (-1 before anyone
+    # has bid). Entry 0 is a challenge, and entry k raises the bid by k places.
+    return (0 if bid >= 0 else 1), min(MAX_RAISE, n_bids - 1 - bid)
+
+
+
+
+
+
+##### Looking up strategies #####
+
+
+class StrategyTable(object):
+
+    # A solved strategy for one configuration. The file is memory-mapped, so looking up a move
+    # only touches the one row it needs, and every process on the machine shares the same pages.
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_players, self.n_dice, n_sides, max_raise, n_hands, self.n_rows, self.iterations = HEADER.unpack_from(self.map)
+        if (magic != TABLE_MAGIC) or (version != FORMAT_VERSION) or (n_sides != N_SIDES) or (max_raise != MAX_RAISE):
+            raise ValueError('%s is not a strategy table this version can read' % filename)
+        if len(self.map) != HEADER.size + 2 * n_hands * self.n_rows * ROW:
+            raise ValueError('%s has the wrong size' % filename)
+        self.probabilities = memoryview(self.map)[HEADER.size:].cast('H')
+        self.hand_index = dict([(hand, i) for i, hand in enumerate(all_hands(self.n_dice))])
+
+
+    def strategy(self, counts, bid):
+        # Return the moves to make with the given dice (counts of each value) after `bid`, as
+        # (probability, move) pairs, where the move is a bid or None for a challenge. Returns
+        # None if the solver never reached this situation.
+        hand = tuple([value for value, count in enumerate(counts) for i in range(count)])
+        current = (bid_index(bid) if bid else -1)
+        if current >= self.n_rows - 1:
+            return None # Bigger than any bid the table knows about
+        base = (self.hand_index[hand] * self.n_rows + current + 1) * ROW
+        first, last = legal_slots(current, self.n_rows - 1)
+        moves = [(self.probabilities[base + k] / PROBABILITY_SCALE, (index_bid(current + k) if k else None)) for k in range(first, last + 1)]
+        if not any([p for p, move in moves]):
+            return None
+        return moves
+
+
+
+@functools.lru_cache(maxsize=None)
+def load_table(n_players, n_dice):
+    # Return the StrategyTable for a configuration, or None if it hasn't been solved
+    try:
+        return StrategyTable(table_path(n_players, n_dice))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print('Warning: %s' % e, file=sys.stderr)
+        return None
+
+
+
+def strategy_for(dice, others, n_sides, ones_wild, bid):
+    # Return the solved strategy for a player holding `dice` (counts of each value), where `others`
+    # holds (number of dice, passed) for everyone else, as StrategyTable.strategy() does. Returns
+    # None if no table covers the game as it stands.
+    n_dice = sum(dice)
+    if (n_sides != N_SIDES) or ones_wild or not n_dice:
+        return None
+    if any([passed or (n != n_dice) for n, passed in others]):
+        return None
+    table = load_table(len(others) + 1, n_dice)
+    if table is None:
+        return None
+    return table.strategy(dice, bid)
+
+
+
+
+
+
+##### Solver #####
+
+
+class Solver(object):
+
+    # Outcome-sampling Monte Carlo counterfactual regret minimization for one configuration.
+    # Each iteration deals a random hand to everyone and plays out a single line of bidding,
+    # updating the regrets of one player (taking turns) and the average strategy of the rest.
+
+    def __init__(self, n_players, n_dice, seed=None):
+        self.n_players = n_players
+        self.n_dice = n_dice
+        self.hands = all_hands(n_dice)
+        self.hand_index = dict([(hand, i) for i, hand in enumerate(self.hands)])
+        self.n_bids = n_players * n_dice * N_SIDES
+        self.n_rows = self.n_bids + 1 # One row for each bid, and one for the opening bid
+        self.size = len(self.hands) * self.n_rows * ROW
+        self.regrets = array.array('d', bytes(8 * self.size))
+        self.strategy_sums = array.array('d', bytes(8 * self.size))
+        self.iterations = 0
+        self.rng = random.Random(seed)
+        self.previous = None # The average strategy at the last report, to measure how much it has moved
+
+
+    def name(self):
+        return '%dp%dd' % (self.n_players, self.n_dice)
+
+
+    def memory(self):
+        # Number of bytes taken up by the regret and strategy tables
+        return self.regrets.itemsize * (len(self.regrets) + len(self.strategy_sums))
+
+
+    def iterate(self):
+        rng = self.rng
+        rolls = [tuple(sorted([rng.randrange(N_SIDES) for i in range(self.n_dice)])) for p in range(self.n_players)]
+        self.hand_rows = [self.hand_index[roll] * self.n_rows for roll in rolls]
+        self.totals = [0] * N_SIDES
+        for roll in rolls:
+            for value in roll:
+                self.totals[value] += 1
+        self.walk(-1, 0, self.iterations % self.n_players, 1.0, 1.0)
+        self.iterations += 1
+
+
+    def walk(self, bid, player, learner, reach_others, sample):
+        # Play out the rest of a game from `bid`, with `player` to move. Returns the learner's sampled
+        # utility and the chance of the rest of the line under the current strategy.
+        base = (self.hand_rows[player] + bid + 1) * ROW
+        first, last = legal_slots(bid, self.n_bids)
+        slots = range(first, last + 1)
+        # Regret matching
+        regrets = self.regrets
+        positive = [max(regrets[base + k], 0.0) for k in slots]
+        total = sum(positive)
+        sigma = ([r / total for r in positive] if total > 0 else [1.0 / len(positive)] * len(positive))
+        if player == learner:
+            explore = EXPLORATION / len(sigma)
+            probs = [explore + (1.0 - EXPLORATION) * p for p in sigma]
+        else:
+            probs = sigma
+        a = self.rng.choices(range(len(probs)), probs)[0]
+        sample *= probs[a]
+        if first + a == 0:
+            # A challenge ends the game: the bidder loses if the bid was too high, and the challenger otherwise
+            num, value = index_bid(bid)
+            loser = (player if self.totals[value - 1] >= num else (player - 1) % self.n_players)
+            utility = (-1.0 if loser == learner else 1.0 / (self.n_players - 1)) / sample
+            tail = 1.0
+        else:
+            next_player = (player + 1) % self.n_players
+            if player == learner:
+                utility, tail = self.walk(bid + first + a, next_player, learner, reach_others, sample)
+            else:
+                utility, tail = self.walk(bid + first + a, next_player, learner, reach_others * sigma[a], sample)
+        if player == learner:
+            weight = utility * reach_others * tail
+            for i, k in enumerate(slots):
+                regrets[base + k] += weight * ((1.0 if i == a else 0.0) - sigma[a])
+        else:
+            sums = self.strategy_sums
+            for i, k in enumerate(slots):
+                sums[base + k] += reach_others * sigma[i] / sample
+        return utility, tail * sigma[a]
+
+
+    def average_strategy(self):
+        # Return the average strategy as an array of probabilities. Rows that were never reached are left as zeros.
+        average = array.array('d', bytes(8 * self.size))
+        sums = self.strategy_sums
+        for base in range(0, self.size, ROW):
+            total = sum(sums[base:base + ROW])
+            if total > 0:
+                for k in range(ROW):
+                    average[base + k] = sums[base + k] / total
+        return average
+
+
+    def report(self, rate):
+        # Return a line describing how far the solver has got. The regret is the average over the rows
+        # that have been reached of the largest positive regret per iteration, which goes to zero as
+        # the strategy converges; the change is how far the average strategy has moved since the last report.
+        average = self.average_strategy()
+        reached = 0
+        regret = 0.0
+        change = (0.0 if self.previous else None)
+        for base in range(0, self.size, ROW):
+            if any(average[base:base + ROW]):
+                reached += 1
+                regret += max(max(self.regrets[base:base + ROW]), 0.0)
+                if change is not None:
+                    change += sum([abs(a - b) for a, b in zip(average[base:base + ROW], self.previous[base:base + ROW])])
+        self.previous = average
+        return '%s: %9d iterations, %6d/%d rows reached, regret %.5f, change %s, %6.1f MB of tables, %6.1f MB resident, %7.0f iterations/s' % \
+               (self.name(), self.iterations, reached, self.size // ROW, regret / max(reached, 1) / max(self.iterations, 1),
+                ('n/a' if change is None else '%.5f' % (change / max(reached, 1))), self.memory() / 2**20,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, rate)
+
+
+    def write_atomically(self, filename, header, arrays):
+        os.makedirs(STRATEGY_DIR, exist_ok=True)
+        with open(filename + '.tmp', 'wb') as o:
+            o.write(header)
+            for a in arrays:
+                a.tofile(o)
+            o.flush()
+            os.fsync(o.fileno())
+        os.replace(filename + '.tmp', filename)
+
+
+    def header(self, magic):
+        return HEADER.pack(magic, FORMAT_VERSION, self.n_players, self.n_dice, N_SIDES, MAX_RAISE, len(self.hands), self.n_rows, self.iterations)
+
+
+    def save_checkpoint(self):
+        self.write_atomically(table_path(self.n_players, self.n_dice, 'checkpoint'), self.header(CHECKPOINT_MAGIC),
+                              [self.regrets, self.strategy_sums])
+
+
+    def load_checkpoint(self):
+        # Pick up where an earlier run left off, if it saved a checkpoint. Returns True if it did.
+        try:
+            with open(table_path(self.n_players, self.n_dice, 'checkpoint'), 'rb') as f:
+                header = f.read(HEADER.size)
+                if header[:-8] != self.header(CHECKPOINT_MAGIC)[:-8]:
+                    return False # Saved for a different table layout
+                self.regrets = array.array('d')
+                self.regrets.fromfile(f, self.size)
+                self.strategy_sums = array.array('d')
+                self.strategy_sums.fromfile(f, self.size)
+        except (FileNotFoundError, EOFError):
+            return False
+        self.iterations = HEADER.unpack(header)[-1]
+        return True
+
+
+    def save_table(self):
+        # Write out the average strategy, with each probability rounded to 16 bits
+        table = array.array('H', [int(round(p * PROBABILITY_SCALE)) for p in self.average_strategy()])
+        self.write_atomically(table_path(self.n_players, self.n_dice), self.header(TABLE_MAGIC), [table])
+
+
+
+
+def solve(job):
+    # Entry point for each worker process: solve one configuration up to the given number of
+    # iterations, saving a checkpoint and reporting progress every so often
+    n_players, n_dice, iterations, checkpoint, seed = job
+    solver = Solver(n_players, n_dice, seed)
+    if solver.load_checkpoint():
+        print('%s: resuming from iteration %d' % (solver.name(), solver.iterations), flush=True)
+    while solver.iterations < iterations:
+        start = time.perf_counter()
+        batch = min(checkpoint, iterations - solver.iterations)
+        for i in range(batch):
+            solver.iterate()
+        rate = batch / max(time.perf_counter() - start, 1e-9)
+        solver.save_checkpoint()
+        print(solver.report(rate), flush=True)
+    solver.save_table()
+    return solver.name()
+
+
+
+
+
+
+if __name__ == '__main__':
+    # Solve the tables, one configuration per process on every core
+    # Usage: python -m GameBot.dice_strategy [--players 2 3 4] [--dice 1 2 3 4 5] [--iterations N] [--checkpoint N] [--workers N]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, nargs='+', default=PLAYERS, help='numbers of players to solve for')
+    parser.add_argument('--dice', type=int, nargs='+', default=DICE, help='numbers of dice each player holds')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help='total sampled games for each configuration (default %d)' % ITERATIONS)
+    parser.add_argument('--checkpoint', type=int, default=CHECKPOINT_ITERATIONS, help='sampled games between checkpoints (default %d)' % CHECKPOINT_ITERATIONS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the first configuration, counting up for the rest (default: random)')
+    args = parser.parse_args()
+    # Start with the biggest configurations, so that the small ones fill in around them at the end
+    configs = sorted([(p, d) for p in args.players for d in args.dice], key=lambda c: -c[0] * c[1])
+    jobs = [(p, d, args.iterations, args.checkpoint, (None if args.seed is None else args.seed + i)) for i, (p, d) in enumerate(configs)]
+    with multiprocessing.Pool(min(args.workers, len(jobs))) as pool:
+        for name in pool.imap_unordered(solve, jobs):
+            print('%s: table written to %s' % (name, STRATEGY_DIR), flush=True)
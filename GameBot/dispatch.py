@@ -0,0 +1,221 @@
+# Command dispatch table for the GameBot
+# Matthew Kroesche
+
+import discord
+import recordclass
+
+
+
+Entry = recordclass.recordclass('Entry', 'games channels guilds players')
+# games: dict of every game with this prefix, in creation order (the values are unused)
+# channels: dict mapping channel ids to the game being played in that channel
+# guilds: dict mapping guild ids to a dict of the games being played on that server
+# players: dict mapping user ids to the (game, Player) they are currently playing as
+
+
+
+
+
+
+class DispatchTable(object):
+
+    # Keeps track of which games are being played where, so that figuring out which game
+    # a message is addressed to does not depend on how many games are currently running.
+
+    def __init__(self):
+        self.entries = {} # Map from each game prefix to its Entry
+        self.locations = {} # Map from each game to the (channel id, guild id) it is currently indexed under
+        self.members = {} # Map from each user id to the set of ids of the guilds they are a member of
+        self.watcher = None # If set, called as watcher(prefix, user id, playing) whenever a player joins or leaves a game
+        self.guild_watcher = None # If set, called as guild_watcher(prefix, guild id, present) whenever a guild gets its first game with a prefix or loses its last one
+
+
+    def add(self, game):
+        # Register a new game
+        entry = self.entries.get(game.prefix)
+        if entry is None:
+            entry = self.entries[game.prefix] = Entry({}, {}, {}, {})
+        entry.games[game] = None
+        self.update(game)
+
+
+    def remove(self, game):
+        # Unregister a game that is no longer needed
+        self.unindex(game)
+        entry = self.entries.get(game.prefix)
+        if entry:
+            entry.games.pop(game, None)
+
+
+    def unindex(self, game):
+        # Remove a game from the channel and guild indices
+        location = self.locations.pop(game, None)
+        if location:
+            channel_id, guild_id = location
+            entry = self.entries[game.prefix]
+            if entry.channels.get(channel_id) is game:
+                del entry.channels[channel_id]
+            games = entry.guilds.get(guild_id)
+            if games:
+                games.pop(game, None)
+                if not games:
+                    del entry.guilds[guild_id]
+                    if self.guild_watcher:
+                        self.guild_watcher(game.prefix, guild_id, False)
+
+
+    def update(self, game):
+        # Call this whenever the main channel of a game changes
+        self.unindex(game)
+        channel = game.main_channel
+        if channel:
+            entry = self.entries[game.prefix]
+            entry.channels.setdefault(channel.id, game)
+            games = entry.guilds.get(channel.guild.id)
+            if games is None:
+                games = entry.guilds[channel.guild.id] = {}
+                if self.guild_watcher:
+                    self.guild_watcher(game.prefix, channel.guild.id, True)
+            games[game] = None
+            self.locations[game] = (channel.id, channel.guild.id)
+
+
+    def games(self, prefix):
+        # Return the list of games with the given prefix
+        entry = self.entries.get(prefix)
+        if entry:
+            return list(entry.games)
+        return []
+
+
+    def __contains__(self, game):
+        # Returns True if the game is registered
+        entry = self.entries.get(game.prefix)
+        return bool(entry) and (game in entry.games)
+
+
+    def count(self, prefix):
+        # Return the number of games with the given prefix
+        entry = self.entries.get(prefix)
+        if entry:
+            return len(entry.games)
+        return 0
+
+
+    def game_in_channel(self, prefix, channel):
+        # Return the game with the given prefix being played in this channel, if any
+        entry = self.entries.get(prefix)
+        if entry and channel:
+            return entry.channels.get(channel.id)
+
+
+
+    def add_player(self, game, player):
+        # Call this whenever a Player joins a game
+        self.entries[game.prefix].players[player.user.id] = (game, player)
+        if self.watcher:
+            self.watcher(game.prefix, player.user.id, True)
+
+
+    def remove_player(self, game, player):
+        # Call this whenever a Player leaves or is eliminated from a game
+        players = self.entries[game.prefix].players
+        if players.get(player.user.id, (None, None))[0] is game:
+            del players[player.user.id]
+            if self.watcher:
+                self.watcher(game.prefix, player.user.id, False)
+
+
+    def find_player(self, prefix, user):
+        # Return the (game, Player) for this user among the games with the given prefix, or (None, None)
+        entry = self.entries.get(prefix)
+        if entry:
+            return entry.players.get(user.id, (None, None))
+        return None, None
+
+
+
+    def index_members(self, guilds):
+        # Rebuild the guild membership index from scratch
+        self.members = {}
+        for guild in guilds:
+            self.add_guild(guild)
+
+
+    def add_guild(self, guild):
+        # Call this when the bot joins a guild
+        for member in guild.members:
+            self.add_member(member)
+
+
+    def remove_guild(self, guild):
+        # Call this when the bot leaves a guild
+        for member in guild.members:
+            self.remove_member(member)
+
+
+    def add_member(self, member):
+        # Call this when someone joins a guild
+        self.members.setdefault(member.id, set()).add(member.guild.id)
+
+
+    def remove_member(self, member):
+        # Call this when someone leaves a guild
+        guilds = self.members.get(member.id)
+        if guilds:
+            guilds.discard(member.guild.id)
+            if not guilds:
+                del self.members[member.id]
+
+
+
+    def find_game(self, prefix, message):
+        # Figure out which game with the given prefix this message is referring to
+        entry = self.entries.get(prefix)
+        if not entry:
+            return None
+        # First, figure out if we're in the same channel as any of these games
+        game = entry.channels.get(message.channel.id)
+        if game:
+            return game
+        # Next, figure out if we're a player in any of these games
+        game = entry.players.get(message.author.id, (None, None))[0]
+        if game:
+            return game
+        if message.channel.type != discord.ChannelType.private:
+            # Next, figure out if there's a game on the same server as this one
+            games = entry.guilds.get(message.channel.guild.id)
+            if games:
+                return next(iter(games))
+        else:
+            # Finally, figure out if this user has a server in common with this game (if this is a DM)
+            game = self.find_shared(prefix, message.author.id)
+            if game:
+                return game
+        return next(iter(entry.games), None)
+
+
+    def find_shared(self, prefix, user_id):
+        # Return a game with the given prefix on a server the user is a member of, or None if there isn't one
+        entry = self.entries.get(prefix)
+        if entry:
+            for guild_id in self.members.get(user_id, ()):
+                games = entry.guilds.get(guild_id)
+                if games:
+                    return next(iter(games))
+        return None
+
+
+
+    def resolve(self, message):
+        # Return the (game, command) pair this message is invoking, or (None, None) if there isn't one
+        content = message.content.lower()
+        words = content.split(' ', 1)
+        if (len(words) != 2) or (words[0] not in self.entries):
+            return None, None
+        game = self.find_game(words[0], message)
+        if game:
+            words = content.split(None, 2)
+            if len(words) >= 2:
+                return game, game.cmd_lookup.get(words[1])
+        return game, None
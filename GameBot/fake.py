@@ -0,0 +1,193 @@
+# Stand-ins for Discord objects, for running games without connecting to Discord
+# Matthew Kroesche
+
+import discord
+import asyncio
+import collections
+
+from .dispatch import DispatchTable
+from .scheduler import Scheduler
+from .clock import Clocks
+
+
+
+
+
+class PausedScheduler(Scheduler):
+
+    # A Scheduler whose timers never go off by themselves. When a journal is being replayed,
+    # timers are driven by the journal instead of the clock.
+
+    def arm(self):
+        pass
+
+
+
+
+
+class FakeUser(object):
+
+    def __init__(self, bot, id):
+        self.client = bot
+        self.id = id
+        self.name = self.display_name = 'user%d' % id
+        self.mention = '<@%d>' % id
+        self.roles = []
+
+    async def send(self, content=None, embed=None, file=None):
+        return self.client.post(self, None, content, embed)
+
+
+
+class FakeGuild(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = 'guild%d' % id
+        self.roles = []
+        self.members = []
+        self.channels = []
+
+
+
+class FakeChannel(object):
+
+    def __init__(self, bot, id, guild, type=discord.ChannelType.text):
+        self.client = bot
+        self.id = id
+        self.guild = guild
+        self.type = type
+        self.name = 'channel%d' % id
+        self.mention = '<#%d>' % id
+
+    async def send(self, content=None, embed=None, file=None):
+        return self.client.post(None, self, content, embed)
+
+    def typing(self):
+        return FakeTyping()
+
+
+
+class FakeTyping(object):
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+
+class FakeMessage(object):
+
+    def __init__(self, author, channel, content='', embed=None, mentions=(), channel_mentions=()):
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embed = embed
+        self.mentions = list(mentions)
+        self.channel_mentions = list(channel_mentions)
+        self.deleted = False
+
+    async def edit(self, content=None, embed=None):
+        self.content = content
+        self.embed = embed
+
+    async def delete(self):
+        self.deleted = True
+
+
+
+
+
+
+class FakeBot(object):
+
+    # Enough of a GameBot to run games on, without a connection to Discord.
+    # Everything the games send is kept in `transcript` as (recipient, content) pairs,
+    # where the recipient is a FakeUser for a direct message or a FakeChannel otherwise.
+
+    def __init__(self, guild_id, timers=True):
+        self.games = []
+        self.unloaded = {} # Games are always added up front
+        self.dispatch = DispatchTable()
+        self.scheduler = (Scheduler() if timers else PausedScheduler())
+        self.journal = None
+        self.clocks = Clocks(self.scheduler, 0) # No need for dramatic pauses
+        self.main_channels = {}
+        self.ping_channels = {}
+        self.last_ping = {}
+        self.muted = {}
+        self.muted_users = {}
+        self.deleted_messages = collections.Counter()
+        self.DEBUG = False
+        self.guild = FakeGuild(guild_id)
+        self.users = {}
+        self.channels = {}
+        self.user = self.get_user(0)
+        self.transcript = []
+        self.answers = iter(()) # Answers to give to yes/no questions, in order
+
+
+    def add_game(self, game):
+        self.games.append(game)
+        self.dispatch.add(game)
+
+    def remove_game(self, game):
+        self.games.remove(game)
+        self.dispatch.remove(game)
+
+
+    def get_user(self, id):
+        user = self.users.get(id)
+        if user is None:
+            user = self.users[id] = FakeUser(self, id)
+        return user
+
+    async def fetch_user(self, id):
+        return self.get_user(id)
+
+    def get_channel(self, id):
+        channel = self.channels.get(id)
+        if channel is None:
+            if id:
+                channel = FakeChannel(self, id, self.guild)
+            else:
+                channel = FakeChannel(self, id, None, discord.ChannelType.private)
+            self.channels[id] = channel
+        return channel
+
+
+    def post(self, user, channel, content, embed):
+        # Record something sent by a game, and return the message
+        self.transcript.append((user or channel, content if embed is None else embed))
+        return FakeMessage(self.user, channel or self.get_channel(0), content, embed)
+
+
+    async def wait_for(self, event, check=None, timeout=None):
+        # Answer a yes/no question with the next answer in self.answers
+        try:
+            answer = next(self.answers)
+        except StopIteration:
+            raise asyncio.TimeoutError
+        return FakeMessage(None, self.get_channel(0), ('yes' if answer else 'no'))
+
+
+    async def deliver(self, message):
+        # Handle a message the same way GameBot.on_message() does, apart from the extras
+        game, command = self.dispatch.resolve(message)
+        if command:
+            record = (await game.journal_command(message, command))
+            game.pending += 1
+            try:
+                await command(message)
+            finally:
+                game.pending -= 1
+                game.journal_end(record)
+
+
+    def message(self, author_id, channel_id, content, mention_ids=(), channel_mention_ids=()):
+        # Make a message as if the given user had sent it. A channel id of 0 means a direct message.
+        return FakeMessage(self.get_user(author_id), self.get_channel(channel_id), content,
+                           [self.get_user(id) for id in mention_ids], [self.get_channel(id) for id in channel_mention_ids])
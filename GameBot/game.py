@@ -9,10 +9,100 @@ import datetime
 import traceback
 import random
 import asyncio
+import types
 
 PING_DELAY = datetime.timedelta(hours=1) # One-hour delay for pinging #off-topic
 VOTEKICK_MIN = 4 # Four votes required to force an inactive game to end
 STARTING_DELAY = 60 * 20 # If the game is not started within 20 minutes of its creation time, delete it
+DRAMATIC_PAUSE = 5 # Number of seconds to pause for dramatic effect before revealing results
+
+DATA_DIR = os.getenv('GAMEBOT_DATA_DIR', 'data') # Directory for files the bot keeps on local disk
+
+DM_CONCURRENCY = int(os.getenv('GAMEBOT_DM_CONCURRENCY', 10)) # Maximum number of direct messages a game sends at once
+DM_RETRIES = 3 # Number of times to retry a direct message that failed for a transient reason
+DM_RETRY_DELAY = 1 # Number of seconds to wait before the first retry (doubled after each attempt)
+
+MESSAGE_LIMIT = 2000 # Discord won't send a message with more characters than this
+
+
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    # Split text into pieces that each fit in a message, breaking between lines where possible,
+    # then between words, and only in the middle of a word if there is no other way
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(' ', 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip('\n ')
+    pieces.append(text)
+    return pieces
+
+
+
+
+
+
+class GameRandom(random.Random):
+
+    # Random number generator used by a game. While `draws` is a list, every draw that is made
+    # is appended to it so that it can be journaled; while `replay` is set to an iterator, draws
+    # are taken from it instead, so a journaled game can be replayed exactly.
+
+    def __init__(self):
+        self.draws = None
+        self.replay = None
+        random.Random.__init__(self)
+
+    def random(self):
+        if self.replay is not None:
+            return next(self.replay)
+        value = random.Random.random(self)
+        if self.draws is not None:
+            self.draws.append(value)
+        return value
+
+    def getrandbits(self, k):
+        if self.replay is not None:
+            return next(self.replay)
+        value = random.Random.getrandbits(self, k)
+        if self.draws is not None:
+            self.draws.append(value)
+        return value
+
+    def external(self, func, *args):
+        # Call func(*args) as if it were a single random draw. Use this for randomness that
+        # comes from outside the game, such as a shared deck of cards.
+        if self.replay is not None:
+            return next(self.replay)
+        value = func(*args)
+        if self.draws is not None:
+            self.draws.append(value)
+        return value
+
+
+
+
+
+
+class CommandTable(object):
+
+    # The commands of a game class, mapping each command name and abbreviation to its function.
+    # It is built once per class. The first time it is looked up on a game, the functions are
+    # bound to that game, and the game keeps the resulting dict in place of the descriptor.
+
+    def __init__(self, functions):
+        self.functions = functions
+
+    def __get__(self, game, cls):
+        if game is None:
+            return self
+        commands = game.cmd_lookup = dict([(name, func.__get__(game, cls)) for name, func in self.functions.items()])
+        return commands
 
 
 
@@ -24,41 +114,61 @@ class Game(object):
     # Define these in subclasses
     name = None
     prefix = None
+    transient = ('bot', 'cmd_lookup', 'starting_timer_handle', 'pending', 'random', 'journal_records', 'journal_lock', 'journal_holder') # Attributes that are not saved in snapshots
+    journal_skip = ('gb_create', 'gb_help', 'gb_ping', 'gb_coin', 'gb_roll', 'gb_debug', 'gb_heff', 'gb_stats', 'gb_quick') # Commands that never change the state of the game
 
 
-    def __init__(self, bot):
-        self.bot = bot
-        self.owner = None # The player who started the game
-        self.running = False # True if the game is currently ongoing
-        self.main_channel = None
-        self.cmd_lookup = {}
-        self.players = []
+    def __init_subclass__(cls, **kwargs):
+        # Build the command table and help text once for each game class, rather than for every instance
+        super().__init_subclass__(**kwargs)
+        if cls.prefix:
+            cls.build_commands()
+
+
+    @classmethod
+    def build_commands(cls):
+        functions = {}
         help_strings = []
-        methods = dir(self)
+        methods = dir(cls)
         # Give global gb_* commands priority for snipping
         methods = [i for i in methods if i.startswith('gb_')] + [i for i in methods if not i.startswith('gb_')]
         for fname in methods:
-            if not fname.startswith((self.prefix + '_', 'gb_')):
+            if not fname.startswith((cls.prefix + '_', 'gb_')):
                 continue
-            func = getattr(self, fname)
+            func = getattr(cls, fname)
             name = fname.split('_', 1)[1]
-            self.cmd_lookup[name] = func
+            functions[name] = func
             if not ((func.__name__ == fname) and func.__doc__):
                 continue
             snipsize = 1
-            while name[:snipsize] in self.cmd_lookup:
+            while name[:snipsize] in functions:
                 snipsize += 1
                 if snipsize == len(name):
                     snipsize = 0
                     break
             if snipsize:
-                self.cmd_lookup[name[:snipsize]] = func
-                help_strings.append('%s __%s__%s: %s' % (self.prefix, name[:snipsize], name[snipsize:], func.__doc__))
+                functions[name[:snipsize]] = func
+                help_strings.append('%s __%s__%s: %s' % (cls.prefix, name[:snipsize], name[snipsize:], func.__doc__))
             else:
-                help_strings.append('%s %s: %s' % (self.prefix, name, func.__doc__))
+                help_strings.append('%s %s: %s' % (cls.prefix, name, func.__doc__))
         help_strings.sort()
-        self.help = '**%s bot commands:**\n%s' % (self.name, '\n'.join(help_strings))
-        self.starting_timer_task = None
+        cls.cmd_lookup = CommandTable(functions)
+        cls.help = '**%s bot commands:**\n%s' % (cls.name, '\n'.join(help_strings))
+
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.owner = None # The player who started the game
+        self.running = False # True if the game is currently ongoing
+        self.main_channel = None
+        self.players = []
+        self.starting_timer_handle = None
+        self.pending = 0 # Number of commands and timers currently being handled by this game
+        self.random = GameRandom() # Random number generator for this game
+        self.journal_id = None # The name of this game's journal, while it is in progress
+        self.journal_records = [] # Journal records that are still being added to, in the order they were started
+        self.journal_lock = None # Lock held while a command or timer of this game is being journaled
+        self.journal_holder = None # The journal record whose command or timer holds journal_lock
 
 
 
@@ -74,10 +184,24 @@ class Game(object):
         try:
             yesno = await self.bot.wait_for('message', check=check, timeout=10)
         except asyncio.TimeoutError:
+            self.journal_answer(False)
             return False # Guess not, then
+        self.journal_answer(yesno.content.lower().strip() == 'yes')
         return yesno.content.lower().strip() == 'yes'
 
 
+    @property
+    def clock(self):
+        # The GameClock this game waits on, which depends on whether its server has quick mode on
+        return self.bot.clocks.for_channel(self.main_channel)
+
+
+    async def dramatic_pause(self, delay=DRAMATIC_PAUSE):
+        # Pause for dramatic effect
+        async with self.main_channel.typing():
+            await self.clock.pause(delay)
+
+
     async def check_game(self, message):
         # Returns True if there is a game; else prints an error message and returns False
         if self.owner:
@@ -113,6 +237,63 @@ class Game(object):
         return False
 
 
+    async def send_dm(self, user, contents):
+        # Send a list of direct messages to a user, in order. Returns True on success,
+        # or False if the user could not be reached.
+        for content in contents:
+            delay = DM_RETRY_DELAY
+            for attempt in range(DM_RETRIES + 1):
+                try:
+                    await user.send(content)
+                    break
+                except discord.Forbidden:
+                    return False # They have DMs turned off; no point retrying
+                except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                    if isinstance(e, discord.HTTPException) and (e.status < 500):
+                        raise # Not a transient error
+                    if attempt == DM_RETRIES:
+                        traceback.print_exc()
+                        return False
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        return True
+
+
+    async def send_long(self, channel, text, summary, file_text, filename):
+        # Send text to a channel if it fits in a single message. If it doesn't, send the summary
+        # instead, with file_text attached as a file. Returns the message that was sent.
+        if len(text) <= MESSAGE_LIMIT:
+            return (await channel.send(text))
+        return (await channel.send(summary, file=discord.File(io.BytesIO(file_text.encode('utf-8')), filename)))
+
+
+    async def broadcast(self, messages):
+        # Send direct messages to a number of users concurrently. `messages` is a list of
+        # (user, content) pairs; messages to the same user are delivered in the order given.
+        # Returns the list of users who could not be reached, after reporting them using dm_failed().
+        queues = {}
+        for user, content in messages:
+            queues.setdefault(user.id, (user, []))[1].append(content)
+        semaphore = asyncio.Semaphore(DM_CONCURRENCY)
+        async def send(user, contents):
+            async with semaphore:
+                return (await self.send_dm(user, contents))
+        queues = list(queues.values())
+        results = await asyncio.gather(*[send(user, contents) for user, contents in queues])
+        failed = [user for (user, contents), result in zip(queues, results) if not result]
+        if failed:
+            await self.dm_failed(failed)
+        return failed
+
+
+    async def dm_failed(self, users):
+        # Called when direct messages could not be delivered to some users.
+        # Override if the game needs to do something more drastic about it.
+        if self.main_channel:
+            await self.main_channel.send('*Unable to send a direct message to %s. Please make sure you allow direct messages from server members.*' % \
+                                         ', '.join([user.mention for user in users]))
+
+
     def create_player(self, user):
         # Return a new Player object corresponding to the given user
         # Abstract method, override this!
@@ -121,9 +302,106 @@ class Game(object):
 
     def find_player(self, user):
         # Find the Player corresponding to the given user
-        for player in self.players:
-            if player.user == user:
-                return player
+        game, player = self.bot.dispatch.find_player(self.prefix, user)
+        if game is self:
+            return player
+
+
+    def add_player(self, player):
+        # Add a Player to the end of the list
+        self.players.append(player)
+        self.bot.dispatch.add_player(self, player)
+
+
+    def remove_player(self, player):
+        # Remove a Player from the game
+        self.players.remove(player)
+        self.bot.dispatch.remove_player(self, player)
+
+
+    async def journal_wait(self):
+        # Wait until no other command or timer of this game is being journaled, and take the journal
+        # lock. Commands and timers of a journaled game run one at a time, so that every random draw
+        # lands in the record of the command that made it, and replaying the records one after
+        # another does exactly what happened. Returns False (without the lock) if the game is not
+        # being journaled.
+        if not self.journal_id:
+            return False
+        if self.journal_lock is None:
+            self.journal_lock = asyncio.Lock()
+        await self.journal_lock.acquire()
+        if self.journal_id:
+            return True
+        self.journal_lock.release() # The game was closed while we were waiting
+        return False
+
+
+    def journal_release(self):
+        # Give up the journal lock without starting a record
+        self.journal_lock.release()
+
+
+    def journal_begin(self, kind, payload, held=False):
+        # Start a journal record for something that changes the state of the game. Random draws
+        # and yes/no answers are added to the most recently started record until journal_end()
+        # is called. If `held` is True, the caller has the journal lock from journal_wait(), and
+        # journal_end() gives it back. Returns None if this game is not being journaled.
+        if self.journal_id:
+            record = self.bot.journal.begin(self.journal_id, kind, payload)
+            self.journal_records.append(record)
+            self.random.draws = record.draws
+            if held:
+                self.journal_holder = record
+            return record
+
+
+    async def journal_message(self, kind, message):
+        # Start a journal record for something that was triggered by a message, once nothing
+        # else in this game is being journaled
+        if (await self.journal_wait()):
+            return self.journal_begin(kind, self.bot.journal.message_payload(message), True)
+
+
+    async def journal_command(self, message, command):
+        # Start a journal record for a command sent to this game, unless it can't change anything
+        if command.__name__ not in self.journal_skip:
+            return (await self.journal_message('cmd', message))
+
+
+    def journal_end(self, record):
+        # Finish a journal record, so that it can be written to disk
+        if record:
+            self.bot.journal.end(record)
+            self.journal_records = [r for r in self.journal_records if r is not record]
+            self.random.draws = (self.journal_records[-1].draws if self.journal_records else None)
+            if record is self.journal_holder:
+                self.journal_holder = None
+                self.journal_release()
+
+
+    def journal_answer(self, answer):
+        # Add the answer to a yes/no question to the journal
+        if self.journal_records:
+            self.journal_records[-1].answers.append(answer)
+
+
+    def save_state(self):
+        # Return a dict of the attributes to be saved when the bot takes a snapshot.
+        # Override if the game keeps state that needs special treatment.
+        return dict([(key, value) for key, value in vars(self).items() if key not in self.transient])
+
+
+    def load_state(self, state):
+        # Restore the attributes saved by save_state()
+        self.__dict__.update(state)
+
+
+    async def resume(self):
+        # Called after the game has been restored from a snapshot, to let everyone know where things stand
+        await self.main_channel.send('*The game of %s has been restored after a restart.*' % self.name)
+        poke = self.cmd_lookup.get('poke')
+        if self.running and poke:
+            await poke(types.SimpleNamespace(channel=self.main_channel, author=self.owner.user, content='%s poke' % self.prefix))
 
 
 
@@ -151,24 +429,20 @@ class Game(object):
             await message.channel.send('Cannot create a game within a DM. Please try again using a public channel.')
             return
         # Check if there's another game of the same type as this one in the same channel
-        for game in self.bot.games:
-            if game.prefix == self.prefix:
-                if game.main_channel == message.channel:
-                    if game.owner.user != message.author:
-                        await message.channel.send('A game of %s is currently being played in this channel. Please wait for it to finish, or ask %s to cancel it.' % (self.name, game.owner.user.mention))
-                        return
-                    if not (await self.askyesno('You have already created a game of %s in this channel. Do you want to cancel it and start a new one?' % self.name, message.author, message.channel)):
-                        return
-                    if game.owner:
-                        await game.main_channel.send('%s has canceled the currently active game of %s.' % (message.author.mention, self.name))
-                        game.close()
-                    break
+        game = self.bot.dispatch.game_in_channel(self.prefix, message.channel)
+        if game:
+            if game.owner.user != message.author:
+                await message.channel.send('A game of %s is currently being played in this channel. Please wait for it to finish, or ask %s to cancel it.' % (self.name, game.owner.user.mention))
+                return
+            if not (await self.askyesno('You have already created a game of %s in this channel. Do you want to cancel it and start a new one?' % self.name, message.author, message.channel)):
+                return
+            if game.owner:
+                await game.main_channel.send('%s has canceled the currently active game of %s.' % (message.author.mention, self.name))
+                game.close()
         # Check if this player is already playing another game of the same type as this one
-        for game in self.bot.games:
-            if game.prefix == self.prefix:
-                if game.find_player(message.author):
-                    await message.channel.send('You are already playing a game of %s, so you cannot create another one.' % self.name)
-                    return
+        if self.bot.dispatch.find_player(self.prefix, message.author)[0]:
+            await message.channel.send('You are already playing a game of %s, so you cannot create another one.' % self.name)
+            return
         # Make sure we're allowed to DM this user -- thanks to cwu
         # for breaking this :|
         try:
@@ -176,20 +450,29 @@ class Game(object):
         except discord.Forbidden:
             await message.channel.send('You cannot create a game since the bot is unable to direct message you.')
             return
-        if self.owner:
-            # Create a new game
+        if self.owner or (self not in self.bot.dispatch):
+            # Create a new game (this one may also have ended and been removed while we were waiting)
             game = self.__class__(self.bot)
-            self.bot.games.append(game)
+            await game.setup() # Before it is added, so nobody else can pick it up while it has no owner
+            self.bot.add_game(game)
         else:
             # Reuse this one
             game = self
         # Set up the game
         game.owner = game.create_player(message.author)
         game.running = False
-        game.players = [game.owner] # List of Player objects in the game, in order
+        game.players = [] # List of Player objects in the game, in order
+        game.add_player(game.owner)
         game.main_channel = message.channel
+        self.bot.dispatch.update(game)
         game.votekicks = set() # List of people who have requested that the game be canceled due to an unresponsive owner
-        await game.create(message)
+        if self.bot.journal:
+            game.journal_id = self.bot.journal.open(game)
+        record = (await game.journal_message('create', message))
+        try:
+            await game.create(message)
+        finally:
+            game.journal_end(record)
         # Make a public announcement
         await game.main_channel.send('%s has just created an game of %s. To join, simply type "%s join".' % (message.author.mention, game.name, game.prefix))
         # Ping the #game-talk channel too if it's not too soon to do that
@@ -203,7 +486,7 @@ class Game(object):
                         self.bot.last_ping[id] = now
                         await game.bot.ping_channels[id].send('%s: a game of %s has been created in %s!' % (role.mention, game.name, game.main_channel.mention))
         # Start the timer
-        game.starting_timer_task = asyncio.create_task(game.starting_timer())
+        game.starting_timer_handle = game.schedule(STARTING_DELAY, game.starting_timer, tag='starting')
 
 
 
@@ -211,35 +494,72 @@ class Game(object):
         # Reset the game state
         self.owner = None
         self.running = False
+        for player in self.players:
+            self.bot.dispatch.remove_player(self, player)
         self.players = []
         self.main_channel = None
-        self.starting_timer_task = None
+        self.bot.dispatch.update(self)
+        self.cancel_starting_timer()
         self.unmute_all()
+        if self.journal_id:
+            self.journal_end(self.journal_begin('close', None))
+            self.bot.journal.finish(self.journal_id)
+            self.journal_id = None
         # Remove this game from the list if there's another one like it
-        for game in self.bot.games:
-            if (game.prefix == self.prefix) and (game is not self):
-                self.bot.games.remove(self)
-                break
+        if self.bot.dispatch.count(self.prefix) > 1:
+            self.bot.remove_game(self)
 
 
 
     async def starting_timer(self):
-        # Start a very long timer to cancel the game after a certain amount (20 minutes) of delay between creation and start time
-        await asyncio.sleep(STARTING_DELAY)
-        if self.owner and not self.running:
+        # Called by the scheduler to cancel the game after a certain amount (20 minutes) of delay between creation and start time
+        self.starting_timer_handle = None
+        owner = self.owner
+        if owner and not self.running:
+            held = (await self.journal_wait())
+            if self.running or (self.owner is not owner):
+                # The game was started or closed while we were waiting
+                if held:
+                    self.journal_release()
+                return
             channel = self.main_channel
+            self.journal_end(self.journal_begin('timer', 'starting_timer', held))
             self.close()
             await channel.send('*The current game of %s has timed out without starting. It has now been canceled.*' % self.name)
 
 
     def cancel_starting_timer(self):
         # Cancel the starting timer
-        if self.running:
-            # Stop the timer
-            if self.starting_timer_task:
-                if not self.starting_timer_task.done():
-                    self.starting_timer_task.cancel()
-                self.starting_timer_task = None
+        if self.starting_timer_handle:
+            self.bot.scheduler.cancel(self.starting_timer_handle)
+            self.starting_timer_handle = None
+
+
+    def schedule(self, delay, callback, *args, tag=None):
+        # Call `callback(*args)` after `delay` seconds on this game's clock. It counts towards
+        # `pending` while it runs, like a command, so snapshots don't catch the game halfway through.
+        return self.clock.schedule(delay, self.run_pending, callback, args, tag=tag)
+
+
+    async def run_pending(self, callback, args):
+        # Run a timer callback that may change the state of the game
+        self.pending += 1
+        try:
+            result = callback(*args)
+            if asyncio.iscoroutine(result):
+                await result
+        finally:
+            self.pending -= 1
+
+
+    def delete_later(self, message, delay):
+        # Delete a message after a certain time
+        async def delete():
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass # Already deleted
+        return self.clock.schedule(delay, delete, tag='delete')
         
         
                     
@@ -269,11 +589,9 @@ class Game(object):
                 await message.channel.send('You are already part of this game.')
                 return
             # Check if this player is already playing another game of the same type as this one
-            for game in self.bot.games:
-                if game.prefix == self.prefix:
-                    if game.find_player(message.author):
-                        await message.channel.send('You are already playing a game of %s, so you cannot join another one.' % self.name)
-                        return
+            if self.bot.dispatch.find_player(self.prefix, message.author)[0]:
+                await message.channel.send('You are already playing a game of %s, so you cannot join another one.' % self.name)
+                return
             # Make sure we're allowed to DM this user -- thanks to cwu
             # for breaking this :|
             try:
@@ -282,7 +600,7 @@ class Game(object):
                 await message.channel.send('You cannot join this game since the bot is unable to direct message you.')
                 return
             # Add the player
-            self.players.append(self.create_player(message.author))
+            self.add_player(self.create_player(message.author))
             # Make a public announcement
             await self.main_channel.send('%s has joined the game of %s.' % (message.author.mention, self.name))
 
@@ -301,7 +619,7 @@ class Game(object):
                 await message.channel.send('You are not part of this game.')
                 return
             # Remove the player
-            self.players.remove(player)
+            self.remove_player(player)
             # Make a public announcement
             await self.main_channel.send('%s has left the game of %s.' % (message.author.mention, self.name))
 
@@ -330,7 +648,14 @@ class Game(object):
             if len(message.channel_mentions) != 1:
                 await message.channel.send('Syntax: %s move [mention channel]' % self.prefix)
                 return
-            self.main_channel = message.channel_mentions[0]
+            channel = message.channel_mentions[0]
+            game = self.bot.dispatch.game_in_channel(self.prefix, channel)
+            if game and (game is not self):
+                await message.channel.send('A game of %s is already being played in %s.' % (self.name, channel.mention))
+                return
+            self.main_channel = channel
+            self.bot.dispatch.update(self)
+            self.move_mutes()
             await self.main_channel.send('The game of %s has moved to %s.' % (self.name, self.main_channel.mention))
             
 
@@ -365,6 +690,29 @@ class Game(object):
         '''I'm guessing you've figured out by now what this one does'''
         await message.author.send(self.help)
 
+    async def gb_stats(self, message):
+        '''Show which commands have been taking the longest'''
+        await message.channel.send(self.bot.stats.summary(guild=message.guild))
+
+    async def gb_quick(self, message):
+        '''Turn quick mode (shorter dramatic pauses) on or off for this server (needs the Manage Server permission)'''
+        if message.channel.type == discord.ChannelType.private:
+            await message.channel.send('Quick mode can only be changed from a server channel.')
+            return
+        words = message.content.lower().split()
+        if len(words) == 2:
+            quick = (message.guild.id in self.bot.clocks.quick_guilds)
+            await message.channel.send('Quick mode is currently **%s** for this server.' % ('on' if quick else 'off'))
+        elif (len(words) == 3) and (words[2] in ('on', 'off')):
+            permissions = getattr(message.author, 'guild_permissions', None)
+            if not (permissions and permissions.manage_guild):
+                await message.channel.send('Error: only someone who can manage this server can change quick mode.')
+                return
+            await self.bot.clocks.set_quick(message.guild, words[2] == 'on')
+            await message.channel.send('Quick mode has been turned **%s** for this server.' % words[2])
+        else:
+            await message.channel.send('Syntax: %s quick [on/off]' % self.prefix)
+
 
     async def gb_roll(self, message):
         '''Roll some number of die'''
@@ -434,17 +782,36 @@ class Game(object):
     # Muting
 
     def mute(self, player):
-        if (player.user, self) not in self.bot.muted:
-            self.bot.muted.append((player.user, self))
+        users = self.bot.muted_users.setdefault(self, {})
+        if player.user.id not in users:
+            key = users[player.user.id] = (self.main_channel.id, player.user.id)
+            self.bot.muted.setdefault(key, set()).add(self)
 
     def unmute(self, player):
-        if (player.user, self) in self.bot.muted:
-            self.bot.muted.remove((player.user, self))
+        users = self.bot.muted_users.get(self)
+        if users and (player.user.id in users):
+            self.release_mute(users.pop(player.user.id))
 
     def unmute_all(self):
-        for user, game in self.bot.muted[:]:
-            if game == self:
-                self.bot.muted.remove((user, game))
+        for key in self.bot.muted_users.pop(self, {}).values():
+            self.release_mute(key)
+
+    def release_mute(self, key):
+        # Remove this game from the given entry of the mute registry
+        games = self.bot.muted.get(key)
+        if games:
+            games.discard(self)
+            if not games:
+                del self.bot.muted[key]
+
+    def move_mutes(self):
+        # Update the mute registry after the main channel has changed
+        users = self.bot.muted_users.get(self)
+        if users:
+            for user_id, key in list(users.items()):
+                self.release_mute(key)
+                key = users[user_id] = (self.main_channel.id, user_id)
+                self.bot.muted.setdefault(key, set()).add(self)
 
 
 
@@ -0,0 +1,357 @@
+# Append-only journal of everything that happens in each game
+# Matthew Kroesche
+
+import recordclass
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+
+from .game import DATA_DIR
+from .fake import FakeBot, FakeChannel
+from .snapshot import Snapshots
+
+
+
+JOURNAL_DIR = os.path.join(DATA_DIR, 'journal') # Each game gets its own directory of journal segments in here
+JOURNAL_FLUSH_DELAY = 1 # Number of seconds to collect finished records before writing them out together
+JOURNAL_SEGMENT_RECORDS = 500 # Number of records in each segment of a journal before a new segment is started
+
+
+
+Record = recordclass.recordclass('Record', 'journal_id kind time payload draws answers done')
+# journal_id: the name of the journal this record belongs to
+# kind: 'create' or 'cmd' (payload is the message), 'timer' (payload is the name of the method
+#       the timer calls) or 'close'
+# time: the time the record was started
+# payload: depends on the kind of record
+# draws: the random draws made while the record was open
+# answers: the answers to yes/no questions asked while the record was open
+# done: True once nothing more will be added to the record
+
+
+
+
+
+def segment_path(journal_id, segment):
+    return os.path.join(JOURNAL_DIR, journal_id, '%06d.log' % segment)
+
+
+def snapshot_path(journal_id):
+    return os.path.join(JOURNAL_DIR, journal_id, 'snapshot.json')
+
+
+def list_segments(journal_id):
+    # Return the numbers of the segments of a journal that are on disk, in order
+    try:
+        names = os.listdir(os.path.join(JOURNAL_DIR, journal_id))
+    except FileNotFoundError:
+        return []
+    return sorted([int(name[:-4]) for name in names if name.endswith('.log')])
+
+
+def read_journal(journal_id, last_segment=None):
+    # Read a journal from disk. Returns (snapshot, records), where snapshot is the result of the
+    # last compaction (or None) and records is the list of records since then, up to and
+    # including the segment `last_segment` (or all of them).
+    try:
+        with open(snapshot_path(journal_id), encoding='utf-8') as o:
+            snapshot = json.load(o)
+    except FileNotFoundError:
+        snapshot = None
+    first_segment = (snapshot['segment'] + 1 if snapshot else 0)
+    records = []
+    for segment in list_segments(journal_id):
+        if (segment < first_segment) or ((last_segment is not None) and (segment > last_segment)):
+            continue
+        with open(segment_path(journal_id, segment), encoding='utf-8') as o:
+            for line in o:
+                if line.strip():
+                    records.append(json.loads(line))
+    return snapshot, records
+
+
+
+
+
+
+##### Replaying journals #####
+
+
+async def replay(cls, snapshot, records):
+    # Rebuild a game of the given class from its journal, without connecting to Discord.
+    # Returns the FakeBot it was replayed on and the game (which may have been closed by the end).
+    if snapshot:
+        guild_id = snapshot['guild']
+    else:
+        guild_id = next((record[2][2] for record in records if record[0] == 'create'), 0)
+    # The fake server gets a negative id so that it never shares anything with a real one
+    bot = FakeBot(-guild_id, timers=False)
+    game = cls(bot)
+    bot.add_game(game)
+    await game.setup()
+    if snapshot and snapshot['game']:
+        game = await Snapshots(bot).restore_game(snapshot['game'])
+        game.journal_id = None # Don't journal the replay itself
+    for record in records:
+        await replay_record(bot, game, record)
+    return bot, game
+
+
+def replay_message(bot, payload):
+    # Rebuild a message from the payload made by Journal.message_payload()
+    author_id, channel_id, guild_id, content, mention_ids, channel_mention_ids = payload
+    return bot.message(author_id, channel_id, content, mention_ids, channel_mention_ids)
+
+
+async def replay_record(bot, game, record):
+    # Replay a single journal record
+    kind, t, payload, draws, answers = record + [None, [], []][len(record) - 2:] # Put back what Journal.encode() left off
+    game.random.replay = iter(draws)
+    bot.answers = iter(answers)
+    try:
+        if kind == 'create':
+            await game.gb_create(replay_message(bot, payload))
+        elif kind == 'cmd':
+            message = replay_message(bot, payload)
+            words = message.content.lower().split(None, 2)
+            command = game.cmd_lookup.get(words[1] if len(words) > 1 else None)
+            if command:
+                await command(message)
+        elif kind == 'timer':
+            await getattr(game, payload)()
+        elif kind == 'close':
+            if game.owner:
+                game.close()
+    finally:
+        game.random.replay = None
+
+
+
+
+
+
+##### Journal writer #####
+
+
+class Journal(object):
+
+    # Collects journal records from every game, and writes them out in batches from an executor
+    # thread, so that command handlers never wait on the disk. Each batch is fsynced once per
+    # journal it touches. Journals are split into segments; each time a segment fills up, all
+    # the finished segments of that journal are folded into a snapshot in the background.
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.pending = [] # Records that have not been written yet, in the order they were started
+        self.segments = {} # Map from each journal id to the [segment number, number of records] being written to
+        self.counter = itertools.count()
+        self.handle = None # Scheduler Timer for the next flush
+        self.writing = False # True while a batch is being written
+        self.finished = set() # Ids of journals whose games are over
+        self.to_compact = {} # Map from journal ids to the last segment that needs to be compacted
+        self.compacting = None # Task doing compaction, if any
+        self.records_written = 0
+        self.batches_written = 0
+        self.write_time = 0.0 # Seconds spent writing the last batch
+
+
+    def open(self, game):
+        # Start a new journal for a game, and return its id
+        return '%s-%d-%d' % (game.prefix, int(time.time() * 1000), next(self.counter))
+
+
+    def message_payload(self, message):
+        # Return the parts of a message that a command can look at
+        guild_id = (message.guild.id if message.guild else 0)
+        channel_id = (message.channel.id if guild_id else 0) # 0 for a direct message
+        return [message.author.id, channel_id, guild_id, message.content,
+                [user.id for user in message.mentions], [channel.id for channel in message.channel_mentions]]
+
+
+    def begin(self, journal_id, kind, payload):
+        record = Record(journal_id, kind, round(time.time(), 3), payload, [], [], False)
+        self.pending.append(record)
+        return record
+
+
+    def end(self, record):
+        record.done = True
+        if self.handle is None:
+            self.handle = self.bot.scheduler.schedule(JOURNAL_FLUSH_DELAY, self.flush, tag='journal')
+
+
+    def finish(self, journal_id):
+        # Called when a game is over, so we can stop keeping track of where its journal is up to
+        self.finished.add(journal_id)
+
+
+    def take(self):
+        # Remove and return the records that are ready to be written. A record that is still
+        # open holds back the later records of the same journal, so that each journal stays in order.
+        ready = []
+        waiting = []
+        blocked = set()
+        for record in self.pending:
+            if record.done and (record.journal_id not in blocked):
+                ready.append(record)
+            else:
+                waiting.append(record)
+                blocked.add(record.journal_id)
+        self.pending = waiting
+        return ready
+
+
+    def encode(self, record):
+        # Return the line written to the journal for a record, leaving off empty lists at the end
+        data = [record.kind, record.time, record.payload, record.draws, record.answers]
+        while not data[-1]:
+            data.pop()
+        return json.dumps(data, separators=(',', ':'))
+
+
+    async def flush(self):
+        # Write out every record that is ready
+        self.handle = None
+        if self.writing:
+            self.handle = self.bot.scheduler.schedule(JOURNAL_FLUSH_DELAY, self.flush, tag='journal')
+            return
+        batch = self.take()
+        if not batch:
+            return
+        self.writing = True
+        try:
+            full = await asyncio.get_event_loop().run_in_executor(None, self.write, batch)
+        finally:
+            self.writing = False
+        for journal_id, segment in full:
+            self.to_compact[journal_id] = segment
+        for journal_id in list(self.finished):
+            if not any([record.journal_id == journal_id for record in self.pending]):
+                self.finished.discard(journal_id)
+                self.segments.pop(journal_id, None)
+        if self.to_compact and not self.compacting:
+            self.compacting = asyncio.ensure_future(self.compact_all())
+
+
+    def flush_now(self):
+        # Write out everything right away, even records that are still open. Used when the bot is shutting down.
+        for record in self.pending:
+            record.done = True
+        batch = self.take()
+        if batch:
+            self.write(batch)
+
+
+    def write(self, batch):
+        # Append a batch of records to the journals on disk. Safe to call from an executor thread.
+        # Returns a list of (journal id, segment number) for each segment that was filled up.
+        start = time.perf_counter()
+        journals = {}
+        for record in batch:
+            journals.setdefault(record.journal_id, []).append(self.encode(record))
+        full = []
+        for journal_id, lines in journals.items():
+            position = self.segments.get(journal_id)
+            if position is None:
+                position = self.segments[journal_id] = self.find_position(journal_id)
+            while lines:
+                n = JOURNAL_SEGMENT_RECORDS - position[1]
+                with open(segment_path(journal_id, position[0]), 'a', encoding='utf-8') as o:
+                    o.write(''.join([line + '\n' for line in lines[:n]]))
+                    o.flush()
+                    os.fsync(o.fileno())
+                position[1] += len(lines[:n])
+                del lines[:n]
+                if position[1] == JOURNAL_SEGMENT_RECORDS:
+                    full.append((journal_id, position[0]))
+                    position[0] += 1
+                    position[1] = 0
+        self.records_written += len(batch)
+        self.batches_written += 1
+        self.write_time = time.perf_counter() - start
+        return full
+
+
+    def find_position(self, journal_id):
+        # Figure out where to carry on writing a journal, which may have been started
+        # before the bot was restarted
+        os.makedirs(os.path.join(JOURNAL_DIR, journal_id), exist_ok=True)
+        segments = list_segments(journal_id)
+        if not segments:
+            return [0, 0]
+        with open(segment_path(journal_id, segments[-1]), encoding='utf-8') as o:
+            count = sum([1 for line in o if line.strip()])
+        if count >= JOURNAL_SEGMENT_RECORDS:
+            return [segments[-1] + 1, 0]
+        return [segments[-1], count]
+
+
+
+    async def compact_all(self):
+        # Compact every journal that has filled up a segment, one at a time
+        try:
+            while self.to_compact:
+                journal_id, segment = self.to_compact.popitem()
+                try:
+                    await self.compact(journal_id, segment)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            self.compacting = None
+
+
+    async def compact(self, journal_id, last_segment):
+        # Fold the segments of a journal up to and including `last_segment` into its snapshot
+        loop = asyncio.get_event_loop()
+        prefix = journal_id.split('-', 1)[0]
+        cls = next((type(game) for game in self.bot.games if game.prefix == prefix), None)
+        if cls is None:
+            return
+        snapshot, records = await loop.run_in_executor(None, read_journal, journal_id, last_segment)
+        if snapshot and (snapshot['segment'] >= last_segment):
+            return
+        guild_id = (snapshot['guild'] if snapshot else next((r[2][2] for r in records if r[0] == 'create'), 0))
+        bot, game = await replay(cls, snapshot, records)
+        state = (Snapshots(bot).encode_game(game) if game.owner else None)
+        if game.owner:
+            game.close() # Stop anything the replayed game has left running
+        await loop.run_in_executor(None, self.write_snapshot, journal_id,
+                                   {'segment': last_segment, 'guild': guild_id, 'game': state})
+
+
+    def write_snapshot(self, journal_id, snapshot):
+        # Atomically replace the snapshot of a journal, then delete the segments it covers
+        filename = snapshot_path(journal_id)
+        with open(filename + '.tmp', 'w', encoding='utf-8') as o:
+            json.dump(snapshot, o, separators=(',', ':'))
+            o.flush()
+            os.fsync(o.fileno())
+        os.replace(filename + '.tmp', filename)
+        for segment in list_segments(journal_id):
+            if segment <= snapshot['segment']:
+                os.remove(segment_path(journal_id, segment))
+
+
+
+
+
+
+if __name__ == '__main__':
+    # Replay a journal and print out everything the game said
+    # Usage: python -m GameBot.journal [journal id]
+    from GameBot import games
+    journal_id = sys.argv[1]
+    classes = dict([(cls.prefix, cls) for cls in games])
+    async def main():
+        snapshot, records = read_journal(journal_id)
+        start = time.perf_counter()
+        bot, game = await replay(classes[journal_id.split('-', 1)[0]], snapshot, records)
+        elapsed = time.perf_counter() - start
+        for recipient, content in bot.transcript:
+            print('[%s%s] %s' % ('#' if isinstance(recipient, FakeChannel) else '@', recipient.name, content))
+        print('*** Replayed %d records in %.1f ms ***' % (len(records), elapsed * 1000))
+    asyncio.get_event_loop().run_until_complete(main())
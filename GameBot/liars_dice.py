@@ -3,17 +3,38 @@
 
 import discord
 import recordclass
-import random
 import asyncio
+import datetime
+import random
 
-from .game import Game
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+from .game import Game, MESSAGE_LIMIT, split_message
+from .dice_odds import hand_chance, legal_pass_chance, format_chance
+from .dice_strategy import strategy_for
 
-Player = recordclass.recordclass('Player', 'user dice bid passed')
+
+Player = recordclass.recordclass('Player', 'user dice bid passed n_dice')
 # user: the discord.User controlling this player.
-# dice: the list of die rolls of this player
+# dice: how many of this player's dice are showing each value; dice[0] is the number of 1s, and so on
 # bid: either None or a 2-tuple (number, value)
 # passed: boolean indicating whether the player has passed this round
+# n_dice: the number of dice this player has
+
+Situation = recordclass.recordclass('Situation', 'dice others n_sides ones_wild bid can_challenge can_spot spot_reward can_pass pass_two suspect')
+# Everything a computer player looks at to decide on its move.
+# dice: how many of its own dice are showing each value
+# others: (number of dice, passed) for every other player
+# n_sides, ones_wild: the game settings
+# bid: the current bid, or None if nobody has bid yet this round
+# can_challenge, can_spot: whether the current bid can be challenged, or spotted
+# spot_reward: True if a correct spot call does more than just avoid losing a die
+# can_pass: True if the computer is allowed to pass right now, and its dice make that a legal pass
+# pass_two: True if passing is only legal with exactly two dice
+# suspect: the number of dice held by the player whose pass can be challenged, if there is one
 
 PASS_NONE   = 0 # Passing not allowed
 PASS_TWO    = 1 # Passing allowed if there are exactly two dice showing different values
@@ -30,6 +51,213 @@ PASS_DEFAULT = PASS_UNIQUE
 SPOT_DEFAULT = SPOT_PENALIZE
 
 RESULT_DELAY = 10 # Number of seconds before dice messages are deleted
+DICE_LIST_MAX = 10 # Hands with more dice than this are shown as counts, like "1×12 2×9 3", instead of one number per die
+ODDS_RAISES = 5 # Number of raises listed by "ld odds"
+
+# How computer players play
+MAX_COMPUTERS = 8 # Most computer players that can be added to one game
+COMPUTER_DELAY = 2 # Number of seconds a computer player waits before making its move
+RAISE_CANDIDATES = 4 # Number of raises a computer player works out the odds of exactly, out of the ones it holds the most dice for
+OPEN_CONFIDENCE = 0.6 # An opening bid is as high as a computer player can go while still being at least this sure of it
+RAISE_RISK = 0.8 # Fraction of the chance that a raise is wrong that counts against it, since it might never be challenged
+SPOT_BONUS = 0.15 # Risk taken off calling spot when a correct call does more than just avoid losing a die
+PASS_THRESHOLD = 0.3 # A computer player that can pass does so if every other move has a bigger risk of losing a die than this
+BLUFF_CHANCE = 0.1 # Chance of raising on a random value instead of the best one
+JITTER = 0.05 # Largest amount of randomness added to the risk of each move
+
+DICE_RANDOM = (numpy.random.default_rng() if numpy else random.Random()) # Where dice rolls come from. The results are journaled, so replays don't need it.
+COMPUTER_RANDOM = random.Random() # Seeds for computer players' decisions. Their moves are journaled as commands, so replays don't need it either.
+
+
+
+
+
+def roll_dice(n_dice, n_sides):
+    # Roll the dice for every player at once. `n_dice` is the list of how many dice each player has;
+    # returns a list with the number of dice showing each value for each player.
+    if numpy:
+        return DICE_RANDOM.multinomial(n_dice, [1.0 / n_sides] * n_sides).tolist()
+    rolls = []
+    for n in n_dice:
+        counts = [0] * n_sides
+        for value in DICE_RANDOM.choices(range(n_sides), k=n):
+            counts[value] += 1
+        rolls.append(counts)
+    return rolls
+
+
+def dice_faces(counts):
+    # Return the list of values showing on a set of dice, in order
+    faces = []
+    for value, count in enumerate(counts, 1):
+        faces.extend([value] * count)
+    return faces
+
+
+def format_dice(counts):
+    # Return the text showing a set of dice. Large hands are run-length encoded, so the
+    # length depends on the number of sides rather than the number of dice.
+    if sum(counts) <= DICE_LIST_MAX:
+        return ' '.join(map(str, dice_faces(counts)))
+    return ' '.join([('%d×%d' % (value, count) if count > 1 else str(value)) for value, count in enumerate(counts, 1) if count])
+
+
+def bid_rank(bid, ones_wild):
+    # Return a key that puts bids in order, so a raise must have a higher rank than the current bid.
+    # When ones are wild, bids on ones are worth twice as much.
+    num, value = bid
+    if (value == 1) and ones_wild:
+        return 2*num, value
+    return num, value
+
+
+def smallest_raise(bid, value, ones_wild):
+    # Return the smallest number of dice showing `value` that would raise `bid` (or open the bidding, if it is None)
+    if bid is None:
+        return 1
+    current = bid_rank(bid, ones_wild)
+    num = max(current[0] // (2 if (value == 1) and ones_wild else 1), 1)
+    while bid_rank((num, value), ones_wild) <= current:
+        num += 1
+    return num
+
+
+
+
+
+
+##### Computer players #####
+
+
+class ComputerUser(recordclass.recordclass('ComputerUserRecord', 'id name')):
+
+    # Stands in for a discord.User for a computer player. It is a record, so snapshots keep it
+    # as it is instead of looking it up on Discord, and it counts as equal to anything with the
+    # same id, so that the fake users in a journal replay are recognized as it.
+
+    __slots__ = ()
+    bot = True
+
+    @property
+    def mention(self):
+        return '**%s**' % self.name
+
+    @property
+    def display_name(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    async def send(self, content=None, embed=None, file=None):
+        # Computer players can already see their own dice
+        pass
+
+
+
+def is_computer(user):
+    return isinstance(user, ComputerUser)
+
+
+
+
+class ComputerMessage(object):
+
+    # A command made by a computer player, handed to the bot as if it had been posted in the game's channel
+
+    def __init__(self, author, channel, content):
+        self.id = 0
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.mentions = []
+        self.channel_mentions = []
+        self.created_at = datetime.datetime.utcnow()
+
+    async def delete(self):
+        pass
+
+
+
+
+def decide(situation, seed):
+    # Choose a computer player's move, and return the command that makes it. Every move is weighed
+    # by its risk of losing a die, worked out exactly from the computer's own dice. If there is a
+    # solved strategy table for the game, it chooses between raising and challenging instead, and
+    # only passing, calling spot or challenging a pass can override it. This only looks at the Situation it is given,
+    # so it is safe to run on an executor thread.
+    s = situation
+    rng = random.Random(seed)
+    def chance(bid, exact=False):
+        return hand_chance(bid, s.dice, s.others, s.n_sides, s.ones_wild, exact)
+    options = [] # (risk of losing a die, command)
+    if s.bid and s.can_spot:
+        options.append((1.0 - chance(s.bid, True) - (SPOT_BONUS if s.spot_reward else 0.0), 'ld spot'))
+    if s.suspect is not None:
+        legal = (0.0 if s.pass_two and (s.suspect != 2) else legal_pass_chance(s.suspect, s.n_sides, s.ones_wild))
+        options.append((legal, 'ld liarpass'))
+    move = strategy_move(s, rng)
+    if move:
+        options.append(((1.0 - chance(move)) * RAISE_RISK, 'ld bid %d %d' % move))
+    elif move is not None:
+        options.append((chance(s.bid), 'ld liar'))
+    else:
+        options.extend(odds_moves(s, rng, chance))
+    risk, command = min([(risk + rng.random() * JITTER, command) for risk, command in options])
+    if s.can_pass and (risk > PASS_THRESHOLD):
+        return 'ld pass'
+    return command
+
+
+
+def strategy_move(s, rng):
+    # Return the move a solved strategy table picks for a Situation: a bid, () for a challenge, or
+    # None if there is no table for it
+    moves = strategy_for(s.dice, s.others, s.n_sides, s.ones_wild, s.bid)
+    if moves is None:
+        return None
+    if not s.can_challenge:
+        moves = [(p, move) for p, move in moves if move]
+    if not any([p for p, move in moves]):
+        return None
+    move = rng.choices([move for p, move in moves], [p for p, move in moves])[0]
+    return (move or ())
+
+
+
+def odds_moves(s, rng, chance):
+    # Return the (risk, command) of challenging, and of the best raise, going by the odds alone
+    options = []
+    if s.bid and s.can_challenge:
+        options.append((chance(s.bid), 'ld liar'))
+    # Raise on whichever value we hold the most dice towards, or now and then on any value at all
+    raises = [(smallest_raise(s.bid, value, s.ones_wild), value) for value in range(1, s.n_sides + 1)]
+    if rng.random() < BLUFF_CHANCE:
+        candidates = [rng.choice(raises)]
+    else:
+        def needed(bid):
+            num, value = bid
+            return num - s.dice[value - 1] - (s.dice[0] if s.ones_wild and (value != 1) else 0)
+        candidates = sorted(raises, key=needed)[:RAISE_CANDIDATES]
+    best, best_chance = max([(bid, chance(bid)) for bid in candidates], key=lambda c: (c[1], rng.random()))
+    if s.bid is None:
+        # Open as high as we can while staying fairly sure of it
+        num, value = best
+        low, high = num, sum([n for n, passed in s.others]) + sum(s.dice)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if chance((mid, value)) >= OPEN_CONFIDENCE:
+                low = mid
+            else:
+                high = mid - 1
+        best = (max(low, num), value)
+        best_chance = chance(best)
+    options.append(((1.0 - best_chance) * RAISE_RISK, 'ld bid %d %d' % best))
+    return options
 
 
 
@@ -41,9 +269,12 @@ class LiarsDice(Game):
 
     name = 'Liar\'s Dice'
     prefix = 'ld'
+    journal_skip = Game.journal_skip + ('ld_odds',)
+    transient = Game.transient + ('computer_handle',)
+    computer_handle = None # Scheduler Timer for the current computer player's move, kept until the move is sent
 
     def create_player(self, user):
-        return Player(user, [], None, False)
+        return Player(user, [], None, False, 0)
 
 
     async def create(self, message):
@@ -56,9 +287,21 @@ class LiarsDice(Game):
         self.current = None           # The Player whose turn it is currently, if any
         self.last_bidder = None       # The last Player to make an actual bid, if any
         self.passed_players = []      # The Players who have passed since the last actual bid was made
+        self.totals = []              # How many dice on the whole table are showing each value this round
         
 
 
+    def load_state(self, state):
+        Game.load_state(self, state)
+        if self.running and any([p.n_dice is None for p in self.players]):
+            # Saved before dice were kept as counts, when they were a list of the values showing
+            for p in self.players:
+                faces, p.dice, p.n_dice = p.dice, [0] * self.n_sides, len(p.dice)
+                for value in faces:
+                    p.dice[value - 1] += 1
+            self.count_totals()
+
+
     async def gb_leave(self, message):
         '''Leave a game'''
         # Override to allow leaving the game after it has started
@@ -78,8 +321,16 @@ class LiarsDice(Game):
                     return
             if player in self.players:
                 index = self.players.index(player)
-                # Remove the player
-                self.players.remove(player)
+                # Remove the player, and their dice
+                self.remove_player(player)
+                if self.running:
+                    self.totals = [total - count for total, count in zip(self.totals, player.dice)]
+                if player in self.passed_players:
+                    self.passed_players.remove(player)
+                if player is self.last_bidder:
+                    # Their dice are gone, so their bid can't be challenged any more. Start the bidding over.
+                    self.last_bidder = None
+                    self.passed_players = []
                 # Make a public announcement
                 await self.main_channel.send('%s has left the game of %s.' % (message.author.mention, self.name))
                 if self.running:
@@ -87,7 +338,7 @@ class LiarsDice(Game):
                         channel = self.main_channel
                         self.close()
                         await channel.send('The game has been canceled because there are too few players.')
-                    elif player.user == self.current:
+                    elif (await self.check_humans()) and (player is self.current):
                         self.current = self.players[index % len(self.players)]
                         await self.ld_poke(message)
                     
@@ -239,6 +490,74 @@ class LiarsDice(Game):
 
 
 
+    async def ld_addbot(self, message):
+        '''Add a computer player to a game that has not yet started'''
+        if (await self.check_not_running(message)) and (await self.check_owner(message)):
+            taken = [p.user.id for p in self.players if is_computer(p.user)]
+            if len(taken) >= MAX_COMPUTERS:
+                await message.channel.send('Error: a game can have at most %d computer players.' % MAX_COMPUTERS)
+                return
+            # Computer players get negative ids, so they never clash with a real user, or with those in another channel
+            for k in range(1, MAX_COMPUTERS + 1):
+                user = ComputerUser(-(self.main_channel.id * 100 + k), 'Computer %d' % k)
+                if user.id not in taken:
+                    break
+            self.add_player(self.create_player(user))
+            await self.main_channel.send('%s has joined the game of %s.' % (user.mention, self.name))
+
+
+    async def ld_removebot(self, message):
+        '''Remove the most recently added computer player from a game that has not yet started'''
+        if (await self.check_not_running(message)) and (await self.check_owner(message)):
+            computers = [p for p in self.players if is_computer(p.user)]
+            if not computers:
+                await message.channel.send('Error: there are no computer players in this game.')
+                return
+            self.remove_player(computers[-1])
+            await self.main_channel.send('%s has left the game of %s.' % (computers[-1].user.mention, self.name))
+
+
+    def situation(self, player):
+        # Return a Situation holding everything a computer player can see, copied so that it can be
+        # looked at on another thread
+        bid = (self.last_bidder.bid if self.last_bidder else None)
+        suspect = (self.passed_players[-1] if self.passed_players else None)
+        can_pass = bool(self.pass_mode) and not (player.passed or self.pass_blocked(player)) and self.pass_legal(player)
+        return Situation(list(player.dice), self.others(player), self.n_sides, self.ones_wild, bid,
+                         (self.last_bidder is not None) and (self.last_bidder is not player),
+                         (bid is not None) and bool(self.spot_mode), bool(self.spot_mode & (SPOT_REWARD | SPOT_PENALIZE)),
+                         can_pass, not (self.pass_mode & PASS_UNIQUE),
+                         (suspect.n_dice if suspect and (suspect is not player) else None))
+
+
+    def computer_turn_soon(self):
+        # Give a computer player its turn in a moment, if it is a computer player's turn
+        if self.running and self.current and is_computer(self.current.user) and not self.computer_handle:
+            self.computer_handle = self.schedule(COMPUTER_DELAY, self.computer_turn, tag='computer')
+
+
+    async def computer_turn(self):
+        # Called by the scheduler to make a computer player's move. It is worked out on an executor
+        # thread, so that it never holds up anyone else's commands, and then sent to the bot like
+        # any other player's command, so it is checked, journaled and timed in the same way.
+        player = self.current
+        try:
+            if not (self.running and player and is_computer(player.user)):
+                return
+            situation = self.situation(player)
+            content = (await asyncio.get_event_loop().run_in_executor(None, decide, situation, COMPUTER_RANDOM.getrandbits(32)))
+        finally:
+            self.computer_handle = None
+        if not self.running:
+            return
+        if (self.current is not player) or (self.situation(player) != situation):
+            # Something changed while we were thinking, so think again
+            self.computer_turn_soon()
+            return
+        await self.bot.deliver(ComputerMessage(player.user, self.main_channel, content))
+
+
+
     async def ld_info(self, message):
         '''Print out the current game info'''
         if (await self.check_game(message)):
@@ -260,6 +579,7 @@ class LiarsDice(Game):
         if (await self.check_running(message)):
             if self.current:
                 await self.main_channel.send('*Currently waiting for %s to make a bid.*' % self.current.user.mention)
+                self.computer_turn_soon()
             else:
                 await self.main_channel.send('*Not currently waiting for anyone to make a decision.*')
 
@@ -273,55 +593,141 @@ class LiarsDice(Game):
         # Make a public announcement
         await self.main_channel.send('The game has now been started!')
         # Set up the game
-        random.seed() # Seed the random number generator
-        random.shuffle(self.players) # Randomize the play order
+        self.random.seed() # Seed the random number generator
+        self.random.shuffle(self.players) # Randomize the play order
         self.current = self.players[0]
         for p in self.players:
-            p.dice = [1] * self.n_dice_start
+            p.n_dice = self.n_dice_start
+            p.dice = [p.n_dice] + [0] * (self.n_sides - 1)
         await self.roll(message) # and let's get started!
 
 
+    def count_totals(self):
+        # Count up how many dice on the table are showing each value
+        self.totals = [sum(counts) for counts in zip(*[p.dice for p in self.players])]
+
+
     async def roll(self, message):
         self.last_bidder = None
         self.passed_players = []
-        for p in self.players:
-            p.dice = [random.randint(1, self.n_sides) for i in range(len(p.dice))]
-            p.dice.sort()
+        messages = []
+        rolls = self.random.external(roll_dice, [p.n_dice for p in self.players], self.n_sides)
+        for p, counts in zip(self.players, rolls):
+            p.dice = list(counts) # The rolls themselves are journaled, so don't change them
             p.bid = None
             p.passed = False
-            await p.user.send('Your dice rolls for this round:\n**%s**' % ' '.join(map(str, p.dice)))
+            header = 'Your dice rolls for this round:\n'
+            pieces = split_message(format_dice(p.dice), MESSAGE_LIMIT - len(header) - 4)
+            pieces = ['**%s**' % piece for piece in pieces]
+            pieces[0] = header + pieces[0]
+            messages.extend([(p.user, piece) for piece in pieces])
+        self.count_totals()
+        await self.broadcast(messages)
         await self.ld_poke(message)
 
 
+    async def show_rolls(self):
+        # Reveal everyone's dice in the main channel, for a little while. If there are too many to fit
+        # in a message, they are attached as a file instead.
+        rolls = '\n'.join(['%s: %s' % (p.user.mention, format_dice(p.dice)) for p in self.players])
+        file_rolls = '\n'.join(['%s: %s' % (p.user.name, format_dice(p.dice)) for p in self.players])
+        result_msg = (await self.send_long(self.main_channel, 'Die rolls:\n%s' % rolls,
+                                           'Die rolls (%d dice in all) are attached.' % sum(self.totals), file_rolls, 'dice.txt'))
+        self.delete_later(result_msg, RESULT_DELAY) # Delete after a certain time
+
+
+    def count_bid(self, value):
+        # Return the number of dice on the table that count towards a bid on the given value
+        count = self.totals[value - 1]
+        if self.ones_wild and (value != 1):
+            count += self.totals[0]
+        return count
+
+
+    def min_raise(self, value):
+        # Return the smallest number of dice showing `value` that would be a legal bid right now
+        return smallest_raise(self.last_bidder.bid if self.last_bidder else None, value, self.ones_wild)
+
+
+    def bid_odds(self, player, bid):
+        # Return the probability that a bid is true, as far as `player` can tell from their own dice
+        return hand_chance(bid, player.dice, self.others(player), self.n_sides, self.ones_wild)
+
+
+    def others(self, player):
+        # Return (number of dice, passed) for everyone but `player`
+        return [(p.n_dice, p.passed) for p in self.players if p is not player]
+
+
+    def pass_legal(self, player):
+        # Returns True if a player's dice allow them to pass
+        if max(player.dice) > 1:
+            return False
+        if self.ones_wild and player.dice[0] and (player.n_dice > 1):
+            return False # You can't pass if you have a wild, unless it's the only dice you have
+        return bool(self.pass_mode & PASS_UNIQUE) or (player.n_dice == 2)
+
+
+    def pass_blocked(self, player):
+        # Returns True if the person before a player passed, and the rules don't allow two passes in a row
+        if self.pass_mode & PASS_SKIP:
+            index = self.players.index(player)
+            return self.players[(index - 1) % len(self.players)] in self.passed_players
+        return False
+
+
+    def add_die(self, player):
+        player.n_dice += 1
+        player.dice[0] += 1
+
+    def remove_die(self, player):
+        player.n_dice -= 1
+        for value in range(self.n_sides - 1, -1, -1):
+            if player.dice[value]:
+                player.dice[value] -= 1
+                break
+
+
     async def penalize(self, player):
         if self.n_dice_start > self.n_dice_end:
-            player.dice.pop()
+            self.remove_die(player)
         else:
-            player.dice.append(1)
-        if len(player.dice) == self.n_dice_end:
-            await self.main_channel.send('*%s has been eliminated from the game.*' % player.user.mention)
-            self.players.remove(player)
-            if len(self.players) == 1:
-                winner = self.players[0].user.mention
-                channel = self.main_channel
-                self.close()
-                await channel.send('**The game is over. %s is the winner!**' % winner)
+            self.add_die(player)
+        if player.n_dice == self.n_dice_end:
+            await self.eliminate(player)
 
                 
     async def reward(self, player):
         if self.n_dice_start > self.n_dice_end:
-            if len(player.dice) < self.n_dice_start:
-                player.dice.append(1)
+            if player.n_dice < self.n_dice_start:
+                self.add_die(player)
         else:
-            if len(player.dice) > self.n_dice_start:
-                player.dice.pop()
-        if len(player.dice) == self.n_dice_end:
-            await self.main_channel.send('*%s has been eliminated from the game.*' % player.user.mention)
-            self.players.remove(player)
-            if len(self.players) == 1:
-                channel = self.main_channel
-                self.close()
-                await channel.send('**The game is over. %s is the winner!**' % self.players[0].user.mention)
+            if player.n_dice > self.n_dice_start:
+                self.remove_die(player)
+        if player.n_dice == self.n_dice_end:
+            await self.eliminate(player)
+
+
+    async def eliminate(self, player):
+        await self.main_channel.send('*%s has been eliminated from the game.*' % player.user.mention)
+        self.remove_player(player)
+        if len(self.players) == 1:
+            winner = self.players[0].user.mention
+            channel = self.main_channel
+            self.close()
+            await channel.send('**The game is over. %s is the winner!**' % winner)
+        else:
+            await self.check_humans()
+
+
+    async def check_humans(self):
+        # Cancel the game if only computer players are left in it. Returns True if it is still going.
+        if self.owner and not any([not is_computer(p.user) for p in self.players]):
+            channel = self.main_channel
+            self.close()
+            await channel.send('The game has been canceled because there are no human players left.')
+            return False
+        return True
                 
                 
 
@@ -344,10 +750,7 @@ class LiarsDice(Game):
 
 
     def compare_bid(self, bid):
-        num, value = bid
-        if (value == 1) and self.ones_wild:
-            return 2*num, value
-        return num, value
+        return bid_rank(bid, self.ones_wild)
 
 
 
@@ -381,6 +784,7 @@ class LiarsDice(Game):
             self.current = self.players[index]
             # Make a public announcement
             await self.main_channel.send('%s bid **%s**.\nIt is now %s\'s turn.' % (self.last_bidder.user.mention, self.format_bid((num, value)), self.current.user.mention))
+            self.computer_turn_soon()
 
 
 
@@ -429,21 +833,16 @@ class LiarsDice(Game):
             current = self.current
             self.current = None # Don't allow repeat invocations!
             if not is_pass:
-                await self.main_channel.send('%s challenged %s\'s bid of %s.' % (message.author.mention, player.user.mention, self.format_bid(player.bid)))
+                await self.main_channel.send('%s challenged %s\'s bid of %s.' % (current.user.mention, player.user.mention, self.format_bid(player.bid)))
             else:
-                await self.main_channel.send('%s challenged %s\'s pass.' % (message.author.mention, player.user.mention))
-            async with self.main_channel.typing():
-                await asyncio.sleep(5) # Pause for dramatic effect
-            rolls = ['%s: %s' % (p.user.mention, ' '.join(map(str, p.dice))) for p in self.players]
-            result_msg = (await self.main_channel.send('Die rolls:\n%s' % '\n'.join(rolls)))
-            await result_msg.delete(delay=RESULT_DELAY) # Delete after a certain time
+                await self.main_channel.send('%s challenged %s\'s pass.' % (current.user.mention, player.user.mention))
+            await self.dramatic_pause()
+            await self.show_rolls()
             penalty = ('loses' if self.n_dice_start > self.n_dice_end else 'gains')
             if not is_pass:
                 # The accusation was against the last player to make a bid
                 num, value = player.bid
-                count = sum([p.dice.count(value) for p in self.players])
-                if self.ones_wild and (value != 1):
-                    count += sum([p.dice.count(1) for p in self.players])
+                count = self.count_bid(value)
                 msg = 'Total number of %ds%s: **%d**\n' % (value, ' (including wilds)' if self.ones_wild and (value != 1) else '', count)
                 if count >= num:
                     msg += '%s\'s bid was **correct**, so %s %s a die.' % (player.user.mention, current.user.mention, penalty)
@@ -453,17 +852,16 @@ class LiarsDice(Game):
                     losing = player
             else:
                 # The accusation was against somebody who passed
-                dice = list(player.dice)
-                has_ones = (self.ones_wild and (1 in dice) and (len(dice) > 1)) # You can't pass if you have a wild, unless it's the only dice you have
+                legal = self.pass_legal(player)
                 if self.pass_mode & PASS_UNIQUE:
-                    if (len(dice) == len(set(dice))) and not has_ones:
+                    if legal:
                         msg = '%s\'s dice were all unique, so they were allowed to pass. %s %s a die.' % (player.user.mention, current.user.mention, penalty)
                         losing = current
                     else:
                         msg = '%s\'s dice were not all unique, so they should not have passed. %s %s a die.' % (player.user.mention, player.user.mention, penalty)
                         losing = player
                 else:
-                    if (len(dice) == len(set(dice)) == 2) and not has_ones:
+                    if legal:
                         msg = '%s has exactly two dice showing different values, so they were allowed to pass. %s %s a die.' % \
                               (player.user.mention, current.user.mention, penalty)
                         losing = current
@@ -474,17 +872,56 @@ class LiarsDice(Game):
             # Send the message and penalize the appropriate player
             await self.main_channel.send(msg)
             index = self.players.index(losing)
+            owner = self.owner
             await self.penalize(losing)
-            if losing in self.players:
-                self.current = losing
-            else:
-                self.current = self.players[index % len(self.players)]
-            await asyncio.sleep(2) # Pause for a bit
-            if self.running:
+            await self.clock.pause(2) # Pause for a bit. Nobody can move until the dice are rolled again.
+            if self.running and (self.owner is owner): # (The game may have ended, and another one started)
+                # The loser starts the next round, or the player after them if they were eliminated
+                self.current = (losing if losing in self.players else self.players[index % len(self.players)])
                 await self.roll(message) # and roll again
 
 
 
+    async def ld_odds(self, message):
+        '''Find out (by DM) how likely a bid is to be true, going by your own dice'''
+        if (await self.check_running(message)):
+            player = self.find_player(message.author)
+            if player is None:
+                await message.channel.send('You are not currently part of this game.')
+                return
+            words = message.content.lower().split()[2:]
+            if words:
+                try:
+                    num, value = map(int, words)
+                except ValueError:
+                    await message.channel.send('Syntax: ld odds [number of dice] [value on dice]')
+                    return
+                if (num < 1) or not (1 <= value <= self.n_sides):
+                    await message.channel.send('Error: that is not a valid bid.')
+                    return
+                bid = (num, value)
+            elif self.last_bidder:
+                bid = self.last_bidder.bid
+            else:
+                bid = None
+            lines = []
+            if bid:
+                lines.append('Chance of at least **%s**%s: **%s**' % (self.format_bid(bid), ' (including wilds)' if self.ones_wild and (bid[1] != 1) else '',
+                                                                      format_chance(self.bid_odds(player, bid))))
+            raises = [(self.min_raise(value), value) for value in range(1, self.n_sides + 1)]
+            raises = sorted([(self.bid_odds(player, raise_), raise_) for raise_ in raises], key=lambda r: (-r[0], self.compare_bid(r[1])))
+            lines.append('Most likely %s:' % ('raises' if self.last_bidder else 'opening bids'))
+            for chance, raise_ in raises[:ODDS_RAISES]:
+                lines.append('    %s: %s' % (self.format_bid(raise_), format_chance(chance)))
+            moves = strategy_for(player.dice, self.others(player), self.n_sides, self.ones_wild, self.last_bidder.bid if self.last_bidder else None)
+            if moves and (self.current is player):
+                lines.append('Solved strategy for this turn:')
+                for chance, move in sorted([m for m in moves if m[0]], key=lambda m: -m[0])[:ODDS_RAISES]:
+                    lines.append('    %s: %s' % ('challenge' if move is None else 'bid %s' % self.format_bid(move), format_chance(chance)))
+            await message.author.send('\n'.join(lines))
+
+
+
     async def ld_liarpass(self, message):
         '''Challenge another player's pass'''
         await self.ld_liar(message, is_pass=True)
@@ -502,12 +939,9 @@ class LiarsDice(Game):
             if self.current.passed:
                 await message.channel.send('Error: you can only pass once per round.')
                 return
-            if self.pass_mode & PASS_SKIP:
-                index = self.players.index(self.current)
-                prev = self.players[(index - 1) % len(self.players)]
-                if prev in self.passed_players:
-                    await message.channel.send('Error: you cannot pass because the person before you passed.')
-                    return
+            if self.pass_blocked(self.current):
+                await message.channel.send('Error: you cannot pass because the person before you passed.')
+                return
             # Update the bid
             self.current.passed = True
             self.passed_players.append(self.current)
@@ -517,6 +951,7 @@ class LiarsDice(Game):
             self.current = self.players[index]
             # Make a public announcement
             await self.main_channel.send('%s passed.\nIt is now %s\'s turn.' % (self.passed_players[-1].user.mention, self.current.user.mention))
+            self.computer_turn_soon()
 
 
 
@@ -534,16 +969,11 @@ class LiarsDice(Game):
             # Make a public announcement
             current = self.current
             self.current = None # Don't allow repeat invocations!
-            await self.main_channel.send('%s called spot on %s\'s bid of %s.' % (message.author.mention, player.user.mention, self.format_bid(player.bid)))
-            async with self.main_channel.typing():
-                await asyncio.sleep(5) # Pause for dramatic effect
-            rolls = ['%s: %s' % (p.user.mention, ' '.join(map(str, p.dice))) for p in self.players]
-            result_msg = (await self.main_channel.send('Die rolls:\n%s' % '\n'.join(rolls)))
-            await result_msg.delete(delay=RESULT_DELAY) # Delete after a certain time
+            await self.main_channel.send('%s called spot on %s\'s bid of %s.' % (current.user.mention, player.user.mention, self.format_bid(player.bid)))
+            await self.dramatic_pause()
+            await self.show_rolls()
             num, value = player.bid
-            count = sum([p.dice.count(value) for p in self.players])
-            if self.ones_wild and (value != 1):
-                count += sum([p.dice.count(1) for p in self.players])
+            count = self.count_bid(value)
             msg = 'Total number of %ds%s: **%d**\n' % (value, ' (including wilds)' if self.ones_wild and (value != 1) else '', count)
             losing = []
             winning = []
@@ -552,7 +982,7 @@ class LiarsDice(Game):
                 if self.spot_mode == SPOT_NORMAL:
                     msg += ', so nobody is penalized.'
                 else:
-                    reward = ((self.spot_mode & SPOT_REWARD) and (len(current.dice) != self.n_dice_start))
+                    reward = ((self.spot_mode & SPOT_REWARD) and (current.n_dice != self.n_dice_start))
                     if reward:
                         msg += ', so %s %s a die' % (current.user.mention, 'gains' if self.n_dice_start > self.n_dice_end else 'loses')
                         winning = [current]
@@ -573,16 +1003,17 @@ class LiarsDice(Game):
             await self.main_channel.send(msg)
             index = self.players.index(current)
             rotated_players = self.players[index:] + self.players[:index]
+            owner = self.owner
             for p in losing:
-                await self.penalize(p)
-            for p in rotated_players:
-                if p in self.players:
-                    self.current = p
-                    break
+                if self.owner is owner: # Eliminating someone can end the game
+                    await self.penalize(p)
             for p in winning:
-                await self.reward(p)
-            await asyncio.sleep(2) # Pause for a bit
-            if self.running:
+                if self.owner is owner:
+                    await self.reward(p)
+            await self.clock.pause(2) # Pause for a bit. Nobody can move until the dice are rolled again.
+            if self.running and (self.owner is owner): # (The game may have ended, and another one started)
+                # The spotter starts the next round, or the next player still in the game
+                self.current = next((p for p in rotated_players if p in self.players))
                 await self.roll(message) # and roll again
 
 
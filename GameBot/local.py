@@ -0,0 +1,377 @@
+# In-process stand-in for Discord, for driving a real GameBot without a connection
+# Matthew Kroesche
+
+import discord
+import asyncio
+import datetime
+import itertools
+import random
+import types
+
+from .bot import GameBot
+
+
+
+HTTP_LATENCY = 0.05 # Default number of seconds each simulated request to Discord takes
+HTTP_BUCKET_SIZE = 5 # Default number of requests allowed on each route...
+HTTP_BUCKET_PERIOD = 5.0 # ...in this many seconds, like Discord's limit on sending messages to a channel
+HTTP_MAX_RETRIES = 5 # Number of times a rate limited request is retried before giving up, like discord.py does
+
+
+
+
+
+
+class SimulatedHTTP(object):
+
+    # Stands in for Discord's HTTP API. Every request waits for the simulated latency, and is
+    # rate limited per route (usually per channel) with a bucket of `bucket_size` requests
+    # every `bucket_period` seconds. A request that finds its bucket empty gets a 429 and is
+    # retried once the bucket resets, the way discord.py handles it; `spurious_429` is the
+    # chance of a 429 that has nothing to do with the bucket (Discord does send those).
+
+    def __init__(self, latency=HTTP_LATENCY, jitter=0.0, bucket_size=HTTP_BUCKET_SIZE, bucket_period=HTTP_BUCKET_PERIOD,
+                 spurious_429=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter # Up to this many extra seconds are added to the latency at random
+        self.bucket_size = bucket_size # 0 turns off rate limiting
+        self.bucket_period = bucket_period
+        self.spurious_429 = spurious_429
+        self.random = random.Random(seed)
+        self.buckets = {} # Map from each route to [requests remaining, loop time when the bucket resets]
+        self.requests = 0
+        self.rate_limited = 0 # Number of 429 responses
+        self.wait_time = 0.0 # Total seconds requests have spent waiting out 429s
+        self.failures = 0 # Number of requests that ran out of retries
+
+
+    def take(self, route, now):
+        # Take a request from the bucket for a route. Returns 0 if it went through, otherwise the
+        # number of seconds to wait before retrying.
+        if self.spurious_429 and (self.random.random() < self.spurious_429):
+            return 1.0
+        if not self.bucket_size:
+            return 0
+        bucket = self.buckets.get(route)
+        if (bucket is None) or (now >= bucket[1]):
+            bucket = self.buckets[route] = [self.bucket_size, now + self.bucket_period]
+        if bucket[0]:
+            bucket[0] -= 1
+            return 0
+        return bucket[1] - now
+
+
+    async def request(self, route):
+        # Make a request on the given route, waiting out any rate limits
+        loop = asyncio.get_event_loop()
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            self.requests += 1
+            await asyncio.sleep(self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0))
+            retry_after = self.take(route, loop.time())
+            if not retry_after:
+                return
+            self.rate_limited += 1
+            if attempt < HTTP_MAX_RETRIES:
+                self.wait_time += retry_after
+                await asyncio.sleep(retry_after)
+        self.failures += 1
+        raise discord.HTTPException(types.SimpleNamespace(status=429, reason='Too Many Requests'), 'You are being rate limited.')
+
+
+    def reset_buckets(self):
+        # Forget about buckets that have already reset, so they don't pile up
+        now = asyncio.get_event_loop().time()
+        self.buckets = dict([(route, bucket) for route, bucket in self.buckets.items() if bucket[1] > now])
+
+
+
+
+
+
+##### Discord objects #####
+
+
+class LocalUser(object):
+
+    # A discord.User. Users compare equal to the Members with the same id, as they do in discord.py.
+
+    def __init__(self, client, id, name):
+        self.client = client
+        self.id = id
+        self.name = self.display_name = name
+        self.discriminator = '0000'
+        self.mention = '<@%d>' % id
+        self.bot = False
+        self.dm_channel = None
+
+    def __eq__(self, other):
+        return isinstance(other, LocalUser) and (other.id == self.id)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return '%s#%s' % (self.name, self.discriminator)
+
+    async def create_dm(self):
+        if self.dm_channel is None:
+            self.dm_channel = LocalDMChannel(self.client, self.client.next_id(), self)
+        return self.dm_channel
+
+    async def send(self, content=None, embed=None, file=None):
+        return (await (await self.create_dm()).send(content, embed=embed, file=file))
+
+
+
+class LocalMember(LocalUser):
+
+    # A discord.Member: a user as seen from inside a particular guild
+
+    def __init__(self, user, guild):
+        LocalUser.__init__(self, user.client, user.id, user.name)
+        self.user = user
+        self.guild = guild
+        self.roles = []
+
+    async def create_dm(self):
+        return (await self.user.create_dm())
+
+
+
+class LocalGuild(object):
+
+    def __init__(self, client, id, name):
+        self.client = client
+        self.id = id
+        self.name = name
+        self.members = []
+        self.channels = []
+        self.roles = []
+
+    def get_member(self, id):
+        return discord.utils.get(self.members, id=id)
+
+
+
+class LocalTextChannel(object):
+
+    type = discord.ChannelType.text
+
+    def __init__(self, client, id, guild, name):
+        self.client = client
+        self.id = id
+        self.guild = guild
+        self.name = name
+        self.mention = '<#%d>' % id
+
+    async def send(self, content=None, embed=None, file=None):
+        await self.client.http.request(self.id)
+        return self.client.sent(self, content, embed)
+
+    def typing(self):
+        return LocalTyping(self)
+
+    async def history(self, **kwargs):
+        # Nothing is kept, so there is never any history
+        return
+        yield
+
+
+
+class LocalDMChannel(object):
+
+    type = discord.ChannelType.private
+
+    def __init__(self, client, id, recipient):
+        self.client = client
+        self.id = id
+        self.recipient = recipient
+        self.guild = None
+
+    async def send(self, content=None, embed=None, file=None):
+        await self.client.http.request(self.id)
+        return self.client.sent(self, content, embed)
+
+    def typing(self):
+        return LocalTyping(self)
+
+
+
+class LocalTyping(object):
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def __aenter__(self):
+        await self.channel.client.http.request(('typing', self.channel.id))
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+
+class LocalMessage(object):
+
+    def __init__(self, client, id, channel, author, content, embed=None, mentions=(), channel_mentions=()):
+        self.client = client
+        self.id = id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ''
+        self.embed = embed
+        self.embeds = ([embed] if embed else [])
+        self.mentions = list(mentions)
+        self.channel_mentions = list(channel_mentions)
+        self.created_at = datetime.datetime.utcnow()
+        self.deleted = False
+
+    async def edit(self, content=None, embed=None):
+        await self.client.http.request(('edit', self.channel.id))
+        self.content = content or ''
+        self.embed = embed
+
+    async def delete(self):
+        if self.deleted:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason='Not Found'), 'Unknown Message')
+        await self.client.http.request(('delete', self.channel.id))
+        self.deleted = True
+
+
+
+
+
+
+##### The bot #####
+
+
+class LocalBot(GameBot):
+
+    # A GameBot whose guilds, channels and users all live in this process. Messages are fed in
+    # with receive(), which goes through the real on_message(); everything the bot sends goes
+    # through a SimulatedHTTP. Snapshots are never restored or saved, and the journal is only
+    # kept if `journal` is True.
+
+    user = None # These are read-only properties of discord.Client, which has no connection to get them from
+    guilds = None
+
+    def __init__(self, game_classes, http=None, journal=False):
+        self.http = (http or SimulatedHTTP())
+        self.ids = itertools.count(10**15) # Snowflake ids for everything
+        self.user = LocalUser(self, self.next_id(), 'GameBot')
+        self.guilds = []
+        self.user_index = {}
+        self.channel_index = {}
+        self.listeners = [] # (future, check) pairs waiting on wait_for()
+        self.listener_waiters = [] # Futures to wake up the next time someone calls wait_for()
+        self.received = 0 # Number of messages fed in through receive()
+        self.sent_messages = 0 # Number of messages the bot has sent
+        self.init_state(game_classes, False)
+        if not journal:
+            self.journal = None
+
+
+    def next_id(self):
+        return next(self.ids)
+
+
+    async def ready(self):
+        # Do what on_ready() does when the bot first connects, apart from pings and restoring snapshots
+        self.init_channels()
+        self.dispatch.index_members(self.guilds)
+        self.connected = True
+
+
+    def add_guild(self, name, n_members, channel_names=('game-corner',)):
+        # Create a guild with some text channels and `n_members` new users. Returns the guild.
+        guild = LocalGuild(self, self.next_id(), name)
+        for channel_name in channel_names:
+            channel = LocalTextChannel(self, self.next_id(), guild, channel_name)
+            guild.channels.append(channel)
+            self.channel_index[channel.id] = channel
+        for i in range(n_members):
+            user = LocalUser(self, self.next_id(), '%s-user%d' % (name, i + 1))
+            self.user_index[user.id] = user
+            guild.members.append(LocalMember(user, guild))
+        self.guilds.append(guild)
+        if self.connected:
+            self.index_channels(guild)
+            self.dispatch.add_guild(guild)
+        return guild
+
+
+    def get_user(self, id):
+        return self.user_index.get(id)
+
+    async def fetch_user(self, id):
+        user = self.user_index.get(id)
+        if user is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason='Not Found'), 'Unknown User')
+        return user
+
+    def get_channel(self, id):
+        return self.channel_index.get(id)
+
+    def get_all_members(self):
+        for guild in self.guilds:
+            for member in guild.members:
+                yield member
+
+
+    def sent(self, channel, content, embed):
+        # Called by channels when the bot has sent a message
+        self.sent_messages += 1
+        return LocalMessage(self, self.next_id(), channel, self.user, content, embed)
+
+
+    async def wait_for(self, event, check=None, timeout=None):
+        # Only 'message' events are ever waited for
+        future = asyncio.get_event_loop().create_future()
+        listener = (future, check)
+        self.listeners.append(listener)
+        for waiter in self.listener_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.listener_waiters = []
+        try:
+            return (await asyncio.wait_for(future, timeout))
+        finally:
+            self.listeners.remove(listener)
+
+
+    async def next_listener(self):
+        # Wait until someone calls wait_for()
+        waiter = asyncio.get_event_loop().create_future()
+        self.listener_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self.listener_waiters:
+                self.listener_waiters.remove(waiter)
+
+
+    async def receive(self, author, channel, content, mentions=(), channel_mentions=()):
+        # Deliver a message from `author` to the bot, as if it had been posted in `channel`,
+        # and wait for on_message() to finish with it. Returns the message.
+        self.received += 1
+        message = LocalMessage(self, self.next_id(), channel, author, content, None, mentions, channel_mentions)
+        await self.deliver(message)
+        return message
+
+
+    async def deliver(self, message):
+        # Hand a message to anyone waiting for one, and then to on_message()
+        for future, check in list(self.listeners):
+            if not future.done() and ((check is None) or check(message)):
+                future.set_result(message)
+        await self.on_message(message)
+
+
+    async def close(self):
+        # There is no connection to close, so just write out the journal
+        if self.journal:
+            self.journal.flush_now()
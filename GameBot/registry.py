@@ -0,0 +1,114 @@
+# Registry of the games the bot knows how to play
+# Matthew Kroesche
+
+import importlib
+import traceback
+
+ENTRY_POINT_GROUP = 'gamebot.games' # Other packages can add games with entry points in this group, named by the game's prefix
+
+
+
+
+def iter_entry_points(group):
+    # Return the (name, 'module:attribute') pairs of every installed entry point in a group
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python 3.7
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return [(ep.name, '%s:%s' % (ep.module_name, '.'.join(ep.attrs))) for ep in pkg_resources.iter_entry_points(group)]
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, ())
+    return [(ep.name, ep.value) for ep in eps]
+
+
+
+
+
+
+class GamePlugin(object):
+
+    # A game the bot knows about. `target` is where its class lives, as 'module:ClassName';
+    # the module isn't imported until the first time load() is called.
+
+    def __init__(self, prefix, name, target, cls=None):
+        self.prefix = prefix
+        self.name = name
+        self.target = target
+        self.cls = cls
+
+
+    def load(self):
+        # Import the game's class, if it hasn't been already, and return it
+        if self.cls is None:
+            module, attribute = self.target.split(':', 1)
+            cls = importlib.import_module(module)
+            for name in attribute.split('.'):
+                cls = getattr(cls, name)
+            if cls.prefix != self.prefix:
+                raise ValueError('%s has the prefix %r, not %r' % (self.target, cls.prefix, self.prefix))
+            self.cls = cls
+            self.name = cls.name
+        return self.cls
+
+
+
+
+
+
+class GameRegistry(object):
+
+    # The prefix, name and location of every game, known without importing any of them.
+    # Iterating over the registry imports every game and yields their classes, so it can
+    # be used anywhere a list of game classes is expected.
+
+    def __init__(self, classes=()):
+        self.plugins = {} # Map from each prefix to its GamePlugin, in the order they were added
+        for cls in classes:
+            self.add_class(cls)
+
+
+    def add(self, prefix, name, target):
+        # Register a game without importing it
+        self.plugins[prefix] = GamePlugin(prefix, name, target)
+
+
+    def add_class(self, cls):
+        # Register a game class that has already been imported
+        self.plugins[cls.prefix] = GamePlugin(cls.prefix, cls.name, '%s:%s' % (cls.__module__, cls.__qualname__), cls)
+
+
+    def add_entry_points(self, group=ENTRY_POINT_GROUP):
+        # Register the games installed by other packages. Their names aren't known until they are imported.
+        try:
+            for prefix, target in iter_entry_points(group):
+                if prefix not in self.plugins:
+                    self.add(prefix, prefix, target)
+        except Exception:
+            traceback.print_exc()
+
+
+    def prefixes(self):
+        return list(self.plugins)
+
+
+    def load(self, prefix):
+        # Return the class of the game with the given prefix, importing it if necessary
+        return self.plugins[prefix].load()
+
+
+    def __contains__(self, prefix):
+        return prefix in self.plugins
+
+    def __len__(self):
+        return len(self.plugins)
+
+    def __iter__(self):
+        for plugin in list(self.plugins.values()):
+            yield plugin.load()
@@ -0,0 +1,131 @@
+# Bot-wide timer scheduler
+# Matthew Kroesche
+
+import asyncio
+import collections
+import heapq
+import itertools
+import traceback
+
+
+
+
+
+
+class Timer(object):
+
+    # Handle for a scheduled callback. Pass it to Scheduler.cancel() to cancel the callback.
+
+    def __init__(self, deadline, callback, args, tag):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.tag = tag
+        self.cancelled = False
+        self.fired = False
+
+
+    def active(self):
+        # Returns True if this timer has neither fired nor been canceled
+        return not (self.cancelled or self.fired)
+
+
+
+
+
+
+class Scheduler(object):
+
+    # A single heap of deadlines shared by every game, driven by one event loop timer for
+    # the earliest deadline, instead of one sleeping task per timer. Callbacks may be plain
+    # functions or coroutine functions; coroutines are run as tasks once their deadline passes.
+
+    def __init__(self):
+        self.heap = [] # Heap of (deadline, sequence number, Timer)
+        self.counter = itertools.count() # Tie-breaker so that timers with the same deadline fire in order
+        self.pending = collections.Counter() # Number of pending timers, by tag
+        self.tasks = set() # Tasks running callbacks that have fired
+        self.handle = None # Event loop handle for the earliest deadline
+        self.armed_at = None # The deadline `handle` is set for
+
+
+    def time(self):
+        return asyncio.get_event_loop().time()
+
+
+    def schedule(self, delay, callback, *args, tag=None):
+        # Call `callback(*args)` after `delay` seconds. Returns a Timer handle.
+        timer = Timer(self.time() + delay, callback, args, tag)
+        heapq.heappush(self.heap, (timer.deadline, next(self.counter), timer))
+        self.pending[tag] += 1
+        if (self.armed_at is None) or (timer.deadline < self.armed_at):
+            self.arm()
+        return timer
+
+
+    def cancel(self, timer):
+        # Cancel a timer, if it has not fired yet. Canceled timers are removed from the heap
+        # lazily, unless they start to make up most of it.
+        if timer and timer.active():
+            timer.cancelled = True
+            self.pending[timer.tag] -= 1
+            if len(self.heap) > 2 * len(self) + 64:
+                self.heap = [entry for entry in self.heap if entry[2].active()]
+                heapq.heapify(self.heap)
+            if self.heap and (self.heap[0][2] is timer):
+                self.arm()
+
+
+    def arm(self):
+        # Set the event loop timer for the earliest pending deadline
+        while self.heap and not self.heap[0][2].active():
+            heapq.heappop(self.heap)
+        if self.handle:
+            self.handle.cancel()
+            self.handle = self.armed_at = None
+        if self.heap:
+            self.armed_at = self.heap[0][0]
+            self.handle = asyncio.get_event_loop().call_at(self.armed_at, self.fire)
+
+
+    def fire(self):
+        # Run every callback whose deadline has passed
+        self.handle = self.armed_at = None
+        now = self.time()
+        while self.heap and (self.heap[0][0] <= now):
+            timer = heapq.heappop(self.heap)[2]
+            if not timer.active():
+                continue
+            timer.fired = True
+            self.pending[timer.tag] -= 1
+            try:
+                result = timer.callback(*timer.args)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.ensure_future(result)
+                    self.tasks.add(task)
+                    task.add_done_callback(self.finished)
+            except Exception:
+                traceback.print_exc()
+        self.arm()
+
+
+    def finished(self, task):
+        # Clean up after a callback task, reporting any errors
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            exc = task.exception()
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+
+    def count(self, tag=None):
+        # Return the number of pending timers with the given tag
+        return self.pending[tag]
+
+
+    def counts(self):
+        # Return a dict mapping tags to the number of pending timers with that tag
+        return dict([(tag, n) for tag, n in self.pending.items() if n])
+
+
+    def __len__(self):
+        return sum(self.pending.values())
@@ -0,0 +1,400 @@
+# Scripted players that can play every game without any people around
+# Matthew Kroesche
+
+import recordclass
+import asyncio
+
+from . import avalon
+from . import codenames
+from . import liars_dice
+from . import secret_hitler
+from . import snarkback
+from .local import LocalMessage
+
+
+
+POLL_INTERVAL = 0.05 # Number of seconds to wait before looking again when nobody has anything to do
+PATIENCE = 30 # Give up on a game if nobody has had anything to do for this many seconds
+HISTORY = 10 # Number of commands to remember, to show what led up to a game getting stuck
+
+
+
+Move = recordclass.recordclass('Move', 'player content private mentions')
+# player: the Player making the move
+# content: the text of the command
+# private: True if the command is sent as a direct message to the bot
+# mentions: the list of Players mentioned in the command
+
+
+Script = recordclass.recordclass('Script', 'min_players max_players join setup moves phase phases')
+# min_players, max_players: the range of the number of players to start a game with
+# join: the command the other players use to join the game
+# setup: a function (rng) returning the list of commands the owner sends before starting the game
+# moves: a function (game, rng) returning the list of Moves the players could make right now
+# phase: a function (game) returning the name of the phase the game is in, or None in between phases
+# phases: the names of all the phases a game can be in
+
+CLUES = ['ANIMAL', 'BLUE', 'CITY', 'DANGER', 'FOOD', 'MACHINE', 'MUSIC', 'NATURE', 'SPACE', 'WATER']
+SNARK_WORDS = ['BANANA', 'CHEESE', 'DESTINY', 'GOOSE', 'HAMSTER', 'LLAMA', 'MOM', 'NACHOS', 'PANTS', 'TAXES', 'WIZARD', 'YOGURT']
+
+
+
+
+
+
+##### Moves for each game #####
+
+
+def avalon_moves(game, rng):
+    if not game.running:
+        return []
+    if game.waiting_for_assassin:
+        targets = [p for p in game.players if p.side == avalon.GOOD]
+        return [Move(game.assassin, 'av assassinate', False, [rng.choice(targets)])]
+    if game.waiting_for_lady:
+        targets = [p for p in game.players if (p is not game.lady) and (p not in game.investigated)]
+        return [Move(game.lady, 'av lady', False, [rng.choice(targets)])]
+    if game.waiting_for_outcomes:
+        # Servants always play Success; Minions fail about half the time
+        return [Move(p, ('av success' if (p.side == avalon.GOOD) or (rng.random() < 0.5) else 'av fail'), True, [])
+                for p in game.team if p.outcome is None]
+    if game.waiting_for_votes:
+        approve = (0.9 if game.reject_counter >= 4 else 0.6)
+        return [Move(p, ('av approve' if rng.random() < approve else 'av reject'), True, [])
+                for p in game.players if p.vote is None]
+    if game.leader and (len(game.team) < game.current_quest[0]) and not (game.tabulating_votes or game.tabulating_outcomes):
+        n = game.current_quest[0] - len(game.team)
+        others = [p for p in game.players if p not in game.team]
+        if (game.leader in others) and (rng.random() < 0.5):
+            return [Move(game.leader, 'av pickme', False, [])]
+        if rng.random() < 0.2:
+            return [Move(game.leader, 'av pickrandom', False, [])]
+        return [Move(game.leader, 'av pick', False, rng.sample(others, rng.randint(1, n)))]
+    return []
+
+
+
+def codenames_moves(game, rng):
+    if not (game.running and game.current_team):
+        return []
+    team = (game.red_team if game.current_team == codenames.RED else game.blue_team)
+    if game.waiting_for_clue:
+        return [Move(team[0], 'cn clue %s %d' % (rng.choice(CLUES), rng.randint(1, 3)), False, [])]
+    if game.reentrant or not game.guesses_remaining:
+        return []
+    cells = [i for i, cell in enumerate(game.board) if isinstance(cell, str)]
+    # The agents guess their own team's cells a bit better than chance
+    own = [i for i in cells if game.key[i] == game.current_team]
+    index = rng.choice(own if own and (rng.random() < 0.5) else cells)
+    moves = [Move(rng.choice(team[1:]), 'cn click %s' % game.board[index].lower(), False, [])]
+    if rng.random() < 0.1:
+        moves.append(Move(rng.choice(team[1:]), 'cn finish', False, []))
+    return moves
+
+
+
+def liars_dice_moves(game, rng):
+    player = game.current
+    if not (game.running and player) or liars_dice.is_computer(player.user):
+        return [] # Computer players make their own moves
+    bid = (game.last_bidder.bid if game.last_bidder else None)
+    if game.passed_players and (game.passed_players[-1] is not player) and (rng.random() < 0.1):
+        return [Move(player, 'ld liarpass', False, [])]
+    if bid:
+        # Challenge bids that look too high, and occasionally call spot on ones that look about right
+        num, value = bid
+        total = sum([p.n_dice for p in game.players])
+        expected = player.dice[value - 1] + (total - player.n_dice) / game.n_sides
+        if num > expected + 1:
+            return [Move(player, 'ld liar', False, [])]
+        if game.spot_mode and (abs(num - expected) < 0.5) and (rng.random() < 0.2):
+            return [Move(player, 'ld spot', False, [])]
+    if game.pass_mode and not player.passed and (max(player.dice) <= 1) and (rng.random() < 0.3):
+        index = game.players.index(player)
+        if not ((game.pass_mode & liars_dice.PASS_SKIP) and (game.players[index - 1] in game.passed_players)):
+            return [Move(player, 'ld pass', False, [])]
+    # Raise the bid on whatever we have the most of
+    value = max(range(1, game.n_sides + 1), key=lambda v: (player.dice[v - 1], rng.random()))
+    num = 1
+    while bid and (game.compare_bid((num, value)) <= game.compare_bid(bid)):
+        num += 1
+    return [Move(player, 'ld bid %d %d' % (num, value), False, [])]
+
+
+
+def secret_hitler_moves(game, rng):
+    if not game.running:
+        return []
+    president = game.president
+    others = [p for p in game.players if p is not president]
+    if game.waiting_for_nomination:
+        candidates = [p for p in others if p not in game.term_limited]
+        return [Move(president, 'sh nominate', False, [rng.choice(candidates)])] if candidates else []
+    if game.waiting_for_votes:
+        return [Move(p, ('sh ja' if rng.random() < 0.65 else 'sh nein'), True, []) for p in game.players if p.vote is None]
+    if game.waiting_for_president:
+        policy = rng.choice(game.policies)
+        return [Move(president, 'sh discard %s' % ('liberal' if policy == secret_hitler.LIBERAL else 'fascist'), True, [])]
+    if game.waiting_for_chancellor:
+        if (game.fascist_policies == 5) and (rng.random() < 0.2):
+            return [Move(game.chancellor, 'sh veto', False, [])]
+        policy = rng.choice(game.policies)
+        return [Move(game.chancellor, 'sh enact %s' % ('liberal' if policy == secret_hitler.LIBERAL else 'fascist'), True, [])]
+    if game.waiting_for_veto:
+        return [Move(president, ('sh veto' if rng.random() < 0.5 else 'sh noveto'), False, [])]
+    if game.waiting_for_special:
+        power = game.board[game.fascist_policies - 1]
+        if power == secret_hitler.INVESTIGATE_LOYALTY:
+            return [Move(president, 'sh investigate', False, [rng.choice([p for p in others if p not in game.investigated])])]
+        if power == secret_hitler.SPECIAL_ELECTION:
+            return [Move(president, 'sh elect', False, [rng.choice(others)])]
+        if power == secret_hitler.EXECUTION:
+            return [Move(president, 'sh execute', False, [rng.choice(others)])]
+    return []
+
+
+
+def snarkback_moves(game, rng):
+    if not game.running:
+        return []
+    if game.voting and game.current_snark:
+        moves = []
+        for p in game.players:
+            if len(p.votes) < p.num_votes:
+                choices = [i for i, (reply, author) in enumerate(game.current_snark[1:], 1) if (reply is not None) and (author is not p)]
+                vote = (rng.choice(choices) if choices and (rng.random() < 0.9) else 0)
+                moves.append(Move(p, 'sb vote %d' % vote, True, []))
+        return moves
+    if game.snarks or game.current_snark:
+        return []
+    return [Move(p, 'sb snark %s' % ' '.join(rng.sample(SNARK_WORDS, rng.randint(1, 3))), True, [])
+            for p in game.players if len(p.snarks) < len(p.prompts)]
+
+
+
+
+
+
+##### Phases of each game #####
+
+
+def avalon_phase(game):
+    if game.waiting_for_assassin:
+        return 'assassination'
+    if game.waiting_for_lady:
+        return 'lady of the lake'
+    if game.waiting_for_outcomes:
+        return 'quest %d' % len(game.quest_results)
+    if game.waiting_for_votes:
+        return ('vote on last chance' if game.reject_counter >= 4 else 'vote')
+    if game.leader and (len(game.team) < game.current_quest[0]):
+        return 'picking team'
+
+AVALON_PHASES = ['picking team', 'vote', 'vote on last chance', 'lady of the lake', 'assassination'] + ['quest %d' % i for i in range(5)]
+
+
+
+def codenames_phase(game):
+    if not game.current_team:
+        return None
+    team = ('red' if game.current_team == codenames.RED else 'blue')
+    if game.waiting_for_clue:
+        return '%s clue' % team
+    if game.guesses_remaining:
+        return '%s guessing' % team
+
+CODENAMES_PHASES = ['red clue', 'red guessing', 'blue clue', 'blue guessing']
+
+
+
+def liars_dice_phase(game):
+    if not game.current:
+        return None
+    if not game.last_bidder:
+        return 'opening bid'
+    if game.passed_players:
+        return 'after a pass'
+    return ('bidding (%d left)' % len(game.players) if len(game.players) <= 2 else 'bidding')
+
+LIARS_DICE_PHASES = ['opening bid', 'bidding', 'bidding (2 left)', 'after a pass']
+
+
+
+def secret_hitler_phase(game):
+    if game.waiting_for_nomination:
+        return 'nomination'
+    if game.waiting_for_votes:
+        return 'election'
+    if game.waiting_for_president:
+        return 'president discards'
+    if game.waiting_for_chancellor:
+        return ('chancellor enacts (veto allowed)' if game.fascist_policies == 5 else 'chancellor enacts')
+    if game.waiting_for_veto:
+        return 'veto'
+    if game.waiting_for_special:
+        return secret_hitler.POWER_NAMES[game.board[game.fascist_policies - 1]].lower()
+
+SECRET_HITLER_PHASES = ['nomination', 'election', 'president discards', 'chancellor enacts', 'chancellor enacts (veto allowed)', 'veto',
+                        'investigate loyalty', 'call special election', 'execution'] # The Policy Peek happens by itself
+
+
+
+def snarkback_phase(game):
+    if not game.round:
+        return None
+    if game.voting and game.current_snark:
+        return 'round %d voting' % game.round
+    if not (game.snarks or game.current_snark):
+        return 'round %d snarking' % game.round
+
+SNARKBACK_PHASES = ['round %d %s' % (i, phase) for i in (1, 2, 3) for phase in ('snarking', 'voting')]
+
+
+
+
+
+
+##### Setting up each game #####
+
+
+def avalon_setup(rng):
+    # Turn on a random selection of the optional roles and the Lady of the Lake
+    return ['av enable %s' % feature for feature in ('morgana', 'mordred', 'oberon', 'norebo', 'lady') if rng.random() < 0.5]
+
+def codenames_setup(rng):
+    return ['cn shuffle']
+
+def liars_dice_setup(rng):
+    # Try out every combination of the rules, sometimes with computer players
+    return ['ld passmode %s' % rng.choice(['none', 'two', 'unique', 'two skip', 'unique skip']),
+            'ld spotmode %s' % rng.choice(['none', 'normal', 'reward', 'penalize', 'reward penalize']),
+            'ld wild %s' % rng.choice(['on', 'off'])] + ['ld addbot'] * rng.choice([0, 0, 1, 2])
+
+def no_setup(rng):
+    return []
+
+
+
+
+
+
+SCRIPTS = {
+    'av': Script(5, 7, 'av join', avalon_setup, avalon_moves, avalon_phase, AVALON_PHASES),
+    'cn': Script(4, 6, 'cn join', codenames_setup, codenames_moves, codenames_phase, CODENAMES_PHASES),
+    'ld': Script(2, 6, 'ld join', liars_dice_setup, liars_dice_moves, liars_dice_phase, LIARS_DICE_PHASES),
+    'sh': Script(5, 7, 'sh join', no_setup, secret_hitler_moves, secret_hitler_phase, SECRET_HITLER_PHASES),
+    'sb': Script(3, 6, 'sb join', no_setup, snarkback_moves, snarkback_phase, SNARKBACK_PHASES),
+    }
+
+DISRUPTIONS = ['%s info', '%s poke', '%s leave'] # Commands a player can send at any time, to shake things up
+
+
+
+
+
+
+##### Playing whole games #####
+
+
+class Table(object):
+
+    # A group of scripted players in one channel of a LocalBot, playing one game after another.
+    # Only one command is in flight at a time; a table stands in for a single busy channel.
+    # With `chaos` > 0, that fraction of the moves are replaced by one of the DISRUPTIONS.
+
+    def __init__(self, bot, cls, guild, rng, think=0.0, patience=PATIENCE, chaos=0.0):
+        self.bot = bot
+        self.cls = cls
+        self.guild = guild
+        self.channel = guild.channels[0]
+        self.script = SCRIPTS[cls.prefix]
+        self.rng = rng
+        self.think = think # Average number of seconds each player thinks before making a move
+        self.patience = patience
+        self.chaos = chaos
+        self.game = None
+        self.latencies = [] # Number of seconds each command took to handle
+        self.finished = 0 # Number of games played to the end
+        self.stuck = 0 # Number of games abandoned because nobody had anything to do
+        self.hangs = [] # (phase, the last few commands) for each game that got stuck
+        self.phases = set() # Names of the phases the games have been seen in
+        self.commands = set() # Names of the command methods that have been called
+        self.history = [] # The last few commands sent in the current game
+
+
+    async def send(self, member, content, private=False, mentions=()):
+        channel = ((await member.create_dm()) if private else self.channel)
+        words = content.lower().split()
+        if self.game and (len(words) > 1):
+            command = self.game.cmd_lookup.get(words[1])
+            if command:
+                self.commands.add(command.__name__)
+        self.history = (self.history + ['%s: %s' % (member.name, content)])[-HISTORY:]
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        task = asyncio.ensure_future(self.bot.receive(member, channel, content, mentions))
+        # If the command asks a yes/no question, say yes
+        answer = LocalMessage(self.bot, 0, channel, member, 'yes')
+        while not task.done():
+            if any([check(answer) for future, check in self.bot.listeners if check]):
+                await self.bot.receive(member, channel, 'yes')
+                break
+            listener = asyncio.ensure_future(self.bot.next_listener())
+            await asyncio.wait([task, listener], return_when=asyncio.FIRST_COMPLETED)
+            listener.cancel()
+        await task
+        self.latencies.append(loop.time() - start)
+
+
+    async def play(self):
+        # Play a single game from start to finish. Returns True if it finished, or False if it got stuck.
+        rng = self.rng
+        prefix = self.cls.prefix
+        seats = rng.sample(self.guild.members, rng.randint(self.script.min_players, self.script.max_players))
+        self.game = None
+        self.history = []
+        await self.send(seats[0], '%s create' % prefix)
+        game = self.game = self.bot.dispatch.game_in_channel(prefix, self.channel)
+        for member in seats[1:]:
+            await self.send(member, self.script.join)
+        for content in self.script.setup(rng):
+            await self.send(seats[0], content)
+        await self.send(seats[0], '%s start' % prefix)
+        owner = game.owner # Once the game is over, the same Game may be reused by someone else
+        idle = 0.0
+        while game.owner is owner:
+            if self.think:
+                await asyncio.sleep(rng.expovariate(1.0 / self.think))
+            phase = self.script.phase(game)
+            if phase:
+                self.phases.add(phase)
+            moves = self.script.moves(game, rng)
+            if not moves:
+                if idle >= self.patience:
+                    self.stuck += 1
+                    self.hangs.append((phase, self.history))
+                    game.close()
+                    return False
+                await asyncio.sleep(POLL_INTERVAL)
+                idle += POLL_INTERVAL + self.think
+                continue
+            idle = 0.0
+            if self.chaos and (rng.random() < self.chaos):
+                people = [p for p in game.players if not getattr(p.user, 'bot', False)]
+                if people:
+                    await self.send(rng.choice(people).user, rng.choice(DISRUPTIONS) % prefix)
+                continue
+            move = rng.choice(moves)
+            content = ' '.join([move.content] + [p.user.mention for p in move.mentions])
+            await self.send(move.player.user, content, move.private, [p.user for p in move.mentions])
+        self.finished += 1
+        return True
+
+
+    async def run(self, deadline=None, games=None):
+        # Keep playing games until the event loop time reaches `deadline`, or `games` games have been played
+        loop = asyncio.get_event_loop()
+        played = 0
+        while ((deadline is None) or (loop.time() < deadline)) and ((games is None) or (played < games)):
+            await self.play()
+            played += 1
@@ -3,8 +3,6 @@
 
 import discord
 import recordclass
-import random
-import asyncio
 
 from .game import Game
 
@@ -230,8 +228,8 @@ class SecretHitler(Game):
         # Make a public announcement
         await self.main_channel.send('The game has now been started!')
         # Set up the game
-        random.seed() # Seed the random number generator
-        random.shuffle(self.players) # Randomize the play order
+        self.random.seed() # Seed the random number generator
+        self.random.shuffle(self.players) # Randomize the play order
         for i in range(len(self.players)):
             self.players[i].next = self.players[(i+1) % len(self.players)] # Give each player a reference to the next one
         await self.shuffle_policies() # Randomize the policy deck
@@ -354,7 +352,7 @@ class SecretHitler(Game):
                 return
             await message.channel.send('Thank you for making your selection!')
             self.policies.remove(to_discard)
-            random.shuffle(self.policies) # No fancy communication!
+            self.random.shuffle(self.policies) # No fancy communication!
             self.waiting_for_president = False
             # Inform the chancellor
             await self.chancellor.user.send('%s gave you the following two %s: %s, %s. Please choose one of them to %s using "sh %s"' % \
@@ -544,7 +542,7 @@ class SecretHitler(Game):
                 await message.channel.send('Error: %s is not part of the game.' % target.name)
                 return
             self.waiting_for_special = False
-            self.players.remove(player)
+            self.remove_player(player)
             self.dead_players.append(player)
             self.mute(player)
             # Make a public announcement
@@ -601,11 +599,12 @@ class SecretHitler(Game):
             roles.append((FASCIST, FASCIST))
         roles.append((HITLER, FASCIST))
         # Randomly assign them to players
-        random.shuffle(roles)
+        self.random.shuffle(roles)
         for player, (role, party) in zip(self.players, roles):
             player.role = role
             player.party = party
         # Disclose information to players as appropriate
+        messages = []
         for player in self.players:
             info = 'Your role for this game: **%s**\nYour party: **%s**\n' % (self.ROLE_NAMES[player.role], self.ROLE_NAMES[player.party])
             # Non-Hitler Fascists know who the other fascists are, and which one is Hitler
@@ -619,8 +618,9 @@ class SecretHitler(Game):
             elif (player.role == HITLER) and (N <= 6):
                 other_fascist = [p.user.name for p in self.players if (p != player) and (p.role == FASCIST)][0]
                 info += '%s is the other %s\n' % (other_fascist, self.ROLE_NAMES[FASCIST])
-            # Send the info to the player
-            await player.user.send(info)
+            messages.append((player.user, info))
+        # Send the info to all the players at once
+        await self.broadcast(messages)
                 
 
         
@@ -677,12 +677,12 @@ Please cast your votes **privately** by DMing either "sh ja" or "sh nein" to %s.
             self.waiting_for_votes = False
             voting_msg = (await self.main_channel.send('Voting has concluded. Results are:\n%s' % \
                                                        '\n'.join(['%s: %s' % (p.user.name, 'Ja' if p.vote == JA else 'Nein') for p in self.players])))
-            await voting_msg.delete(delay=VOTE_DELAY) # Delete after a certain time
+            self.delete_later(voting_msg, VOTE_DELAY) # Delete after a certain time
             if sum([p.vote for p in self.players]) > len(self.players) // 2:
                 await self.main_channel.send('The team of %s and %s was approved!' % (self.president.user.mention, self.chancellor.user.mention))
                 self.election_tracker = 0
-                # Impose term limits
-                if len(self.players) == 5:
+                # Impose term limits (only the chancellor, once there are five or fewer players left)
+                if len(self.players) <= 5:
                     self.term_limited = [self.chancellor]
                 else:
                     self.term_limited = [self.president, self.chancellor]
@@ -728,7 +728,7 @@ Please cast your votes **privately** by DMing either "sh ja" or "sh nein" to %s.
         # Shuffle the policy deck if necessary
         if len(self.policy_deck) < 3:
             self.policy_deck = [LIBERAL] * (6 - self.liberal_policies) + [FASCIST] * (11 - self.fascist_policies)
-            random.shuffle(self.policy_deck)
+            self.random.shuffle(self.policy_deck)
             await self.main_channel.send('*Shuffling the %s deck...*' % ('problem' if self.amc_mode else 'policy'))
 
 
@@ -754,8 +754,7 @@ Please cast your votes **privately** by DMing either "sh ja" or "sh nein" to %s.
 
     async def tabulate_policies(self):
         # Determine what kind of policy was passed
-        async with self.main_channel.typing():
-            await asyncio.sleep(5) # Pause for dramatic effect
+        await self.dramatic_pause()
         policy = self.policies[0]
         self.policies = []
         if policy == LIBERAL:
@@ -768,7 +767,8 @@ Please cast your votes **privately** by DMing either "sh ja" or "sh nein" to %s.
         for p in (self.president, self.chancellor):
             self.unmute(p) # Let the president and chancellor talk again
         await self.check_for_winner()
-        await self.shuffle_policies()
+        if self.running:
+            await self.shuffle_policies()
         if self.running and (policy == FASCIST):
             # Make any special announcements necessary
             if self.fascist_policies == 3:
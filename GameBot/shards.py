@@ -0,0 +1,273 @@
+# Running the bot as several processes, each connected to Discord as one shard
+# Matthew Kroesche
+
+import asyncio
+import datetime
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import traceback
+
+from .bot import GameBot
+
+
+
+# Discord assigns each guild to shard (guild_id >> 22) % shard_count, and delivers every DM to
+# shard 0. So each shard process owns the games in its own guilds, and shard 0 keeps an index of
+# which shard every player's games live on, so that it can pass DMs along to the right one.
+# Commands from people who aren't playing (like Snarkback audience votes) belong to a game on a
+# server they share with it, which only that game's shard knows about, so shard 0 also keeps
+# track of which shards have games running, and offers such DMs to each of them in turn.
+
+
+
+
+def shard_filename(filename, shard_id, shard_count):
+    # Return the name of a shard's own copy of a data file, e.g. games-shard1of4.snapshot
+    root, ext = os.path.splitext(filename)
+    return '%s-shard%dof%d%s' % (root, shard_id, shard_count, ext)
+
+
+
+
+
+
+class ForwardedMessage(object):
+
+    # A DM that shard 0 received and passed along to the shard where the sender's game is.
+    # It has everything a command needs from a discord.Message, apart from being deletable.
+
+    forwarded = True
+
+    def __init__(self, author, channel, content, mentions):
+        self.id = 0
+        self.author = author
+        self.channel = channel
+        self.guild = None
+        self.content = content
+        self.mentions = mentions
+        self.channel_mentions = []
+        self.created_at = datetime.datetime.utcnow()
+
+    async def delete(self):
+        # The original is in shard 0's hands
+        pass
+
+
+
+
+
+
+class ShardRouter(object):
+
+    # Connects one shard to the others. Every shard tells shard 0 whenever a player joins or leaves
+    # one of its games, and whenever a server gets its first game of a kind or loses its last one;
+    # shard 0 uses this to send each DM to the shard the sender is playing on, or can see a game from.
+    # `connections` maps shard ids to multiprocessing Connections: shard 0 has one for every other
+    # shard, and the others only have one for shard 0.
+
+    def __init__(self, bot, shard_id, shard_count, connections):
+        self.bot = bot
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.connections = connections
+        self.players = {} # On shard 0, map from each user id to a dict mapping game prefixes to the shards they are playing on
+        self.guilds = {} # On shard 0, map from each game prefix to a dict mapping other shards to the set of ids of the guilds they have games of it in
+        self.offers = {} # On shard 0, map from a number to the [DM, game prefix, shards still to try, shard trying it now] for each DM being offered to other shards
+        self.unclaimed = set() # On shard 0, ids of DMs that no other shard wanted, to be handled here after all
+        self.offer_counter = itertools.count()
+        self.started = False
+        self.forwarded = 0 # Number of DMs passed along to other shards
+        # Each shard keeps its own files, and its own journal ids
+        bot.snapshots.filename = shard_filename(bot.snapshots.filename, shard_id, shard_count)
+        bot.stats.filename = shard_filename(bot.stats.filename, shard_id, shard_count)
+        if bot.journal:
+            bot.journal.counter = itertools.count(shard_id, shard_count)
+        if shard_id:
+            bot.dispatch.watcher = self.player_changed
+            bot.dispatch.guild_watcher = self.guild_changed
+        bot.router = self
+
+
+    def start(self):
+        # Start listening to the other shards. Call this once the event loop is running.
+        if not self.started:
+            loop = asyncio.get_event_loop()
+            for shard_id, connection in self.connections.items():
+                loop.add_reader(connection.fileno(), self.receive, shard_id, connection)
+            self.started = True
+
+
+    def send(self, shard_id, *message):
+        try:
+            self.connections[shard_id].send(message)
+        except (OSError, EOFError):
+            traceback.print_exc()
+
+
+    def player_changed(self, prefix, user_id, playing):
+        # Called by the DispatchTable on every shard apart from 0
+        self.send(0, 'player', prefix, user_id, playing)
+
+
+    def guild_changed(self, prefix, guild_id, present):
+        # Called by the DispatchTable on every shard apart from 0
+        self.send(0, 'guild', prefix, guild_id, present)
+
+
+    def receive(self, shard_id, connection):
+        # Called by the event loop when another shard has sent us something
+        try:
+            message = connection.recv()
+        except (OSError, EOFError):
+            # The other shard has gone away, so forget about its players and games
+            asyncio.get_event_loop().remove_reader(connection.fileno())
+            for user_id, shards in list(self.players.items()):
+                for prefix in [prefix for prefix, shard in shards.items() if shard == shard_id]:
+                    del shards[prefix]
+                if not shards:
+                    del self.players[user_id]
+            for prefix, shards in list(self.guilds.items()):
+                shards.pop(shard_id, None)
+                if not shards:
+                    del self.guilds[prefix]
+            for number in [number for number, offer in self.offers.items() if offer[3] == shard_id]:
+                self.offer(number)
+            return
+        if message[0] == 'player':
+            prefix, user_id, playing = message[1:]
+            shards = self.players.setdefault(user_id, {})
+            if playing:
+                shards[prefix] = shard_id
+            elif shards.get(prefix) == shard_id:
+                del shards[prefix]
+            if not shards:
+                del self.players[user_id]
+        elif message[0] == 'guild':
+            prefix, guild_id, present = message[1:]
+            shards = self.guilds.setdefault(prefix, {})
+            if present:
+                shards.setdefault(shard_id, set()).add(guild_id)
+            else:
+                guild_ids = shards.get(shard_id, set())
+                guild_ids.discard(guild_id)
+                if not guild_ids:
+                    shards.pop(shard_id, None)
+            if not shards:
+                del self.guilds[prefix]
+        elif message[0] == 'dm':
+            asyncio.ensure_future(self.deliver(*message[1:]))
+        elif message[0] == 'offer':
+            # Take a DM from someone who isn't playing if they share a server with one of our games
+            number, prefix, author_id, content, mention_ids = message[1:]
+            if self.bot.dispatch.find_shared(prefix, author_id):
+                self.send(0, 'taken', number)
+                asyncio.ensure_future(self.deliver(author_id, content, mention_ids))
+            else:
+                self.send(0, 'declined', number)
+        elif message[0] == 'taken':
+            self.offers.pop(message[1], None)
+        elif message[0] == 'declined':
+            self.offer(message[1])
+
+
+    def forward(self, message):
+        # Called by on_message() for every DM. Passes it along to any other shards that need it, and
+        # returns True if this shard should handle it as well.
+        if self.shard_id or getattr(message, 'forwarded', False):
+            return True
+        if message.id in self.unclaimed:
+            self.unclaimed.discard(message.id)
+            return True
+        shards = self.players.get(message.author.id, {})
+        payload = ('dm', message.author.id, message.content, [user.id for user in message.mentions])
+        words = message.content.lower().split(' ', 1)
+        if (len(words) == 2) and (words[0] in self.bot.registry):
+            prefix = words[0]
+            # A command goes to the shard where the sender is playing that game, if that isn't us
+            if self.bot.dispatch.find_player(prefix, message.author)[0]:
+                return True
+            if prefix in shards:
+                self.forwarded += 1
+                self.send(shards[prefix], *payload)
+                return False
+            # Otherwise it goes to a game on a server they share with it, if there is one, trying ours first
+            if self.bot.dispatch.find_shared(prefix, message.author.id) or (prefix not in self.guilds):
+                return True
+            number = next(self.offer_counter)
+            self.offers[number] = [message, prefix, sorted(self.guilds[prefix]), None]
+            self.offer(number)
+            return False
+        # Anything else might be the answer to a question one of their games asked them
+        for shard_id in set(shards.values()):
+            self.forwarded += 1
+            self.send(shard_id, *payload)
+        return True
+
+
+    def offer(self, number):
+        # Offer a DM from someone who isn't playing to the next shard with a game they might share a
+        # server with. If none of them take it, it is handled here after all.
+        if number not in self.offers:
+            return
+        message, prefix, shard_ids = self.offers[number][:3]
+        if shard_ids:
+            shard_id = self.offers[number][3] = shard_ids.pop(0)
+            self.forwarded += 1
+            self.send(shard_id, 'offer', number, prefix, message.author.id, message.content,
+                      [user.id for user in message.mentions])
+        else:
+            del self.offers[number]
+            self.unclaimed.add(message.id)
+            asyncio.ensure_future(self.bot.deliver(message))
+
+
+    async def deliver(self, author_id, content, mention_ids):
+        # Handle a DM forwarded by shard 0
+        try:
+            author = (self.bot.get_user(author_id) or await self.bot.fetch_user(author_id))
+            channel = await author.create_dm()
+            mentions = [user for user in map(self.bot.get_user, mention_ids) if user]
+            await self.bot.deliver(ForwardedMessage(author, channel, content, mentions))
+        except Exception:
+            traceback.print_exc()
+
+
+
+
+
+
+##### Running the shards #####
+
+
+def run_shard(game_classes, shard_id, shard_count, connections, debug=False):
+    # Entry point for each shard's process
+    client = GameBot(game_classes, debug, shard_id=shard_id, shard_count=shard_count)
+    ShardRouter(client, shard_id, shard_count, connections)
+    client.run()
+
+
+
+def run_shards(game_classes, shard_count, debug=False):
+    # Run `shard_count` shards, one process each, until any of them stops
+    pipes = [multiprocessing.Pipe() for shard_id in range(1, shard_count)]
+    processes = []
+    for shard_id in range(shard_count):
+        if shard_id:
+            connections = {0: pipes[shard_id - 1][1]}
+        else:
+            connections = dict([(i + 1, pipe[0]) for i, pipe in enumerate(pipes)])
+        process = multiprocessing.Process(target=run_shard, name='shard-%d' % shard_id,
+                                          args=(game_classes, shard_id, shard_count, connections, debug))
+        process.start()
+        processes.append(process)
+    try:
+        multiprocessing.connection.wait([process.sentinel for process in processes])
+    finally:
+        # If one shard goes down, take the rest down with it, so they all restart together
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,362 @@
+# Crash-safe snapshots of running games
+# Matthew Kroesche
+
+import discord
+import asyncio
+import enum
+import json
+import os
+import sys
+import time
+import traceback
+import zlib
+
+from .game import DATA_DIR, STARTING_DELAY
+
+
+
+SNAPSHOT_FILE = os.path.join(DATA_DIR, 'games.snapshot') # Where the snapshot of all the running games is kept
+SNAPSHOT_MAGIC = b'GBSNAP' # Marks the start of a snapshot file
+SNAPSHOT_VERSION = 1 # Bump this whenever the snapshot format changes
+SNAPSHOT_INTERVAL = 60 # Number of seconds between periodic snapshots
+SNAPSHOT_SLICE_TIME = 0.005 # Let the event loop run after encoding games for this long (in seconds)
+SNAPSHOT_WARN_TIME = 0.05 # Complain if encoding a snapshot holds up the event loop for longer than this (in seconds)
+
+ListIterator = type(iter([]))
+
+
+
+def record_fields(value):
+    # Return the field names of a recordclass instance, or None if it isn't one.
+    # (Older versions of recordclass call this _fields, newer ones __fields__.)
+    cls = type(value)
+    return getattr(cls, '__fields__', None) or getattr(cls, '_fields', None)
+
+
+
+
+
+##### Encoding and decoding game state #####
+
+
+class Encoder(object):
+
+    # Turns the saved attributes of a game into plain JSON data.
+    # Records (such as Players) are stored once in a table and referred to by index, so that
+    # the same Player appearing in several places is still a single Player after a restore.
+    # Discord users and channels are stored by id.
+
+    def __init__(self):
+        self.records = [] # Encoded records, in the order they were first seen
+        self.memo = {} # Map from id() of each record to its index in self.records
+        self.users = set() # Ids of every user referenced by the game
+        self.channels = set() # Ids of every channel referenced by the game
+
+
+    def encode(self, value):
+        if (value is None) or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, list):
+            return [self.encode(v) for v in value]
+        fields = record_fields(value)
+        if fields:
+            index = self.memo.get(id(value))
+            if index is None:
+                # Reserve the slot first, since records can refer to each other in a cycle
+                index = self.memo[id(value)] = len(self.records)
+                self.records.append(None)
+                self.records[index] = [type(value).__name__, [self.encode(getattr(value, f)) for f in fields]]
+            return {'R': index}
+        if isinstance(value, tuple):
+            return {'T': [self.encode(v) for v in value]}
+        if isinstance(value, dict):
+            return {'D': [[self.encode(k), self.encode(v)] for k, v in value.items()]}
+        if isinstance(value, (set, frozenset)):
+            return {'S': [self.encode(v) for v in value]}
+        if isinstance(value, enum.Enum):
+            return {'E': [type(value).__name__, value.value]}
+        if isinstance(value, ListIterator):
+            reduced = value.__reduce__() # (iter, (list,), index), or (iter, ([],)) once it is exhausted
+            return {'I': [self.encode(list(reduced[1][0])), (reduced[2] if len(reduced) > 2 else 0)]}
+        if hasattr(value, 'id'):
+            if isinstance(getattr(value, 'type', None), discord.ChannelType):
+                self.channels.add(value.id)
+                return {'C': value.id}
+            self.users.add(value.id)
+            return {'U': value.id}
+        raise TypeError('Cannot snapshot a value of type %s' % type(value).__name__)
+
+
+
+
+
+class Decoder(object):
+
+    # Turns data produced by an Encoder back into game state. `module` is the module the game
+    # class is defined in, which is where its record and enum types are looked up.
+
+    def __init__(self, module, records, users, channels):
+        self.module = module
+        self.users = users # Map from user ids to discord.Users
+        self.channels = channels # Map from channel ids to channels
+        # Create all the records up front, and fill in their fields afterwards
+        self.records = []
+        for name, fields in records:
+            cls = getattr(module, name)
+            self.records.append(cls(*[None] * len(fields)))
+        for record, (name, fields) in zip(self.records, records):
+            for field, value in zip(record_fields(record), fields):
+                setattr(record, field, self.decode(value))
+
+
+    def decode(self, value):
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        tag, data = next(iter(value.items()))
+        if tag == 'R':
+            return self.records[data]
+        if tag == 'T':
+            return tuple([self.decode(v) for v in data])
+        if tag == 'D':
+            return dict([(self.decode(k), self.decode(v)) for k, v in data])
+        if tag == 'S':
+            return set([self.decode(v) for v in data])
+        if tag == 'E':
+            return getattr(self.module, data[0])(data[1])
+        if tag == 'I':
+            iterator = iter(self.decode(data[0]))
+            iterator.__setstate__(data[1])
+            return iterator
+        if tag == 'U':
+            return self.users[data]
+        if tag == 'C':
+            return self.channels[data]
+        raise ValueError('Unknown snapshot tag %r' % tag)
+
+
+
+
+
+
+##### Snapshot manager #####
+
+
+class Snapshots(object):
+
+    # Periodically saves the state of every running game to local disk, and restores them
+    # when the bot starts up again. Only encoding the game state happens on the event loop;
+    # compressing and writing the file happen on an executor thread. Each game is kept as JSON
+    # text, which the garbage collector doesn't track, so a snapshot of many games doesn't set
+    # off full collections in the middle of encoding.
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.filename = SNAPSHOT_FILE # Each shard keeps its own file
+        self.states = {} # Map from each game to its most recent encoded state, as JSON text
+        self.restored = False # True once any saved games have been restored. Nothing is saved before then.
+        self.handle = None # Scheduler Timer for the next periodic snapshot
+        self.last_data = None # The bytes most recently written to disk
+        self.encode_time = 0.0 # Seconds spent on the event loop encoding the last snapshot
+        self.slice_time = 0.0 # The longest the event loop was held up at once while encoding the last snapshot
+        self.max_slice_time = 0.0 # The longest that has ever been
+        self.write_time = 0.0 # Seconds spent writing the last snapshot
+        self.size = 0 # Size in bytes of the last snapshot
+
+
+    def encode_game(self, game):
+        # Return the JSON-ready state of a single game
+        encoder = Encoder()
+        state = encoder.encode(game.save_state())
+        timer = game.starting_timer_handle
+        return {
+            'prefix': game.prefix,
+            'state': state,
+            'records': encoder.records,
+            'users': sorted(encoder.users),
+            'channels': sorted(encoder.channels),
+            'muted': sorted(self.bot.muted_users.get(game, {})),
+            'starting': (max(timer.deadline - self.bot.scheduler.time(), 0) if (timer and timer.active()) else None),
+            }
+
+
+    def encode_into(self, states, game):
+        # Add the JSON text of a game's state to `states`, if it is in progress. A game that is in
+        # the middle of handling a command may be halfway through changing its state, so its
+        # previous state is kept instead.
+        if not game.owner:
+            return
+        if not game.pending:
+            try:
+                states[game] = json.dumps(self.encode_game(game), separators=(',', ':'))
+                return
+            except Exception:
+                traceback.print_exc()
+        if game in self.states:
+            states[game] = self.states[game]
+
+
+    def finish_encoding(self, states, encode_time, slice_time):
+        # Record the results of encoding a snapshot. Returns the list of encoded games.
+        self.states = dict([(game, state) for game, state in states.items() if game.owner]) # Drop any that ended in the meantime
+        self.encode_time = encode_time
+        self.slice_time = slice_time
+        self.max_slice_time = max(self.max_slice_time, slice_time)
+        if slice_time > SNAPSHOT_WARN_TIME:
+            print('Warning: encoding a snapshot held up the event loop for %.1f ms' % (slice_time * 1000), file=sys.stderr)
+        return list(self.states.values())
+
+
+    def encode(self):
+        # Encode every game in one go
+        start = time.perf_counter()
+        states = {}
+        for game in self.bot.games:
+            self.encode_into(states, game)
+        elapsed = time.perf_counter() - start
+        return self.finish_encoding(states, elapsed, elapsed)
+
+
+    async def encode_async(self):
+        # Encode every game, giving the event loop a chance to run whenever a slice of
+        # SNAPSHOT_SLICE_TIME has been used up. Each game is still encoded in one piece.
+        states = {}
+        encode_time = slice_time = 0.0
+        start = time.perf_counter()
+        for game in list(self.bot.games):
+            self.encode_into(states, game)
+            elapsed = time.perf_counter() - start
+            if elapsed > SNAPSHOT_SLICE_TIME:
+                encode_time += elapsed
+                slice_time = max(slice_time, elapsed)
+                await asyncio.sleep(0)
+                start = time.perf_counter()
+        elapsed = time.perf_counter() - start
+        return self.finish_encoding(states, encode_time + elapsed, max(slice_time, elapsed))
+
+
+    def write(self, games):
+        # Compress and atomically write a snapshot, given the JSON text of each game. Safe to call from an executor thread.
+        # The file is skipped if nothing has changed since the last time.
+        start = time.perf_counter()
+        data = SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]) + zlib.compress(('[%s]' % ','.join(games)).encode('utf-8'))
+        if data != self.last_data:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            with open(self.filename + '.tmp', 'wb') as o:
+                o.write(data)
+                o.flush()
+                os.fsync(o.fileno())
+            os.replace(self.filename + '.tmp', self.filename)
+            self.last_data = data
+        self.size = len(data)
+        self.write_time = time.perf_counter() - start
+
+
+    def read(self):
+        # Read the snapshot file. Returns the list of saved games, or None if there isn't a usable one.
+        try:
+            with open(self.filename, 'rb') as o:
+                data = o.read()
+        except FileNotFoundError:
+            return None
+        offset = len(SNAPSHOT_MAGIC)
+        if (data[:offset] != SNAPSHOT_MAGIC) or (data[offset:offset+1] != bytes([SNAPSHOT_VERSION])):
+            print('Warning: ignoring snapshot file %s with an unknown format' % self.filename, file=sys.stderr)
+            return None
+        try:
+            return json.loads(zlib.decompress(data[offset+1:]).decode('utf-8'))
+        except (zlib.error, ValueError):
+            traceback.print_exc()
+            return None
+
+
+    async def save(self):
+        # Take a snapshot and write it to disk without blocking the event loop
+        if self.restored:
+            games = (await self.encode_async())
+            await asyncio.get_event_loop().run_in_executor(None, self.write, games)
+
+
+    def save_now(self):
+        # Take a snapshot and write it right away. Used when the bot is shutting down.
+        if self.restored:
+            self.write(self.encode())
+
+
+    def start(self):
+        # Start taking periodic snapshots
+        if self.handle is None:
+            self.handle = self.bot.scheduler.schedule(SNAPSHOT_INTERVAL, self.tick, tag='snapshot')
+
+
+    async def tick(self):
+        self.handle = self.bot.scheduler.schedule(SNAPSHOT_INTERVAL, self.tick, tag='snapshot')
+        await self.save()
+
+
+
+    async def restore(self):
+        # Rebuild every game that was saved in the snapshot file, and let the players know
+        games = (await asyncio.get_event_loop().run_in_executor(None, self.read)) or []
+        restored = []
+        for record in games:
+            try:
+                game = await self.restore_game(record)
+            except Exception:
+                traceback.print_exc()
+                game = None
+            if game:
+                restored.append(game)
+        self.restored = True
+        for game in restored:
+            try:
+                await game.resume()
+            except Exception:
+                traceback.print_exc()
+        return restored
+
+
+    async def restore_game(self, record):
+        # Rebuild a single game from its saved record. Returns the game, or None if it can no longer be played.
+        bot = self.bot
+        if record['prefix'] in bot.unloaded:
+            await bot.load_game(record['prefix'])
+        templates = [game for game in bot.games if game.prefix == record['prefix']]
+        if not templates:
+            return None
+        channels = {}
+        for id in record['channels']:
+            channels[id] = bot.get_channel(id)
+            if channels[id] is None:
+                return None # The channel has been deleted since
+        users = {}
+        for id in record['users']:
+            users[id] = bot.get_user(id)
+            if users[id] is None:
+                try:
+                    users[id] = (await bot.fetch_user(id))
+                except discord.HTTPException:
+                    return None
+        cls = type(templates[0])
+        state = Decoder(sys.modules[cls.__module__], record['records'], users, channels).decode(record['state'])
+        if bot.dispatch.game_in_channel(cls.prefix, state['main_channel']):
+            return None # Someone has already started another game here
+        # Reuse an idle instance of the game if there is one, like gb_create does
+        game = next((game for game in templates if not game.owner), None)
+        if game is None:
+            game = cls(bot)
+            bot.add_game(game)
+            await game.setup()
+        game.load_state(state)
+        for player in game.players:
+            bot.dispatch.add_player(game, player)
+        bot.dispatch.update(game)
+        # Executed Secret Hitler players are no longer in the player list, but stay muted
+        for player in game.players + getattr(game, 'dead_players', []):
+            if player.user.id in record['muted']:
+                game.mute(player)
+        if not game.running:
+            delay = (STARTING_DELAY if record['starting'] is None else record['starting'])
+            game.starting_timer_handle = game.schedule(delay, game.starting_timer, tag='starting')
+        return game
@@ -2,14 +2,21 @@
 # Matthew Kroesche
 
 import discord
+import aiohttp
 import recordclass
 import random
 import os
+import json
 import datetime
 import asyncio
+import collections
+import array
+import math
+import traceback
 import urllib.request
+import sys
 
-from .game import Game
+from .game import Game, DATA_DIR
 
 
 
@@ -24,6 +31,17 @@ Player = recordclass.recordclass('Player', 'user score round_score prompts snark
 
 
 
+Countdown = recordclass.recordclass('Countdown', 'text delay after start message shown warned')
+# text: the description shown on the countdown message
+# delay: the length of the countdown in seconds
+# after: the coroutine function to call when time runs out
+# start: the event loop time when the countdown started
+# message: the discord.Message displaying the countdown, once it has been posted
+# shown: the number of seconds currently displayed on the countdown message
+# warned: True once everyone we're waiting on has been told to hurry up
+
+
+
 MAX_SNARK_SIZE = 50 # The maximum length of a reply to a prompt
 
 # Timer settings
@@ -33,108 +51,336 @@ VOTING_TIMER = 20 # The timer for voting
 FINAL_VOTING_TIMER = 40 # The timer for voting in round three
 WARNING_TIME = 10 # The time at which a warning message is DMed to everyone we're waiting on
 
+# Countdown display settings
+TICK_INTERVAL = 1 # How often (in seconds) the countdown ticker checks all the running countdowns
+COUNTDOWN_STEPS = [(60, 30), (2 * WARNING_TIME, 10), (0, 5)] # With more than the first number of seconds left, the
+                                                             # countdown message counts down in steps of the second number
+
 RESET_DELAY = datetime.timedelta(hours=6) # After six hours of inactivity, reset all the questions
+MAX_REJECTION = 16 # Draw questions by rejection while at least 1/MAX_REJECTION of the total weight is still in a deck
+
+# Question loading settings
+QUESTION_TIMEOUT = 30 # Give up on downloading the questions after this many seconds
+QUESTION_REFRESH = 60 * 60 # Check for new questions once an hour
+QUESTION_CACHE = os.path.join(DATA_DIR, 'sb_questions.txt') # The last good copy of the question file
+QUESTION_CACHE_INFO = os.path.join(DATA_DIR, 'sb_questions.json') # Validators (ETag/Last-Modified) for the cached copy
+
+
+
+
+
+
+
+##### Deck helper classes #####
+
+
+class WeightedSampler(object):
+
+    # Samples integer ids, each with probability proportional to its weight, using a Fenwick
+    # tree over the weights. Drawing an id is O(log n). It never changes once it is built, so
+    # one sampler can be shared by every deck drawing from the same question bank.
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.tree = array.array('q', [0])
+        self.tree.extend(weights)
+        for i in range(1, self.size + 1):
+            j = i + (i & -i)
+            if j <= self.size:
+                self.tree[j] += self.tree[i]
+        self.total = sum(weights)
+        self.top = 1 << self.size.bit_length() if self.size else 0
+
 
+    def find(self, value):
+        # Return the id whose cumulative weight range contains `value` (0 <= value < total)
+        pos = 0
+        mask = self.top
+        while mask:
+            nxt = pos + mask
+            if (nxt <= self.size) and (self.tree[nxt] <= value):
+                pos = nxt
+                value -= self.tree[nxt]
+            mask >>= 1
+        return pos
 
 
+    def sample(self):
+        # Draw a random id
+        return self.find(random.randrange(self.total))
 
 
 
 
-##### Deck helper class #####
+
+class QuestionBank(object):
+
+    # An immutable set of questions, shared by the decks of every server. Questions are
+    # identified by integer ids: normal questions come first, then custom ones.
+
+    def __init__(self, normal_questions=(), custom_questions=(), loaded=False):
+        self.normal_questions = tuple([sys.intern(q) for q in normal_questions])
+        self.custom_questions = tuple([sys.intern(q) for q in custom_questions])
+        self.n_normal = len(self.normal_questions)
+        self.size = self.n_normal + len(self.custom_questions)
+        self.loaded = loaded
+        self.samplers = {} # Map from custom question ratios to the WeightedSampler over every question
+
+
+    @classmethod
+    def parse(cls, data):
+        # Create a question bank from the contents of the question file
+        if isinstance(data, bytes):
+            data = data.decode()
+        questions = data.strip().splitlines()
+        separator = questions.index('')
+        return cls(questions[:separator], questions[separator+1:], True)
+
+
+    def question(self, id):
+        # Look up a question by id
+        if id < self.n_normal:
+            return self.normal_questions[id]
+        return self.custom_questions[id - self.n_normal]
+
+
+    def sampler(self, ratio):
+        # Return the sampler over every question, with custom questions `ratio` times as likely to be
+        # drawn as normal ones. It is built the first time a deck needs it, and then shared.
+        sampler = self.samplers.get(ratio)
+        if sampler is None:
+            sampler = self.samplers[ratio] = WeightedSampler([1] * self.n_normal + [ratio] * (self.size - self.n_normal))
+        return sampler
+
+
+
 
 
 class Deck(object):
 
+    # The draw state of a single server. The questions themselves, and the sampler used to
+    # draw them, live in the shared QuestionBank; a deck only keeps a bitmap of the ones it has
+    # used. Draws are made from the shared sampler, skipping used questions, until most of the
+    # weight has been drawn; the last few questions are picked straight from the bitmap.
+
+    bank = QuestionBank() # The most recently loaded question bank
+    deck_cache = collections.OrderedDict() # Map from guild ids to decks, least recently used first
+    refresh_task = None
+
+
     def __init__(self):
-        self.questions = []
-        self.normal_questions = []
-        self.custom_questions = []
-        self.used_questions = []
-        self.loaded = False
-        self.length = 0
+        self.questions = None # The QuestionBank this deck is currently drawing from
+        self.used_questions = bytearray() # Bit (id & 7) of byte (id >> 3) is set if the question has been drawn since the last reshuffle
+        self.normal_left = 0 # Number of normal questions that have not been drawn since the last reshuffle
+        self.custom_left = 0 # Number of custom questions that have not been drawn since the last reshuffle
         self.custom_ratio = 1
+        self.guild_id = None # The id of the server this deck belongs to
+        self.last_used = datetime.datetime.now()
 
 
-    deck_cache = {}
+    @property
+    def loaded(self):
+        return self.bank.loaded
 
 
-    def cache_for_server(self, guild):
-        if self.loaded:
-            self.deck_cache[guild.id] = self
+    @classmethod
+    def load_for_server(cls, guild):
+        # Look up the deck for this server, creating it if necessary
+        deck = cls.deck_cache.get(guild.id)
+        if deck is None:
+            deck = cls.deck_cache[guild.id] = cls()
+            deck.guild_id = guild.id
+        deck.touch()
+        cls.evict()
+        return deck
+
+
+    def touch(self):
+        # Mark this deck as the most recently used one
+        self.last_used = datetime.datetime.now()
+        if self.deck_cache.get(self.guild_id) is self:
+            self.deck_cache.move_to_end(self.guild_id)
 
 
     @classmethod
-    def load_for_server(cls, guild):
-        for id, deck in cls.deck_cache.items():
-            if id == guild.id:
-                return deck
-        new = cls.global_deck.copy()
-        new.cache_for_server(guild)
-        return new
-
-
-    def load(self):
-        # Load all the questions from the file
-        if not self.loaded:
-            url = os.getenv('GAMEBOT_SB_QUESTIONS')
-            with urllib.request.urlopen(url) as o:
-                data = o.read()
-            if isinstance(data, bytes):
-                data = data.decode()
-            questions = data.strip().splitlines()
-            separator = questions.index('')
-            self.normal_questions = questions[:separator]
-            self.custom_questions = questions[separator+1:]
-            self.loaded = True
-        self.questions = []
-        self.used_questions = []
-        self.length = 0
-
-
-    def copy(self):
-        # Create and return a copy of this deck
-        new = Deck()
-        new.questions = self.questions[:]
-        new.normal_questions = self.normal_questions[:]
-        new.custom_questions = self.custom_questions[:]
-        new.used_questions = self.used_questions[:]
-        new.loaded = self.loaded
-        new.length = self.length
-        new.custom_ratio = self.custom_ratio
-        return new
+    def evict(cls):
+        # Forget about servers that have not played for longer than RESET_DELAY.
+        # (Their questions would have been reset anyway.)
+        now = datetime.datetime.now()
+        while cls.deck_cache:
+            id, deck = next(iter(cls.deck_cache.items()))
+            if now - deck.last_used <= RESET_DELAY:
+                break
+            del cls.deck_cache[id]
 
 
-    def shuffle(self):
-        # Shuffle all the questions back into the pool, duplicating custom questions
-        # the appropriate number of times
-        self.questions = self.normal_questions + self.custom_questions * self.custom_ratio
-        if self.custom_ratio:
-            self.length = len(self.normal_questions) + len(self.custom_questions)
+    @classmethod
+    def load_cache(cls):
+        # Load the questions from the on-disk copy, if there is one.
+        # Returns True if the questions were loaded.
+        try:
+            with open(QUESTION_CACHE, encoding='utf-8') as o:
+                cls.bank = QuestionBank.parse(o.read())
+        except (OSError, ValueError):
+            return False
+        return True
+
+
+    @classmethod
+    def save_cache(cls, data, info):
+        # Atomically replace the on-disk copy of the questions
+        os.makedirs(DATA_DIR, exist_ok=True)
+        for filename, contents in ((QUESTION_CACHE, data), (QUESTION_CACHE_INFO, json.dumps(info))):
+            with open(filename + '.tmp', 'w', encoding='utf-8') as o:
+                o.write(contents)
+            os.replace(filename + '.tmp', filename)
+
+
+    @classmethod
+    async def fetch(cls):
+        # Download the questions without blocking the event loop. If the file has not changed
+        # since the cached copy was saved, nothing is downloaded.
+        # Returns True if a new set of questions was loaded.
+        url = os.getenv('GAMEBOT_SB_QUESTIONS')
+        if not url:
+            return False
+        if not url.startswith(('http://', 'https://')):
+            # Some other kind of URL (e.g. a local file), so let urllib deal with it on another thread
+            def read():
+                with urllib.request.urlopen(url, timeout=QUESTION_TIMEOUT) as o:
+                    return o.read().decode()
+            data = await asyncio.get_running_loop().run_in_executor(None, read)
+            cls.bank = QuestionBank.parse(data)
+            return True
+        info = {}
+        headers = {}
+        if cls.bank.loaded:
+            try:
+                with open(QUESTION_CACHE_INFO, encoding='utf-8') as o:
+                    info = json.load(o)
+            except (OSError, ValueError):
+                pass
+            if info.get('url') == url:
+                if info.get('etag'):
+                    headers['If-None-Match'] = info['etag']
+                if info.get('last_modified'):
+                    headers['If-Modified-Since'] = info['last_modified']
+        timeout = aiohttp.ClientTimeout(total=QUESTION_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return False # Not modified
+                response.raise_for_status()
+                data = await response.text()
+                info = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        cls.bank = QuestionBank.parse(data)
+        try:
+            cls.save_cache(data, info)
+        except OSError:
+            traceback.print_exc() # Not fatal, we just won't have a copy next time
+        return True
+
+
+    @classmethod
+    async def refresh(cls):
+        # Background task that periodically checks for new questions. Decks switch over
+        # to the new questions the next time they are used.
+        while True:
+            try:
+                await cls.fetch()
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError):
+                traceback.print_exc() # Keep using whatever questions we already have
+            cls.evict()
+            await asyncio.sleep(QUESTION_REFRESH)
+
+
+    def weight(self, id):
+        # Custom questions are `custom_ratio` times as likely to be drawn as normal ones
+        if id < self.questions.n_normal:
+            return 1
+        return self.custom_ratio
+
+
+    @property
+    def length(self):
+        # The number of questions that can still be drawn before the deck is reshuffled
+        return self.normal_left + (self.custom_left if self.custom_ratio else 0)
+
+
+    def used(self, id):
+        return (self.used_questions[id >> 3] >> (id & 7)) & 1
+
+
+    def mark_used(self, id):
+        self.used_questions[id >> 3] |= 1 << (id & 7)
+        if id < self.questions.n_normal:
+            self.normal_left -= 1
         else:
-            self.length = len(self.normal_questions)
-        self.used_questions = []
-        random.shuffle(self.questions)
+            self.custom_left -= 1
+
+
+    def build(self, used_ids):
+        # Put every question back into the pool, apart from the given ids
+        self.used_questions = bytearray((self.questions.size + 7) >> 3)
+        self.normal_left = self.questions.n_normal
+        self.custom_left = self.questions.size - self.questions.n_normal
+        for id in used_ids:
+            self.mark_used(id)
+
+
+    def rebase(self):
+        # Switch over to the latest question bank, keeping track of which questions have already been used
+        old = self.questions
+        self.questions = self.bank
+        if old is None:
+            self.build(())
+            return
+        used_text = set([old.question(id) for id in range(old.size) if self.used(id)])
+        self.build([id for id in range(self.questions.size) if self.questions.question(id) in used_text])
+
+
+    def shuffle(self):
+        # Shuffle all the questions back into the pool
+        self.questions = self.bank
+        self.build(())
+
+
+    def remaining(self):
+        # Return the ids of the questions that can still be drawn
+        size = self.questions.size
+        ids = []
+        for i, byte in enumerate(self.used_questions):
+            if byte != 0xff:
+                ids.extend([id for id in range(i << 3, min((i + 1) << 3, size)) if not ((byte >> (id & 7)) & 1)])
+        return [id for id in ids if self.weight(id)]
 
 
     def draw(self, n):
         # Draw and return `n` questions from the pool, and mark them used so they
         # will not appear again until the deck is reshuffled
+        if self.questions is not self.bank:
+            self.rebase()
         if self.length < n:
             self.shuffle()
+        sampler = self.questions.sampler(self.custom_ratio)
+        pool = None
         questions = []
-        while len(questions) < n:
-            question = self.questions.pop()
-            if question in self.used_questions:
-                continue
-            questions.append(question)
-            self.used_questions.append(question)
-            self.length -= 1
+        for i in range(n):
+            if (pool is None) and ((self.normal_left + self.custom_ratio * self.custom_left) * MAX_REJECTION >= sampler.total):
+                # Most of the weight is still in the deck, so a few tries will find a question we haven't used
+                id = sampler.sample()
+                while self.used(id):
+                    id = sampler.sample()
+            else:
+                # Near the end of the deck, so pick from the questions that are left
+                if pool is None:
+                    pool = self.remaining()
+                id = random.choices(pool, [self.weight(id) for id in pool])[0]
+                pool.remove(id)
+            questions.append(self.questions.question(id))
+            self.mark_used(id)
+        self.touch()
         return questions
-            
-            
-        
-Deck.global_deck = Deck()
     
         
 
@@ -152,6 +398,91 @@ Deck.global_deck = Deck()
 
 
 
+##### Countdown helper class #####
+
+
+class CountdownTicker(object):
+
+    # Drives the visible countdowns of every Snarkback game from a single scheduler timer.
+    # Countdown messages are edited coarsely while there is plenty of time left and more
+    # finely as time runs out, and only when the displayed number actually changes.
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.countdowns = {} # Map from each game to its running Countdown
+        self.handle = None # Scheduler Timer for the next tick
+        self.edits = collections.deque() # Event loop times of recent countdown message edits
+
+
+    @staticmethod
+    def display(remaining):
+        # Return the number of seconds to show on a countdown message
+        for threshold, step in COUNTDOWN_STEPS:
+            if remaining > threshold:
+                return int(math.ceil(remaining / step)) * step
+        return 0
+
+
+    def add(self, game, countdown):
+        self.countdowns[game] = countdown
+        if self.handle is None:
+            self.handle = self.scheduler.schedule(TICK_INTERVAL, self.tick, tag='countdown')
+
+
+    def remove(self, game):
+        self.countdowns.pop(game, None)
+        if (not self.countdowns) and self.handle:
+            self.scheduler.cancel(self.handle)
+            self.handle = None
+
+
+    async def tick(self):
+        # Check every countdown, and do whatever edits, warnings and timeouts are needed
+        self.handle = None
+        now = asyncio.get_running_loop().time()
+        jobs = []
+        for game, countdown in list(self.countdowns.items()):
+            remaining = countdown.delay - (now - countdown.start)
+            if remaining <= 0:
+                del self.countdowns[game]
+                jobs.append(game.run_pending(game.timer_expired, (countdown,)))
+                continue
+            shown = self.display(remaining)
+            if countdown.message and (shown != countdown.shown):
+                countdown.shown = shown
+                self.edits.append(now)
+                jobs.append(countdown.message.edit(content = '%s: less than **%d** seconds' % (countdown.text, shown)))
+            if (remaining <= WARNING_TIME) and not countdown.warned:
+                countdown.warned = True
+                jobs.append(game.run_pending(game.timer_warning, (countdown, int(math.ceil(remaining)))))
+        if self.countdowns:
+            self.handle = self.scheduler.schedule(TICK_INTERVAL, self.tick, tag='countdown')
+        for result in (await asyncio.gather(*jobs, return_exceptions=True)):
+            if isinstance(result, Exception):
+                traceback.print_exception(type(result), result, result.__traceback__)
+
+
+    def edits_per_minute(self):
+        # Return the number of countdown message edits made in the last minute
+        now = asyncio.get_event_loop().time()
+        while self.edits and (now - self.edits[0] > 60):
+            self.edits.popleft()
+        return len(self.edits)
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
 ##### Main class #####
 
 
@@ -160,15 +491,25 @@ class Snarkback(Game):
 
     name = 'Snarkback'
     prefix = 'sb'
+    transient = Game.transient + ('deck', 'countdown', 'starting_time', 'delay_time', 'last_start', 'saved_countdown')
     
 
     def __init__(self, bot):
         Game.__init__(self, bot)
         self.last_start = None
+        self.saved_countdown = None
 
     def create_player(self, user):
         return Player(user, 0, 0, [], [], [], 0)
 
+    @property
+    def ticker(self):
+        # The CountdownTicker shared by every Snarkback game running on this bot
+        ticker = getattr(self.bot, 'countdown_ticker', None)
+        if ticker is None:
+            ticker = self.bot.countdown_ticker = CountdownTicker(self.bot.scheduler)
+        return ticker
+
     async def create(self, message):
         self.round          = 0     # The current number of the round we are on
         self.prompts        = []    # The list of prompts being used in this round
@@ -177,7 +518,7 @@ class Snarkback(Game):
         self.current_snark  = None  # The snark currently being voted on
         self.voting         = False # True if the voting for this prompt is currently open.
         self.timed          = True  # True if this is a timed game
-        self.timer_task     = None  # The current timer task, if any
+        self.countdown      = None  # The current Countdown, if any
         self.delay_time     = None  # The current delay set on the timer
         self.starting_time  = None  # The time when the timer started, if any
         # Create the deck
@@ -185,24 +526,55 @@ class Snarkback(Game):
 
 
     async def setup(self):
-        Deck.global_deck.load()
-        if self.owner:
+        # Use the cached copy of the questions right away, and download the latest
+        # version in the background.
+        if not Deck.bank.loaded:
+            Deck.load_cache()
+        if Deck.refresh_task is None:
+            Deck.refresh_task = asyncio.create_task(Deck.refresh())
+        if self.owner and Deck.bank.loaded:
             await self.main_channel.send('*Snarkback prompts have been loaded!*')
 
 
+    def save_state(self):
+        # The deck is shared with the other games on the server, so only the ratio is saved.
+        # A running countdown is saved as (text, seconds remaining, name of the after() method).
+        state = Game.save_state(self)
+        state['custom_ratio'] = self.deck.custom_ratio
+        countdown = self.countdown
+        if countdown:
+            remaining = countdown.delay - (self.clock.time() - countdown.start)
+            state['countdown'] = (countdown.text, max(int(math.ceil(remaining)), 1), countdown.after.__name__)
+        return state
+
+
+    def load_state(self, state):
+        self.saved_countdown = state.pop('countdown', None)
+        custom_ratio = state.pop('custom_ratio')
+        Game.load_state(self, state)
+        self.countdown = None
+        self.starting_time = self.delay_time = None
+        self.deck = Deck.load_for_server(self.main_channel.guild)
+        self.deck.custom_ratio = custom_ratio
+
+
+    async def resume(self):
+        await Game.resume(self)
+        if self.saved_countdown:
+            text, delay, after = self.saved_countdown
+            self.saved_countdown = None
+            self.start_timer(text, delay, getattr(self, after))
+
+
     async def start(self, message):
         if len(self.players) < 3:
             await message.channel.send('Cannot start: the game should have at least 3 players')
             self.running = False
             return
         if not self.deck.loaded:
-            if self.deck.global_deck.loaded:
-                self.deck = self.deck.global_deck.copy()
-                self.deck.cache_for_server(self.main_channel.guild)
-            else:
-                await message.channel.send('Cannot start: the questions have not been loaded yet. Please wait a moment.')
-                self.running = False
-                return
+            await message.channel.send('Cannot start: the questions have not been loaded yet. Please wait a moment.')
+            self.running = False
+            return
         # Set up the list of questions
         now = datetime.datetime.now()
         if (self.last_start is None) or (now - self.last_start > RESET_DELAY):
@@ -235,12 +607,12 @@ class Snarkback(Game):
                     return
             if player in self.players:
                 # Remove the player
-                self.players.remove(player)
+                self.remove_player(player)
                 # Make a public announcement
                 await self.main_channel.send('%s has left the game of %s.' % (message.author.mention, self.name))
                 if self.running:
                     if len(self.players) < 3:
-                        channel = self.main_channel()
+                        channel = self.main_channel
                         self.close()
                         await channel.send('The game has been canceled because there are too few players.')
                     else:
@@ -330,8 +702,7 @@ class Snarkback(Game):
             elif self.starting_time is None:
                 await message.channel.send('The clock is not currently running.')
             else:
-                loop = asyncio.get_running_loop()
-                now = loop.time()
+                now = self.clock.time()
                 diff = max(self.delay_time - int(round(now - self.starting_time)), 0)
                 if diff == 0:
                     await message.channel.send('Time is up!')
@@ -387,20 +758,20 @@ class Snarkback(Game):
         self.current_snark = None
         if self.round < 3:
             # Randomly pick one question for each player
-            self.prompts = self.deck.draw(len(self.players))
+            self.prompts = self.random.external(self.deck.draw, len(self.players))
             # Randomly assign each player two questions, so that each question is assigned
             # to exactly two players.
             # We do this by constructing a cycle. (Yay for graph theory!)
             players = list(self.players)
             prompts = list(self.prompts)
             current_player = self.players[0]
-            current_prompt = random.choice(prompts)
+            current_prompt = self.random.choice(prompts)
             players.remove(current_player)
             prompts.remove(current_prompt)
             current_player.prompts = [current_prompt]
             while players:
-                new_player = random.choice(players)
-                new_prompt = random.choice(prompts)
+                new_player = self.random.choice(players)
+                new_prompt = self.random.choice(prompts)
                 new_player.prompts = [current_prompt, new_prompt]
                 players.remove(new_player)
                 prompts.remove(new_prompt)
@@ -409,7 +780,7 @@ class Snarkback(Game):
             self.players[0].prompts.append(current_prompt) # The first player only got one prompt at the beginning
         else:
             # Randomly pick a single question for everyone
-            self.prompts = self.deck.draw(1)
+            self.prompts = self.random.external(self.deck.draw, 1)
             for player in self.players:
                 player.prompts = self.prompts[:]
         # Prompt all the players
@@ -419,49 +790,98 @@ class Snarkback(Game):
         if self.timed:
             # Start the timer if necessary
             delay = (PROMPT_TIMER if self.round < 3 else FINAL_PROMPT_TIMER)
-            self.timer_task = asyncio.create_task(self.timer('Time remaining to respond to prompts', delay, self.end_prompt))
+            self.start_timer('Time remaining to respond to prompts', delay, self.end_prompt)
         for player in self.players:
             player.snarks = []
             player.votes = []
-            await self.next_prompt(player)
+        await self.broadcast([(player.user, self.prompt_message(player)) for player in self.players])
+
+
+
+    def start_timer(self, msg, delay, after):
+        # Start a countdown in the main channel that calls the after() coroutine when it runs out.
+        # The countdown is driven by the CountdownTicker shared by all the Snarkback games.
+        self.starting_time = self.clock.time()
+        self.delay_time = delay
+        countdown = self.countdown = Countdown(msg, delay, after, self.starting_time, None, CountdownTicker.display(delay), False)
+        self.ticker.add(self, countdown)
+        self.schedule(0, self.show_timer, countdown, tag='countdown')
+
+
+    async def show_timer(self, countdown):
+        # Post the countdown message
+        message = (await self.main_channel.send('%s: less than **%d** seconds' % (countdown.text, countdown.shown)))
+        if countdown is self.countdown:
+            countdown.message = message
+        else:
+            await message.delete() # The countdown was stopped in the meantime
 
 
+    async def timer_warning(self, countdown, remaining):
+        # Called by the ticker when the countdown is almost up
+        if countdown is self.countdown:
+            await self.broadcast([(p.user, 'Hurry -- only **%d** seconds remaining!' % remaining) for p in self.waiting()])
 
-    async def timer(self, msg, delay, after):
-        message = (await self.main_channel.send('%s: less than **%d** seconds' % (msg, delay)))
-        loop = asyncio.get_running_loop()
-        self.starting_time = loop.time()
-        remaining = self.delay_time = delay
-        warned = False
+
+    async def timer_expired(self, countdown):
+        # Time is up, use the after() coroutine to move things along
+        if countdown is not self.countdown:
+            return
+        held = (await self.journal_wait())
+        if countdown is not self.countdown:
+            # The countdown was stopped while we were waiting
+            if held:
+                self.journal_release()
+            return
+        record = self.journal_begin('timer', 'expire_countdown', held)
         try:
-            while remaining:
-                # Update the clock every 5 seconds.
-                await asyncio.sleep(5)
-                remaining = max(0, delay - 5 * int(round((loop.time() - self.starting_time) / 5.0)))
-                await message.edit(content = '%s: less than **%d** seconds' % (msg, remaining))
-                if (0 < remaining <= WARNING_TIME) and not warned:
-                    warned = True
-                    for p in self.waiting():
-                        await p.user.send('Hurry -- only **%d** seconds remaining!' % remaining)
-            # Time is up, use the after() coroutine to move things along
-            await message.delete()
+            self.countdown = None
             self.starting_time = self.delay_time = None
-            for p in self.waiting():
-                await p.user.send('Time is up!')
-            if after:
-                await after()
-            return
-        except asyncio.CancelledError:
-            # We're not waiting on anyone else
-            await message.delete()
+            if countdown.message:
+                await countdown.message.delete()
+            await self.broadcast([(p.user, 'Time is up!') for p in self.waiting()])
+            if countdown.after:
+                await countdown.after()
+        finally:
+            self.journal_end(record)
+
+
+    async def expire_countdown(self):
+        # Make the current countdown run out right away (used when replaying a journal)
+        countdown = self.countdown
+        if countdown:
+            self.ticker.remove(self)
+            await self.timer_expired(countdown)
+
+
+    async def stop_timer(self):
+        # Stop the countdown early, since we're not waiting on anyone else
+        countdown = self.countdown
+        if countdown:
+            self.countdown = None
+            self.ticker.remove(self)
             self.starting_time = self.delay_time = None
-            raise
-            
+            if countdown.message:
+                await countdown.message.delete()
+
+
+    def close(self):
+        # Make sure the countdown doesn't keep running after the game is over
+        countdown = getattr(self, 'countdown', None)
+        if countdown:
+            self.countdown = None
+            self.ticker.remove(self)
+            if countdown.message:
+                self.delete_later(countdown.message, 0)
+        Game.close(self)
+
 
 
+    def prompt_message(self, player):
+        return '**Your latest prompt:** %s' % player.prompts[len(player.snarks)]
 
     async def next_prompt(self, player):
-        await player.user.send('**Your latest prompt:** %s' % player.prompts[len(player.snarks)])
+        await player.user.send(self.prompt_message(player))
 
     async def end_prompt(self):
         if not self.snarks:
@@ -508,11 +928,7 @@ class Snarkback(Game):
     async def check_for_snarks(self):
         if all([p.snarks and (len(p.snarks) == len(p.prompts)) for p in self.players]):
             if not self.snarks:
-                if self.timer_task:
-                    # Stop the timer if it's running
-                    if not self.timer_task.done():
-                        self.timer_task.cancel()
-                    self.timer_task = None
+                await self.stop_timer() # Stop the timer if it's running
                 await self.end_prompt()
 
 
@@ -528,8 +944,9 @@ class Snarkback(Game):
             for player in self.players:
                 if prompt in player.prompts:
                     snarks.append((player.snarks[player.prompts.index(prompt)], player))
-            random.shuffle(snarks) # Shuffle the order of the snarks
-            self.snarks.append([prompt] + snarks)
+            self.random.shuffle(snarks) # Shuffle the order of the snarks
+            if (self.round == 3) or (len(snarks) == 2): # Drop head-to-heads where someone has left the game
+                self.snarks.append([prompt] + snarks)
         # Empty out other data structures
         self.prompts = []
         for player in self.players:
@@ -556,8 +973,7 @@ class Snarkback(Game):
         prompt = self.current_snark[0]
         replies = self.current_snark[1:]
         await self.main_channel.send('**Next prompt:**')
-        async with self.main_channel.typing():
-            await asyncio.sleep(5) # Pause for dramatic effect
+        await self.dramatic_pause()
         # Put together the snark embed
         embed = discord.Embed(title=self.name, description=prompt, type='rich', colour=self.colour())
         nonvoting = []
@@ -609,7 +1025,7 @@ where [num] is the integer number of the snark. People who are not part of the g
         if self.timed:
             # Start the timer if necessary
             delay = (VOTING_TIMER if self.round < 3 else FINAL_VOTING_TIMER)
-            self.timer_task = asyncio.create_task(self.timer('Time remaining to vote', delay, self.end_voting))
+            self.start_timer('Time remaining to vote', delay, self.end_voting)
 
 
 
@@ -676,11 +1092,7 @@ where [num] is the integer number of the snark. People who are not part of the g
         if all([len(p.votes) == p.num_votes for p in self.players]):
             # Check if we're finally done
             if self.voting:
-                if self.timer_task:
-                    # Stop the timer if it's running
-                    if not self.timer_task.done():
-                        self.timer_task.cancel()
-                    self.timer_task = None
+                await self.stop_timer() # Stop the timer if it's running
                 await self.end_voting()
 
 
@@ -737,8 +1149,7 @@ where [num] is the integer number of the snark. People who are not part of the g
         results.sort(key = lambda x: x[1])
         await self.main_channel.send('And the results are...')
         for embed, score in results:
-            async with self.main_channel.typing():
-                await asyncio.sleep(3) # Pause for dramatic effect
+            await self.dramatic_pause(3)
             await self.main_channel.send(embed=embed)
         
         
@@ -746,8 +1157,7 @@ where [num] is the integer number of the snark. People who are not part of the g
         
     async def finish_round(self):
         await self.main_channel.send('**Round %d has ended!** The results are...' % self.round)
-        async with self.main_channel.typing():
-            await asyncio.sleep(5) # Pause for dramatic effect
+        await self.dramatic_pause()
         for p in self.players:
             p.score += p.round_score
             p.round_score = 0
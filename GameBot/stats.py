@@ -0,0 +1,218 @@
+# Latency statistics for every command the bot handles
+# Matthew Kroesche
+
+import asyncio
+import bisect
+import os
+import time
+import types
+
+from .game import DATA_DIR
+
+
+
+STATS_FILE = os.path.join(DATA_DIR, 'gamebot.prom') # Where the statistics are written, in Prometheus' text format
+STATS_INTERVAL = 60 # Number of seconds between writing out the statistics
+STATS_TOP = 10 # Number of commands listed by "gb stats"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Upper bounds of the histogram buckets, in seconds
+
+
+
+
+
+
+class Histogram(object):
+
+    # Counts of observations falling into each of the BUCKETS, plus one more bucket for everything
+    # larger. Observing a value is a single bisect, so this is cheap enough to do for every command.
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def mean(self):
+        return (self.sum / self.count if self.count else 0.0)
+
+
+    def quantile(self, q):
+        # Estimate the q-th quantile (0 <= q <= 1) by interpolating within its bucket, the way Prometheus does
+        rank = q * self.count
+        total = 0
+        for i, n in enumerate(self.counts):
+            if n and (total + n >= rank):
+                if i == len(BUCKETS):
+                    return BUCKETS[-1] # All we know is that it's bigger than this
+                lower = (BUCKETS[i - 1] if i else 0.0)
+                return lower + (BUCKETS[i] - lower) * (rank - total) / n
+            total += n
+        return 0.0
+
+
+
+
+
+
+@types.coroutine
+def stepped(coro, busy):
+    # Run a coroutine one step at a time, adding the number of seconds spent inside each step to busy[0].
+    # The rest of the time the coroutine takes is spent waiting: on Discord, on timers, or on other tasks.
+    value = error = None
+    while True:
+        start = time.perf_counter()
+        try:
+            if error is None:
+                future = coro.send(value)
+            else:
+                future = coro.throw(error)
+        except StopIteration as e:
+            return e.value
+        finally:
+            busy[0] += time.perf_counter() - start
+        try:
+            value = yield future
+            error = None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value = None
+            error = e
+
+
+
+
+
+
+class CommandStats(object):
+
+    # Latency histograms for every command, keyed by game prefix and command name. For each command
+    # we keep the total time it took, the part of that spent running Python code, and the part spent
+    # waiting (mostly on Discord). Tasks the command starts and doesn't wait for are not counted.
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.filename = STATS_FILE # Each shard keeps its own file
+        self.commands = {} # Map from (prefix, command name) to [total, python, waiting] Histograms
+        self.started = time.time()
+        self.handle = None # Scheduler Timer for the next write
+        self.write_time = 0.0 # Seconds spent writing the statistics the last time
+
+
+    async def run(self, game, command, message):
+        # Invoke a command, and record how long it took
+        busy = [0.0]
+        start = time.perf_counter()
+        try:
+            await stepped(command(message), busy)
+        finally:
+            self.record(game.prefix, command.__name__.split('_', 1)[1], time.perf_counter() - start, busy[0])
+
+
+    def record(self, prefix, name, total, python):
+        histograms = self.commands.get((prefix, name))
+        if histograms is None:
+            histograms = self.commands[(prefix, name)] = [Histogram(), Histogram(), Histogram()]
+        histograms[0].observe(total)
+        histograms[1].observe(python)
+        histograms[2].observe(max(total - python, 0.0))
+
+
+    def top(self, n=STATS_TOP):
+        # Return the n commands with the slowest 99th percentile, as ((prefix, name), histograms) pairs
+        return sorted(self.commands.items(), key=lambda item: item[1][0].quantile(0.99), reverse=True)[:n]
+
+
+    def summary(self, n=STATS_TOP, guild=None):
+        # Return a table of the slowest commands, for "gb stats" in the given server (None for a DM)
+        text = self.command_summary(n)
+        ticker = getattr(self.bot, 'countdown_ticker', None)
+        if ticker:
+            text += '\nSnarkback countdown message edits in the last minute: %d' % ticker.edits_per_minute()
+        if guild:
+            text += '\nMessages deleted from muted players in this server: %d' % self.deleted_messages().get(guild.id, 0)
+        return text
+
+
+    def deleted_messages(self):
+        # Return a dict mapping server ids to the number of messages deleted from muted players there
+        totals = {}
+        for (guild_id, user_id), n in getattr(self.bot, 'deleted_messages', {}).items():
+            totals[guild_id] = totals.get(guild_id, 0) + n
+        return totals
+
+
+    def command_summary(self, n):
+        if not self.commands:
+            return 'No commands have been run yet.'
+        lines = ['%-16s %7s %9s %9s %9s %9s' % ('command', 'count', 'p50', 'p99', 'python', 'waiting')]
+        for (prefix, name), (total, python, waiting) in self.top(n):
+            lines.append('%-16s %7d %7.1fms %7.1fms %7.1fms %7.1fms' % \
+                         ('%s %s' % (prefix, name), total.count, total.quantile(0.5) * 1000, total.quantile(0.99) * 1000,
+                          python.mean() * 1000, waiting.mean() * 1000))
+        count = sum([histograms[0].count for histograms in self.commands.values()])
+        hours = (time.time() - self.started) / 3600
+        return '**Slowest commands** (%d commands in the last %.1f hours; python and waiting are averages)\n```%s```' % \
+               (count, hours, '\n'.join(lines))
+
+
+    def exposition(self):
+        # Return the statistics in Prometheus' text exposition format
+        lines = []
+        for metric, index, description in (('gamebot_command_seconds', 0, 'Total time taken to handle each command'),
+                                           ('gamebot_command_python_seconds', 1, 'Time spent running Python code while handling each command'),
+                                           ('gamebot_command_waiting_seconds', 2, 'Time spent waiting on Discord and timers while handling each command')):
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s histogram' % metric)
+            for (prefix, name), histograms in sorted(self.commands.items()):
+                histogram = histograms[index]
+                labels = 'game="%s",command="%s"' % (prefix, name)
+                total = 0
+                for bound, n in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    total += n
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, total))
+                lines.append('%s_sum{%s} %.6f' % (metric, labels, histogram.sum))
+                lines.append('%s_count{%s} %d' % (metric, labels, histogram.count))
+        ticker = getattr(self.bot, 'countdown_ticker', None)
+        if ticker:
+            lines.append('# HELP gamebot_countdown_edits_per_minute Snarkback countdown message edits made in the last minute')
+            lines.append('# TYPE gamebot_countdown_edits_per_minute gauge')
+            lines.append('gamebot_countdown_edits_per_minute %d' % ticker.edits_per_minute())
+        deleted = self.deleted_messages()
+        if deleted:
+            lines.append('# HELP gamebot_muted_messages_deleted_total Messages deleted from muted players, by server')
+            lines.append('# TYPE gamebot_muted_messages_deleted_total counter')
+            for guild_id, n in sorted(deleted.items()):
+                lines.append('gamebot_muted_messages_deleted_total{guild="%d"} %d' % (guild_id, n))
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, text):
+        # Atomically replace the statistics file. Safe to call from an executor thread.
+        start = time.perf_counter()
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(self.filename + '.tmp', 'w', encoding='utf-8') as o:
+            o.write(text)
+        os.replace(self.filename + '.tmp', self.filename)
+        self.write_time = time.perf_counter() - start
+
+
+    def start(self):
+        # Start writing out the statistics periodically
+        if self.handle is None:
+            self.handle = self.bot.scheduler.schedule(STATS_INTERVAL, self.tick, tag='stats')
+
+
+    async def tick(self):
+        self.handle = self.bot.scheduler.schedule(STATS_INTERVAL, self.tick, tag='stats')
+        if self.commands:
+            await asyncio.get_event_loop().run_in_executor(None, self.write, self.exposition())
@@ -0,0 +1,128 @@
+# Benchmark for rolling and counting dice in Liar's Dice, and for how long computer players take to decide on a move.
+# Also checks the exact odds used by "ld odds" and computer players against brute force over small hands.
+# Run from the repository root with `python -m benchmarks.dice`
+
+import itertools
+import random
+import timeit
+
+from GameBot import liars_dice
+from GameBot.dice_odds import hand_chance
+
+
+
+TABLES = [(6, 5, 6), (6, 100, 6), (6, 1000, 1000)] # (players, dice each, sides) to test
+ROUNDS = 200 # Number of rounds to roll for each table
+DECISIONS = 50 # Number of decisions to time for each table
+CHECK_SIDES = (4, 6) # Numbers of sides to check the odds with
+CHECK_DICE = 3 # Largest hand to check the odds with
+CHECK_PLAYERS = 3 # Largest number of other players to check the odds with
+CHECK_TOLERANCE = 1e-9 # Largest difference from brute force that counts as exact
+
+
+
+def roll_one_at_a_time(n_dice, n_sides, rng=random.Random()):
+    # How dice used to be rolled: one randint per die, then sorted
+    return [sorted([rng.randint(1, n_sides) for i in range(n)]) for n in n_dice]
+
+
+def count_one_at_a_time(rolls, value):
+    # How a challenge used to be counted
+    return sum([dice.count(value) for dice in rolls]) + sum([dice.count(1) for dice in rolls])
+
+
+
+def run(players, dice, sides):
+    n_dice = [dice] * players
+    old_roll = min(timeit.repeat(lambda: roll_one_at_a_time(n_dice, sides), number=ROUNDS, repeat=3)) / ROUNDS
+    new_roll = min(timeit.repeat(lambda: liars_dice.roll_dice(n_dice, sides), number=ROUNDS, repeat=3)) / ROUNDS
+    rolls = roll_one_at_a_time(n_dice, sides)
+    old_count = min(timeit.repeat(lambda: count_one_at_a_time(rolls, 2), number=ROUNDS, repeat=3)) / ROUNDS
+    totals = [sum(counts) for counts in zip(*liars_dice.roll_dice(n_dice, sides))]
+    new_count = min(timeit.repeat(lambda: totals[1] + totals[0], number=ROUNDS, repeat=3)) / ROUNDS
+    print('%d players x %4d d%-4d  roll: %9.1f us -> %7.1f us   challenge: %8.2f us -> %5.2f us' % \
+          (players, dice, sides, old_roll * 1e6, new_roll * 1e6, old_count * 1e6, new_count * 1e6))
+
+
+
+def time_decisions(players, dice, sides):
+    # Return the slowest time taken by a computer player to open the bidding, and to answer a bid
+    # as big as the number of dice it expects to see. The odds are cached between decisions, so
+    # each decision is timed on a fresh roll.
+    slowest = [0.0, 0.0]
+    rolls = [liars_dice.roll_dice([dice] * players, sides) for i in range(DECISIONS)]
+    for i, counts in enumerate(rolls):
+        others = [(dice, False)] * (players - 1)
+        value = i % sides + 1
+        for j, bid in enumerate([None, (max(players * dice // sides, 1), value)]):
+            situation = liars_dice.Situation(counts[0], others, sides, bool(i % 2), bid, bid is not None, bid is not None, True,
+                                             False, False, None)
+            start = timeit.default_timer()
+            liars_dice.decide(situation, i)
+            slowest[j] = max(slowest[j], timeit.default_timer() - start)
+    print('%d players x %4d d%-4d  slowest computer move: %6.2f ms opening, %6.2f ms answering a bid' % \
+          (players, dice, sides, slowest[0] * 1000, slowest[1] * 1000))
+
+
+
+def brute_force_counts(n_dice, passed, n_sides, ones_wild, value):
+    # Return the distribution of how many of one player's dice count towards a bid on `value`, by
+    # trying every roll. If they passed, only the rolls they could legally have passed with count.
+    wild = (ones_wild and (value != 1))
+    dist = [0.0] * (n_dice + 1)
+    for roll in itertools.product(range(1, n_sides + 1), repeat=n_dice):
+        if passed and ((len(set(roll)) < n_dice) or (ones_wild and (n_dice > 1) and (1 in roll))):
+            continue
+        dist[sum([1 for die in roll if (die == value) or (wild and (die == 1))])] += 1
+    total = sum(dist)
+    return [d / total for d in dist]
+
+
+def brute_force_chance(bid, counts, others, n_sides, ones_wild, exact):
+    # The chance that hand_chance() should give, from the distributions of every other player's hand
+    num, value = bid
+    seen = counts[value - 1] + (counts[0] if (ones_wild and (value != 1)) else 0)
+    dist = [1.0]
+    for n_dice, passed in others:
+        hand = brute_force_counts(n_dice, passed, n_sides, ones_wild, value)
+        new = [0.0] * (len(dist) + len(hand) - 1)
+        for i, d in enumerate(dist):
+            for j, h in enumerate(hand):
+                new[i + j] += d * h
+        dist = new
+    return sum([d for k, d in enumerate(dist) if (seen + k == num) or ((seen + k > num) and not exact)])
+
+
+def check_odds():
+    # Compare hand_chance() with brute force for every bid, with one die in our own hand and
+    # every mix of up to CHECK_PLAYERS other players with up to CHECK_DICE dice, passed or not
+    worst = 0.0
+    checked = 0
+    for n_sides in CHECK_SIDES:
+        kinds = [(n_dice, passed) for n_dice in range(1, CHECK_DICE + 1) for passed in (False, True) if n_dice <= n_sides - 1]
+        for n_players in range(1, CHECK_PLAYERS + 1):
+            for others in itertools.combinations_with_replacement(kinds, n_players):
+                for ones_wild in (False, True):
+                    for own in range(n_sides):
+                        counts = [0] * n_sides
+                        counts[own] = 1
+                        for num in range(1, 2 + sum([n_dice for n_dice, passed in others])):
+                            for value in range(1, n_sides + 1):
+                                for exact in (False, True):
+                                    args = ((num, value), counts, list(others), n_sides, ones_wild, exact)
+                                    error = abs(hand_chance(*args) - brute_force_chance(*args))
+                                    if error > CHECK_TOLERANCE:
+                                        raise AssertionError('hand_chance%r is off by %g' % (args, error))
+                                    worst = max(worst, error)
+                                    checked += 1
+    print('Checked the odds of %d bids against brute force: largest difference %.1e' % (checked, worst))
+
+
+
+if __name__ == '__main__':
+    check_odds()
+    print('Rolling with %s' % ('NumPy' if liars_dice.numpy else 'the random module (NumPy is not installed)'))
+    for table in TABLES:
+        run(*table)
+    for table in TABLES:
+        time_decisions(*table)
@@ -0,0 +1,62 @@
+# Benchmark for the GameBot command dispatch table
+# Run from the repository root with `python -m benchmarks.dispatch`
+
+import discord
+import types
+import timeit
+
+from GameBot.dispatch import DispatchTable
+from GameBot import games
+
+
+
+MESSAGES = 20000 # Number of messages to dispatch for each table size
+SIZES = [5, 50, 500, 5000] # Numbers of live games to test
+
+game_classes = list(games)
+
+
+
+
+
+def make_table(n_games):
+    # Build a dispatch table with `n_games` live games spread over a number of servers
+    bot = types.SimpleNamespace(dispatch=DispatchTable())
+    channels = []
+    for cls in game_classes:
+        bot.dispatch.add(cls(bot))
+    for i in range(n_games):
+        cls = game_classes[i % len(game_classes)]
+        guild = types.SimpleNamespace(id=10**6 + i // 10, members=[])
+        bot.dispatch.add_member(types.SimpleNamespace(id=i, guild=guild))
+        channel = types.SimpleNamespace(id=10**7 + i, guild=guild, type=discord.ChannelType.text)
+        game = cls(bot)
+        bot.dispatch.add(game)
+        game.main_channel = channel
+        bot.dispatch.update(game)
+        channels.append((game.prefix, channel))
+    return bot.dispatch, channels
+
+
+
+def run(n_games, dm=False):
+    table, channels = make_table(n_games)
+    dm_channel = types.SimpleNamespace(id=1, type=discord.ChannelType.private)
+    messages = []
+    for i, (prefix, channel) in enumerate(channels):
+        if i % max(1, len(channels) // 100) == 0:
+            # DMs come from someone who isn't playing, but shares a server with the game
+            messages.append(types.SimpleNamespace(content='%s info' % prefix,
+                                                  channel=(dm_channel if dm else channel),
+                                                  author=types.SimpleNamespace(id=i)))
+    def dispatch():
+        for message in messages:
+            table.resolve(message)
+    seconds = min(timeit.repeat(dispatch, number=max(1, MESSAGES // len(messages)), repeat=5))
+    return seconds * 1e9 / (len(messages) * max(1, MESSAGES // len(messages)))
+
+
+
+if __name__ == '__main__':
+    for n in SIZES:
+        print('%5d live games: %7.0f ns/message, %7.0f ns/DM' % (n, run(n), run(n, dm=True)))
@@ -0,0 +1,19 @@
+# Benchmark for how long it takes to build a new instance of each game, as gb_create does
+# Run from the repository root with `python -m benchmarks.instances`
+
+import timeit
+
+from GameBot import games
+from GameBot.fake import FakeBot
+
+
+
+INSTANCES = 5000 # Number of instances of each game to build
+
+
+
+if __name__ == '__main__':
+    bot = FakeBot(1)
+    for cls in games:
+        elapsed = min(timeit.repeat(lambda: cls(bot), number=INSTANCES, repeat=3))
+        print('%-14s %7.2f us per instance' % (cls.name, elapsed / INSTANCES * 1e6))
@@ -0,0 +1,70 @@
+# Benchmark for replaying game journals
+# Run from the repository root with `python -m benchmarks.journal`
+
+import asyncio
+import json
+import time
+
+from GameBot.fake import FakeBot
+from GameBot.journal import Journal, replay
+from GameBot.liars_dice import LiarsDice
+
+
+
+GAMES = [1, 10, 100] # Numbers of games of Liar's Dice to play and then replay
+PLAYERS = 6 # Number of players in each game
+CHANNEL = 100 # Channel the games are played in
+
+
+
+
+
+async def play(seed):
+    # Play a game of Liar's Dice on a FakeBot, and return the bot and the journal records
+    bot = FakeBot(1, timers=False)
+    bot.journal = Journal(bot)
+    bot.add_game(LiarsDice(bot))
+    send = lambda user, content: bot.deliver(bot.message(user, CHANNEL, content))
+    await send(1, 'ld create')
+    for user in range(2, PLAYERS + 1):
+        await send(user, 'ld join')
+    game = bot.games[0]
+    game.random.seed(seed)
+    await send(1, 'ld start')
+    while game.owner:
+        # Raise the bid until it gets too unlikely, then call the last bidder a liar
+        total = sum([p.n_dice for p in game.players])
+        bid = (game.last_bidder.bid if game.last_bidder else None)
+        if bid and (bid[0] > total // 3):
+            await send(game.current.user.id, 'ld liar')
+        elif bid:
+            await send(game.current.user.id, 'ld bid %d %d' % (bid[0] + (bid[1] == 6), bid[1] % 6 + 1))
+        else:
+            await send(game.current.user.id, 'ld bid 1 2')
+    records = [json.loads(bot.journal.encode(record)) for record in bot.journal.take()]
+    return bot, records
+
+
+
+def transcript(bot):
+    return [(recipient.name, content) for recipient, content in bot.transcript]
+
+
+
+async def run(n_games):
+    # Returns the number of records, the time spent replaying them, and whether every replay matched
+    played = [(await play(seed)) for seed in range(n_games)]
+    start = time.perf_counter()
+    replayed = [(await replay(LiarsDice, None, records)) for bot, records in played]
+    elapsed = time.perf_counter() - start
+    matched = all([transcript(a) == transcript(b) for (a, records), (b, game) in zip(played, replayed)])
+    return sum([len(records) for bot, records in played]), elapsed, matched
+
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    for n in GAMES:
+        records, elapsed, matched = loop.run_until_complete(run(n))
+        print('%4d games: %6d records replayed in %8.1f ms (%7.0f records/s)%s' % \
+              (n, records, elapsed * 1000, records / elapsed, '' if matched else ' -- REPLAY DID NOT MATCH'))
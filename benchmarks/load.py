@@ -0,0 +1,102 @@
+# End-to-end load generator: thousands of guilds playing every game at once on a LocalBot
+# Run from the repository root with `python -m benchmarks.load [options]`
+
+import argparse
+import asyncio
+import random
+import time
+
+from GameBot import games
+from GameBot.local import LocalBot, SimulatedHTTP
+from GameBot.scripted import Table, SCRIPTS
+from GameBot.snarkback import Deck, QuestionBank
+
+
+
+LAG_INTERVAL = 0.1 # Number of seconds between event loop lag samples
+
+
+
+
+
+def percentile(values, p):
+    # Return the p-th percentile of a list of numbers (nearest rank)
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+
+async def measure_lag(samples):
+    # Keep track of how late the event loop is to wake up a sleeping task
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(loop.time() - start - LAG_INTERVAL)
+
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    # Made-up Snarkback questions, so nothing has to be downloaded
+    Deck.bank = QuestionBank(['Question number %d?' % i for i in range(2000)], ['Custom question %d?' % i for i in range(200)], True)
+    Deck.refresh_task = asyncio.get_event_loop().create_future()
+    http = SimulatedHTTP(args.latency, args.jitter, args.bucket_size, args.bucket_period, args.spurious_429, args.seed)
+    bot = LocalBot(games, http, journal=args.journal)
+    bot.clocks.set_scale(args.pause_scale)
+    tables = []
+    game_classes = list(games)
+    for i in range(args.guilds):
+        cls = game_classes[i % len(game_classes)]
+        guild = bot.add_guild('guild%d' % (i + 1), SCRIPTS[cls.prefix].max_players)
+        tables.append(Table(bot, cls, guild, random.Random(rng.random()), args.think))
+    await bot.ready()
+    lag = []
+    monitor = asyncio.ensure_future(measure_lag(lag))
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    cpu = time.process_time()
+    tasks = [asyncio.ensure_future(table.run(start + args.duration)) for table in tables]
+    done, pending = await asyncio.wait(tasks, timeout=args.duration)
+    for task in list(pending) + [monitor]:
+        task.cancel()
+    await asyncio.gather(*(list(pending) + [monitor]), return_exceptions=True)
+    elapsed = loop.time() - start
+    cpu = time.process_time() - cpu
+    errors = [task.exception() for task in done if not task.cancelled() and task.exception()]
+    latencies = sum([table.latencies for table in tables], [])
+    print('%d guilds for %.1f s (%.1f s of CPU)' % (args.guilds, elapsed, cpu))
+    print('  %8d commands handled   (%8.1f/s)' % (len(latencies), len(latencies) / elapsed))
+    print('  %8d messages sent      (%8.1f/s)' % (bot.sent_messages, bot.sent_messages / elapsed))
+    print('  %8d games finished, %d stuck, %d tables crashed' % \
+          (sum([table.finished for table in tables]), sum([table.stuck for table in tables]), len(errors)))
+    print('  command latency:  p50 %8.1f ms, p99 %8.1f ms, max %8.1f ms' % \
+          (percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, max(latencies or [0]) * 1000))
+    print('  event loop lag:   p50 %8.1f ms, p99 %8.1f ms, max %8.1f ms' % \
+          (percentile(lag, 50) * 1000, percentile(lag, 99) * 1000, max(lag or [0]) * 1000))
+    print('  HTTP: %d requests, %d rate limited (%.1f s spent waiting), %d gave up' % \
+          (http.requests, http.rate_limited, http.wait_time, http.failures))
+    print('  slowest commands:')
+    for line in bot.stats.summary(5).split('```')[1].splitlines():
+        print('    %s' % line)
+    for error in errors[:5]:
+        print('  crash: %r' % error)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run scripted games of every kind on an in-process GameBot.')
+    parser.add_argument('--guilds', type=int, default=1000, help='number of guilds, each with one table of players (default 1000)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run for (default 30)')
+    parser.add_argument('--think', type=float, default=1.0, help='average seconds a player thinks before each move (default 1)')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each request to Discord takes (default 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='up to this many extra seconds of latency (default 0.02)')
+    parser.add_argument('--bucket-size', type=int, default=5, help='requests allowed per channel per bucket period, 0 for no limit (default 5)')
+    parser.add_argument('--bucket-period', type=float, default=5.0, help='length of a rate limit bucket in seconds (default 5)')
+    parser.add_argument('--spurious-429', type=float, default=0.0, help='chance of a 429 on any request (default 0)')
+    parser.add_argument('--pause-scale', type=float, default=0.0, help='multiplier for dramatic pauses (default 0, no pauses)')
+    parser.add_argument('--journal', action='store_true', help='journal every game to GAMEBOT_DATA_DIR')
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
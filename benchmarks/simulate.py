@@ -0,0 +1,106 @@
+# Headless simulator: scripted players play complete games of everything, fanned out over a process pool
+# Run from the repository root with `python -m benchmarks.simulate [options]`
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+import traceback
+
+from GameBot import games as game_classes
+from GameBot.clock import VirtualTimeLoop
+from GameBot.local import LocalBot, SimulatedHTTP
+from GameBot.scripted import Table, SCRIPTS
+from GameBot.snarkback import Deck, QuestionBank
+
+
+
+CHUNK = 25 # Number of games each job plays
+
+
+
+async def simulate(prefix, n_games, seed, patience, chaos, pause_scale):
+    # Play `n_games` games of one kind on a fresh LocalBot with no latency or rate limits
+    Deck.bank = QuestionBank(['Question number %d?' % i for i in range(2000)], ['Custom question %d?' % i for i in range(200)], True)
+    Deck.refresh_task = asyncio.get_event_loop().create_future()
+    bot = LocalBot(game_classes, SimulatedHTTP(0, bucket_size=0, seed=seed))
+    bot.clocks.set_scale(pause_scale)
+    cls = next((cls for cls in game_classes if cls.prefix == prefix))
+    guild = bot.add_guild('%s-%d' % (prefix, seed), SCRIPTS[prefix].max_players)
+    await bot.ready()
+    table = Table(bot, cls, guild, random.Random(seed), patience=patience, chaos=chaos)
+    crash = None
+    try:
+        await table.run(games=n_games)
+    except Exception:
+        crash = traceback.format_exc()
+    return table, crash
+
+
+def run_job(job):
+    # Entry point for each worker process. Returns a dictionary of results.
+    # Everything runs on virtual time, so pauses and timers cost nothing.
+    prefix, n_games, seed, patience, chaos, pause_scale = job
+    loop = VirtualTimeLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        start = time.perf_counter()
+        table, crash = loop.run_until_complete(simulate(prefix, n_games, seed, patience, chaos, pause_scale))
+        elapsed = time.perf_counter() - start
+    finally:
+        loop.close()
+    return {'prefix': prefix, 'seed': seed, 'finished': table.finished, 'stuck': table.stuck, 'hangs': table.hangs,
+            'phases': table.phases, 'commands': table.commands, 'moves': len(table.latencies), 'time': elapsed,
+            'virtual_time': loop.time(), 'crash': crash}
+
+
+
+def main(args):
+    prefixes = [cls.prefix for cls in game_classes if (not args.games) or (cls.prefix in args.games)]
+    jobs = []
+    for prefix in prefixes:
+        for i in range(0, args.n, CHUNK):
+            jobs.append((prefix, min(CHUNK, args.n - i), args.seed + len(jobs), args.patience, args.chaos, args.pause_scale))
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.map(run_job, jobs, chunksize=1)
+    elapsed = time.perf_counter() - start
+    total = sum([r['finished'] + r['stuck'] for r in results])
+    print('%d games in %.1f s on %d processes (%.1f games/s), covering %.1f hours of game time' % \
+          (total, elapsed, args.processes, total / elapsed, sum([r['virtual_time'] for r in results]) / 3600))
+    for prefix in prefixes:
+        mine = [r for r in results if r['prefix'] == prefix]
+        cls = next((cls for cls in game_classes if cls.prefix == prefix))
+        phases = set().union(*[r['phases'] for r in mine])
+        commands = set().union(*[r['commands'] for r in mine])
+        known = SCRIPTS[prefix].phases
+        print('%s:' % cls.name)
+        print('  %6d finished, %d stuck, %d crashed; %d moves, %.1f games/s per process' % \
+              (sum([r['finished'] for r in mine]), sum([r['stuck'] for r in mine]), len([r for r in mine if r['crash']]),
+               sum([r['moves'] for r in mine]), sum([r['finished'] + r['stuck'] for r in mine]) / (sum([r['time'] for r in mine]) or 1)))
+        print('  phases reached: %d/%d%s' % (len(phases & set(known)), len(known),
+                                             '' if phases >= set(known) else ' (never: %s)' % ', '.join([p for p in known if p not in phases])))
+        print('  commands called: %s' % ', '.join(sorted(commands)))
+        hangs = sum([r['hangs'] for r in mine], [])
+        for phase, history in hangs[:args.show]:
+            print('  stuck in phase %r after:' % phase)
+            for line in history:
+                print('      %s' % line)
+        for r in [r for r in mine if r['crash']][:args.show]:
+            print('  crash (seed %d):' % r['seed'])
+            print('      ' + r['crash'].strip().replace('\n', '\n      '))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play scripted games of everything as fast as possible, looking for games that get stuck.')
+    parser.add_argument('-n', type=int, default=200, help='number of games of each kind to play (default 200)')
+    parser.add_argument('--games', nargs='*', help='prefixes of the games to play (default all of them)')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='number of worker processes (default one per core)')
+    parser.add_argument('--patience', type=float, default=60.0, help='seconds of game time with nothing to do before a game counts as stuck (default 60)')
+    parser.add_argument('--pause-scale', type=float, default=1.0, help='multiplier for dramatic pauses, in game time (default 1)')
+    parser.add_argument('--chaos', type=float, default=0.02, help='fraction of moves replaced by info/poke/leave (default 0.02)')
+    parser.add_argument('--show', type=int, default=3, help='number of stuck and crashed games to show for each kind (default 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
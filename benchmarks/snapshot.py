@@ -0,0 +1,100 @@
+# Benchmark for snapshots of running games
+# Run from the repository root with `python -m benchmarks.snapshot`
+
+import discord
+import asyncio
+import types
+import timeit
+
+from GameBot.dispatch import DispatchTable
+from GameBot.scheduler import Scheduler
+from GameBot.snapshot import Snapshots
+from GameBot.secret_hitler import SecretHitler
+
+
+
+SIZES = [1, 10, 100, 1000] # Numbers of running 10-player games of Secret Hitler to snapshot
+
+
+
+
+
+class FakeUser(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = 'user%d' % id
+        self.mention = '<@%d>' % id
+
+    async def send(self, content):
+        pass
+
+
+
+class FakeChannel(object):
+
+    type = discord.ChannelType.text
+
+    def __init__(self, id):
+        self.id = id
+        self.guild = types.SimpleNamespace(id=id // 10)
+        self.mention = '<#%d>' % id
+
+    async def send(self, content):
+        pass
+
+    def typing(self):
+        return self
+
+
+
+async def make_bot(n_games):
+    # Build a bot with `n_games` games of Secret Hitler that have just started
+    bot = types.SimpleNamespace(games=[], dispatch=DispatchTable(), scheduler=Scheduler(), muted={}, muted_users={},
+                                user=FakeUser(0))
+    for i in range(n_games):
+        game = SecretHitler(bot)
+        bot.games.append(game)
+        bot.dispatch.add(game)
+        game.owner = game.create_player(FakeUser(10 * i + 1))
+        game.players = []
+        game.add_player(game.owner)
+        game.main_channel = FakeChannel(10**6 + i)
+        bot.dispatch.update(game)
+        game.votekicks = set()
+        message = types.SimpleNamespace(channel=game.main_channel, author=game.owner.user)
+        await game.create(message)
+        for j in range(2, 11):
+            game.add_player(game.create_player(FakeUser(10 * i + j)))
+        game.running = True
+        await game.start(message)
+    bot.snapshots = Snapshots(bot)
+    return bot
+
+
+
+def run(n_games):
+    # Return the time spent encoding a snapshot, the longest the event loop was held up while
+    # doing so, the time spent writing it, and its size
+    loop = asyncio.get_event_loop()
+    bot = loop.run_until_complete(make_bot(n_games))
+    encode = slice = None
+    for i in range(5):
+        games = loop.run_until_complete(bot.snapshots.encode_async())
+        if (encode is None) or (bot.snapshots.encode_time < encode):
+            encode = bot.snapshots.encode_time
+        slice = max(slice or 0.0, bot.snapshots.slice_time) # The worst stall, since that's what players notice
+    def write():
+        bot.snapshots.last_data = None
+        bot.snapshots.write(games)
+    write = min(timeit.repeat(write, number=1, repeat=5))
+    return encode, slice, write, bot.snapshots.size
+
+
+
+if __name__ == '__main__':
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    for n in SIZES:
+        encode, slice, write, size = run(n)
+        print('%5d games: %7.2f ms encoding (longest stall %5.2f ms), %7.2f ms writing off the loop, %7d bytes' % \
+              (n, encode * 1000, slice * 1000, write * 1000, size))
@@ -0,0 +1,47 @@
+# Benchmark for drawing Snarkback questions from very large question banks
+# Run from the repository root with `python -m benchmarks.snarkback_deck`
+
+import sys
+import timeit
+
+from GameBot.snarkback import Deck, QuestionBank
+
+
+
+SIZES = [1000, 10000, 100000] # Numbers of questions in the bank (half normal, half custom)
+RATIOS = [1, 10] # Custom question ratios to test
+DRAWS = 1000 # Number of questions drawn per measurement
+
+
+
+
+
+def make_deck(n, ratio):
+    Deck.bank = QuestionBank(['Normal question %d' % i for i in range(n // 2)],
+                             ['Custom question %d' % i for i in range(n - n // 2)], True)
+    deck = Deck()
+    deck.custom_ratio = ratio
+    deck.shuffle()
+    return deck
+
+
+
+def run(n, ratio):
+    deck = make_deck(n, ratio)
+    def draw():
+        if deck.length < DRAWS:
+            deck.shuffle()
+        deck.draw(DRAWS)
+    seconds = min(timeit.repeat(draw, number=1, repeat=20))
+    shared = sys.getsizeof(Deck.bank.sampler(ratio).tree) # Shared by every server
+    memory = sys.getsizeof(deck.used_questions) # Kept by each server
+    return seconds * 1e6 / DRAWS, memory, shared
+
+
+
+if __name__ == '__main__':
+    for n in SIZES:
+        for ratio in RATIOS:
+            cost, memory, shared = run(n, ratio)
+            print('%6d questions, ratio %2d: %6.2f us/draw, %8d bytes of draw state per server, %8d bytes shared' % \
+                  (n, ratio, cost, memory, shared))
@@ -0,0 +1,59 @@
+# Benchmark for how long the bot takes to start up, and how much memory it uses once it has
+# Run from the repository root with `python -m benchmarks.startup`
+
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+
+
+RUNS = 5 # Number of fresh processes to start for each mode
+
+
+
+def child(mode):
+    # Start a bot, and print the number of seconds it took, the part of that spent on the games
+    # themselves, and the peak resident memory in kB. "eager" imports, builds and sets up every
+    # game up front, the way the bot used to.
+    start = time.perf_counter()
+    from GameBot import games
+    from GameBot.local import LocalBot
+    loop = asyncio.get_event_loop()
+    games_start = time.perf_counter()
+    bot = LocalBot(games)
+    if mode == 'eager':
+        from GameBot.snarkback import Deck
+        Deck.refresh_task = loop.create_future() # Don't download the questions
+        for cls in games:
+            bot.unloaded.pop(cls.prefix)
+            bot.add_game(cls(bot))
+        loop.run_until_complete(asyncio.gather(*[game.setup() for game in bot.games]))
+    end = time.perf_counter()
+    print('%f %f %d' % (end - start, end - games_start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+
+def run(mode):
+    # Return the median of each measurement over RUNS fresh processes
+    results = []
+    for i in range(RUNS):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.startup', '--child', mode])
+        results.append([float(value) for value in output.split()])
+    return [sorted(values)[len(values) // 2] for values in zip(*results)]
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--child', choices=('lazy', 'eager'))
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+    else:
+        for mode in ('eager', 'lazy'):
+            elapsed, games_time, rss = run(mode)
+            print('%5s: %6.1f ms to start (%6.1f ms of it on the games), %6.1f MB resident' % \
+                  (mode, elapsed * 1000, games_time * 1000, rss / 1024))